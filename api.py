@@ -1,22 +1,35 @@
 # api.py
 from __future__ import annotations
 
+import asyncio
 import json
-import queue
 import time
-from typing import Generator, List, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, Body, HTTPException
+from fastapi import FastAPI, Body, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-from rag.pipeline import build_index, ask
-from rag.config import N_RESULTS
+from rag.pipeline import ask_async, ask_many_async, cache_stats
+from rag.jobs import submit_reindex, get_job, list_jobs
+from rag.storage import warmup
+from rag.hybrid import get_bm25_index
+from rag.config import N_RESULTS, USE_HYBRID, STREAM_BUFFER
+from rag.metrics import observe, render_prometheus, trace
 
 # ---------- FastAPI app & middleware ----------
 
-app = FastAPI(title="Context Hub RAG API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Open the Chroma client/collection and caches once, so the first /ask is not slow
+    warmup()
+    if USE_HYBRID:
+        get_bm25_index()  # load the BM25 sidecar into memory once
+    yield
+
+app = FastAPI(title="Context Hub RAG API", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,26 +48,54 @@ class ReindexRequest(BaseModel):
     )
     use_hybrid: Optional[bool] = Field(
         default=None,
-        description="Override hybrid retrieval for this (re)index; True enables BM25 build",
+        description="Override hybrid retrieval for this (re)index; True enables BM25 build "
+                    "(default: keep the active index's BM25 sidecar, or USE_HYBRID)",
+    )
+    full: bool = Field(
+        default=False,
+        description="Ignore the ingest manifest and re-embed every file",
+    )
+    wait: bool = Field(
+        default=False,
+        description="Respond only when the reindex job has finished (status 'done')",
     )
 
 class ReindexResponse(BaseModel):
-    status: str = "ok"
+    status: str = "queued"
+    job_id: Optional[str] = None
 
 class AskRequest(BaseModel):
     question: str = Field(..., description="User query")
     n_results: int = Field(default=N_RESULTS, ge=1, le=50, description="Retrieval depth after de-dup")
     stream: bool = Field(default=False, description="If true, returns Server-Sent Events (SSE)")
+    send_sources: bool = Field(
+        default=True,
+        description="With stream=true, send a 'sources' event right after retrieval, before the first token",
+    )
     use_hybrid: Optional[bool] = Field(
         default=None,
         description="Override hybrid retrieval for answering this request (does not rebuild indexes)",
     )
+    trace: bool = Field(
+        default=False,
+        description="Include a per-stage timing tree (trace) in the response",
+    )
     # NOTE: If you want to let the user point to another data dir at query time,
     # you'd need to reindex; that belongs in /reindex, not here.
 
+class BatchAskRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, description="Questions to answer")
+    n_results: int = Field(default=N_RESULTS, ge=1, le=50, description="Retrieval depth after de-dup")
+    use_hybrid: Optional[bool] = Field(default=None, description="Override hybrid retrieval for this batch")
+    concurrency: Optional[int] = Field(
+        default=None, ge=1, le=64, description="Answers generated at once (default BATCH_CONCURRENCY)"
+    )
+
 class SourceItem(BaseModel):
     source: str
     chunk: Optional[int] = None
+    start: Optional[int] = None  # character span of the chunk in the extracted document text
+    end: Optional[int] = None
 
 class AskResponse(BaseModel):
     question: str
@@ -62,12 +103,31 @@ class AskResponse(BaseModel):
     sources: List[SourceItem]
     elapsed_seconds: float
     streamed: bool
+    ttft_seconds: Optional[float] = None  # streamed only: time to the first token event
+    timings: Dict[str, float] = Field(
+        default_factory=dict, description="Seconds per stage: embed, retrieve (includes embed), generate"
+    )
+    context: Dict[str, int] = Field(
+        default_factory=dict, description="Prompt context tokens (retrieved, sent, saved) of a generated answer"
+    )
+    trace: Optional[Dict[str, Any]] = Field(
+        default=None, description="trace=true only: nested stages with milliseconds"
+    )
+
+class BatchAnswerItem(BaseModel):
+    index: int
+    question: str
+    answer: str
+    sources: List[SourceItem]
+    elapsed_seconds: float
+    error: Optional[str] = None
+    context: Dict[str, int] = Field(default_factory=dict)
 
 # ---------- Utilities ----------
 
 def _parse_sources(sources_str: str) -> List[SourceItem]:
     """
-    Convert 'Sources: path#chunk1, other.pdf#chunk3' into structured items.
+    Convert 'Sources: path#chunk1@0-812, other.pdf#chunk3' into structured items.
     """
     out: List[SourceItem] = []
     if not sources_str:
@@ -79,101 +139,205 @@ def _parse_sources(sources_str: str) -> List[SourceItem]:
     for piece in [p.strip() for p in payload.split(",") if p.strip()]:
         if "#chunk" in piece:
             path, chunk_str = piece.split("#chunk", 1)
+            chunk_str, _, span = chunk_str.partition("@")
+            start, _, end = span.partition("-")
             try:
-                out.append(SourceItem(source=path, chunk=int(chunk_str)))
+                out.append(SourceItem(source=path, chunk=int(chunk_str),
+                                      start=int(start) if span else None, end=int(end) if span else None))
             except ValueError:
                 out.append(SourceItem(source=path, chunk=None))
         else:
             out.append(SourceItem(source=piece, chunk=None))
     return out
 
+def _sse(event: str, data: str) -> bytes:
+    """One SSE frame; multi-line data goes on several data: lines (clients join them with \\n)."""
+    lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+    return f"event: {event}\n{lines}\n".encode("utf-8")
+
 # ---------- Routes ----------
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
-@app.post("/reindex", response_model=ReindexResponse)
-def reindex(body: ReindexRequest = Body(default=ReindexRequest())):
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage timings, counters and histograms in the Prometheus text format (per process)."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache")
+async def cache():
+    """Query cache hit rates and latency saved (per process)."""
+    return cache_stats()
+
+@app.post("/reindex", response_model=ReindexResponse, status_code=202)
+async def reindex(body: ReindexRequest = Body(default=ReindexRequest())):
     """
-    (Re)build the index. If use_hybrid=True, also (re)build the BM25 sidecar.
-    Safe to run repeatedly; Chroma persists to disk.
+    (Re)build the index in a background job. If use_hybrid=True, also (re)build the BM25 sidecar.
+    The job builds into a staging index and switches queries over only when it is complete;
+    poll GET /jobs/{job_id} for progress. wait=true blocks until the job has finished.
     """
     try:
-        build_index(data_dir=body.data_dir, use_hybrid=body.use_hybrid)
-        return ReindexResponse()
-    except Exception as e:
-        # Surface a readable error; avoid leaking stack traces in production
-        raise HTTPException(status_code=500, detail=f"Indexing failed: {e}") from e
+        job = submit_reindex(data_dir=body.data_dir, use_hybrid=body.use_hybrid, full=body.full)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if body.wait:
+        while job.status in ("queued", "running"):
+            await asyncio.sleep(0.2)
+        if job.status == "failed":
+            # Surface a readable error; avoid leaking stack traces in production
+            raise HTTPException(status_code=500, detail=f"Indexing failed: {job.error}")
+    return ReindexResponse(status=job.status, job_id=job.id)
+
+@app.get("/jobs")
+async def jobs():
+    """Recent reindex jobs, oldest first."""
+    return [job.to_dict() for job in list_jobs()]
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status and progress (files, chunks, embeddings per second) of a reindex job."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict()
 
 @app.post("/ask", response_model=AskResponse)
-def ask_route(body: AskRequest):
+async def ask_route(body: AskRequest, request: Request):
     """
     Answer a question using the current index. If stream=true, returns SSE (text/event-stream).
     """
     # Non-streamed JSON response
     if not body.stream:
         t0 = time.perf_counter()
-        # Note: use_hybrid override applies only if your pipeline respects a runtime switch.
-        # Current pipeline uses global USE_HYBRID; to support per-request, you could add a param.
-        answer, sources_str = ask(body.question, n_results=body.n_results, stream_handler=None)
+        timings: Dict[str, float] = {}
+        context: Dict[str, int] = {}
+        with trace("ask") as tr:
+            answer, sources_str = await ask_async(
+                body.question, n_results=body.n_results, use_hybrid=body.use_hybrid, timings=timings,
+                context_stats=context,
+            )
         t1 = time.perf_counter()
+        observe("rag_request_seconds", t1 - t0, route="/ask")
         return AskResponse(
             question=body.question,
             answer=answer,
             sources=_parse_sources(sources_str),
             elapsed_seconds=round(t1 - t0, 3),
             streamed=False,
+            timings=timings,
+            context=context,
+            trace=tr.to_dict() if body.trace else None,
         )
 
-    # Streamed SSE response
-    # We push tokens via a thread-safe queue from the generator's stream_handler.
-    q: "queue.Queue[Optional[str]]" = queue.Queue()
+    # Streamed SSE response.
+    # ask_async runs as a producer task and hands events over through a bounded
+    # queue, so every token is sent as soon as the model emits it. A full queue
+    # (slow client) pauses reading from the model; a client disconnect cancels
+    # the producer, which closes the upstream stream.
+    q: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue(maxsize=STREAM_BUFFER)
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    context: Dict[str, int] = {}
+    tr = trace("ask")
+
+    async def produce():
+        try:
+            with tr:
+                result = await ask_async(
+                    body.question,
+                    n_results=body.n_results,
+                    use_hybrid=body.use_hybrid,
+                    stream_handler=lambda tok: q.put(("token", tok)),
+                    sources_handler=(lambda src: q.put(("sources", src))) if body.send_sources else None,
+                    timings=timings,
+                    context_stats=context,
+                )
+            await q.put(("done", result))
+        except Exception as e:
+            await q.put(("error", str(e)))
+
+    async def watch_disconnect(producer: asyncio.Task):
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        producer.cancel()
+        # Nobody reads the buffered tokens anymore; make room for the stop marker
+        while not q.empty():
+            q.get_nowait()
+        q.put_nowait(("disconnect", None))
 
-    def stream_tokens() -> Generator[bytes, None, None]:
+    async def stream_tokens() -> AsyncIterator[bytes]:
         """
         Server-Sent Events:
-          event: token  -> individual token chunks
-          event: done   -> final payload (JSON with answer, sources, elapsed)
+          event: sources -> JSON list of sources, right after retrieval (send_sources=true)
+          event: token   -> individual token chunks
+          event: done    -> final payload (JSON with answer, sources, elapsed, ttft)
+          event: error   -> {"error": "..."}
         """
-        t0 = time.perf_counter()
+        producer = asyncio.create_task(produce())
+        watcher = asyncio.create_task(watch_disconnect(producer))
+        ttft: Optional[float] = None
         try:
-            # Stream handler called by the generator while producing tokens
-            def _handler(tok: str):
-                q.put(tok)
-
-            # Kick off the generation (blocking) in this same request thread;
-            # tokens will be put into the queue as they arrive.
-            answer, sources_str = ask(
-                body.question,
-                n_results=body.n_results,
-                stream_handler=_handler
-            )
-
-            # Signal end of token stream
-            q.put(None)
-
-            # Drain queue while sending SSE token events
             while True:
-                tok = q.get()
-                if tok is None:
+                kind, payload = await q.get()
+                if kind == "token":
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    yield _sse("token", payload)
+                elif kind == "sources":
+                    items = [item.model_dump() for item in _parse_sources(payload)]
+                    yield _sse("sources", json.dumps(items, ensure_ascii=False))
+                elif kind == "done":
+                    answer, sources_str = payload
+                    done_payload = AskResponse(
+                        question=body.question,
+                        answer=answer,
+                        sources=_parse_sources(sources_str),
+                        elapsed_seconds=round(time.perf_counter() - t0, 3),
+                        streamed=True,
+                        ttft_seconds=round(ttft, 3) if ttft is not None else None,
+                        timings=timings,
+                        context=context,
+                        trace=tr.to_dict() if body.trace else None,
+                    ).model_dump()
+                    observe("rag_request_seconds", time.perf_counter() - t0, route="/ask (stream)")
+                    yield _sse("done", json.dumps(done_payload, ensure_ascii=False))
                     break
-                yield f"event: token\ndata: {tok}\n\n".encode("utf-8")
-
-            # Send final 'done' event with metadata
-            t1 = time.perf_counter()
-            done_payload = AskResponse(
-                question=body.question,
-                answer=answer,
-                sources=_parse_sources(sources_str),
-                elapsed_seconds=round(t1 - t0, 3),
-                streamed=True,
-            ).model_dump()
-            yield f"event: done\ndata: {json.dumps(done_payload, ensure_ascii=False)}\n\n".encode("utf-8")
-
-        except Exception as e:
-            # In SSE, send an error event the client can handle
-            err = {"error": str(e)}
-            yield f"event: error\ndata: {json.dumps(err)}\n\n".encode("utf-8")
+                elif kind == "error":
+                    # In SSE, send an error event the client can handle
+                    yield _sse("error", json.dumps({"error": payload}))
+                    break
+                else:  # client disconnected
+                    break
+        finally:
+            producer.cancel()
+            watcher.cancel()
 
     return StreamingResponse(stream_tokens(), media_type="text/event-stream")
+
+@app.post("/ask/batch")
+async def ask_batch_route(body: BatchAskRequest):
+    """
+    Answer many questions with shared retrieval (one embedding pass, one
+    multi-query vector search, one BM25 pass). Returns NDJSON: one
+    BatchAnswerItem per line, in completion order (use `index` to match).
+    """
+    async def lines() -> AsyncIterator[bytes]:
+        t0 = time.perf_counter()
+        async for res in ask_many_async(
+            body.questions, n_results=body.n_results, use_hybrid=body.use_hybrid, concurrency=body.concurrency
+        ):
+            item = BatchAnswerItem(
+                index=res.index,
+                question=res.question,
+                answer=res.answer,
+                sources=_parse_sources(res.sources),
+                elapsed_seconds=res.elapsed_seconds,
+                error=res.error,
+                context=res.context,
+            )
+            yield (item.model_dump_json() + "\n").encode("utf-8")
+        observe("rag_request_seconds", time.perf_counter() - t0, route="/ask/batch")
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,5 @@
+"""
+Offline benchmarks: a local OpenAI-compatible stand-in server (bench.fake_openai),
+synthetic corpora in every loader format (bench.corpus), the benchmark runner
+(bench.run) and a JSON result comparer (bench.compare). See README "Benchmarks".
+"""
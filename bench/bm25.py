@@ -0,0 +1,184 @@
+"""
+BM25 engine benchmark and parity check (rag.bm25.SparseBm25), no server needed.
+
+- parity:  scores and top-k of SparseBm25 against rank_bm25's BM25Okapi on a
+           golden set (a seeded synthetic corpus and query set, with terms
+           common enough for negative idf and repeated query terms). Any
+           mismatch exits with status 1. Needs rank-bm25 (requirements-dev.txt).
+- latency: top_k percentiles on a synthetic index of --docs documents (1M by
+           default) against dense scoring (scores() over every doc, then
+           argpartition), for short and long Zipf queries.
+
+Documents are --doc-len Zipf-distributed term ids over --vocab terms; the
+index is built straight from arrays, so 1M docs take seconds.
+
+    python -m bench.bm25 --docs 1000000
+    python -m bench.bm25 --suites parity
+"""
+
+from __future__ import annotations
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from rag.bm25 import Postings, SparseBm25
+
+from .run import ROOT, _git_commit, latency_summary
+
+SUITES = ("parity", "latency")
+
+
+def _zipf_ids(rng: np.random.Generator, vocab: int, size: int, s: float) -> np.ndarray:
+    """Term ids drawn from a Zipf(s) distribution truncated to the vocabulary."""
+    p = 1.0 / np.arange(1, vocab + 1) ** s
+    return rng.choice(vocab, size=size, p=p / p.sum()).astype(np.int64)
+
+
+def synthetic_postings(docs: int, vocab: int, doc_len: int, s: float, seed: int) -> Postings:
+    """CSR postings of `docs` random documents (lengths around doc_len), built without tokenizing."""
+    rng = np.random.default_rng(seed)
+    lens = np.maximum(1, rng.poisson(doc_len, docs)).astype(np.int32)
+    doc = np.repeat(np.arange(docs, dtype=np.int64), lens)
+    term = _zipf_ids(rng, vocab, int(lens.sum()), s)
+    pairs, tfs = np.unique(term * docs + doc, return_counts=True)  # sorted by term, then doc
+    terms_of, docs_of = pairs // docs, pairs % docs
+    indptr = np.zeros(vocab + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms_of, minlength=vocab), out=indptr[1:])
+    return Postings([f"w{i}" for i in range(vocab)], indptr, docs_of.astype(np.int32), tfs.astype(np.int32), lens)
+
+
+def synthetic_queries(n: int, vocab: int, lengths: Tuple[int, int], s: float, seed: int) -> List[List[str]]:
+    rng = np.random.default_rng(seed + 1)
+    return [[f"w{t}" for t in _zipf_ids(rng, vocab, int(rng.integers(lengths[0], lengths[1] + 1)), s)]
+            for _ in range(n)]
+
+
+def dense_top_k(engine: SparseBm25, tokens: Sequence[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Reference: score every doc, keep docs matching a query term, best k (ties in doc order)."""
+    scores = engine.scores(tokens)
+    matched = np.zeros(engine.n_docs, dtype=bool)
+    for w in set(tokens):
+        t = engine.vocab.get(w)
+        if t is not None:
+            matched[engine.doc_ids[engine.indptr[t]:engine.indptr[t + 1]]] = True
+    cand = np.flatnonzero(matched)
+    if not len(cand) or k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    k = min(k, len(cand))
+    top = np.argpartition(-scores[cand], k - 1)[:k]
+    top = top[np.lexsort((cand[top], -scores[cand][top]))]
+    return cand[top], scores[cand][top]
+
+
+# --- suites ---
+def bench_parity(docs: int = 3000, vocab: int = 2000, queries: int = 300, k: int = 10, seed: int = 0) -> Dict:
+    try:
+        from rank_bm25 import BM25Okapi
+    except ImportError:
+        raise SystemExit("the parity suite needs rank-bm25: pip install -r requirements-dev.txt")
+    rng = np.random.default_rng(seed)
+    corpus = [[f"w{t}" for t in _zipf_ids(rng, vocab, int(n), 1.05)] for n in np.maximum(1, rng.poisson(40, docs))]
+    golden = synthetic_queries(queries, vocab, (1, 8), 1.05, seed) + [["w0", "w0", "w1"], ["w0"], ["nope"], []]
+    reference = BM25Okapi(corpus)
+    engine = SparseBm25.build(corpus)
+
+    score_mismatches = topk_mismatches = 0
+    worst = 0.0
+    for tokens in golden:
+        expected = np.asarray(reference.get_scores(tokens), dtype=np.float64)
+        got = engine.scores(tokens)
+        worst = max(worst, float(np.max(np.abs(expected - got))) if len(got) else 0.0)
+        score_mismatches += not np.allclose(expected, got, rtol=1e-9, atol=1e-9)
+        # top_k must return a best k of the matching docs by rank_bm25's scores (ties may come in any order)
+        ids, scores = engine.top_k(tokens, k)
+        ref_ids, ref_scores = dense_top_k(engine, tokens, k)
+        ok = len(ids) == len(ref_ids) and np.allclose(scores, ref_scores, rtol=1e-9, atol=1e-9)
+        ok = ok and np.allclose(expected[ids], scores, rtol=1e-9, atol=1e-9)
+        many = engine.top_k_many([tokens, tokens], k)
+        ok = ok and all(np.array_equal(m[0], ids) for m in many)
+        topk_mismatches += not ok
+    return {"docs": docs, "queries": len(golden), "k": k, "score_mismatches": score_mismatches,
+            "topk_mismatches": topk_mismatches, "max_abs_error": worst}
+
+
+def bench_latency(docs: int, vocab: int, doc_len: int, queries: int, k: int, seed: int) -> Dict:
+    t0 = time.perf_counter()
+    engine = SparseBm25.from_postings(synthetic_postings(docs, vocab, doc_len, 1.05, seed))
+    build = time.perf_counter() - t0
+    out: Dict[str, object] = {"docs": docs, "vocab": vocab, "postings": int(len(engine.doc_ids)),
+                              "build_seconds": round(build, 3)}
+    for name, lengths in (("short", (1, 4)), ("long", (5, 12))):
+        qs = synthetic_queries(queries, vocab, lengths, 1.05, seed + len(name))
+        for q in qs[:5]:
+            engine.top_k(q, k)
+        sparse, dense, mismatches = [], [], 0
+        for q in qs:
+            t = time.perf_counter()
+            ids, scores = engine.top_k(q, k)
+            sparse.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            ref_ids, ref_scores = dense_top_k(engine, q, k)
+            dense.append(time.perf_counter() - t)
+            mismatches += not np.allclose(scores, ref_scores, rtol=1e-9, atol=1e-9)
+        out[name] = {"top_k": latency_summary(sparse), "dense": latency_summary(dense), "mismatches": mismatches}
+    return out
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="BM25 engine parity check and latency benchmark")
+    p.add_argument("--suites", default=",".join(SUITES), help="Comma-separated: " + ", ".join(SUITES))
+    p.add_argument("--docs", type=int, default=1_000_000, help="Documents in the latency index")
+    p.add_argument("--vocab", type=int, default=100_000)
+    p.add_argument("--doc-len", type=int, default=60, help="Mean tokens per document")
+    p.add_argument("--queries", type=int, default=300)
+    p.add_argument("--k", type=int, default=20)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default=None, help="Result file (default bench/results/<time>-<commit>-bm25.json)")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        raise SystemExit(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    results: Dict[str, object] = {}
+    if "parity" in suites:
+        print("parity…")
+        results["parity"] = bench_parity(seed=args.seed)
+    if "latency" in suites:
+        print(f"latency ({args.docs} docs)…")
+        results["latency"] = bench_latency(args.docs, args.vocab, args.doc_len, args.queries, args.k, args.seed)
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "args": vars(args),
+        "results": results,
+    }
+    out = args.out
+    if not out:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(ROOT, "bench", "results", f"{stamp}-{(report['git']['commit'] or 'nogit')[:10]}-bm25.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"results: {out}")
+    parity = results.get("parity")
+    if parity and (parity["score_mismatches"] or parity["topk_mismatches"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare two bench.run result files metric by metric.
+
+Every numeric leaf under "results" is listed with its change. Latencies and
+seconds (lower is better) and rates (*_per_s, qps, rps, hit_rate; higher is
+better) moving the wrong way by more than --threshold percent are flagged;
+--fail makes that exit with status 1 (for CI).
+
+    python -m bench.compare bench/results/old.json bench/results/new.json --threshold 10
+"""
+
+from __future__ import annotations
+import argparse
+import json
+from typing import Dict, Optional
+
+_HIGHER = ("_per_s", "qps", "rps", "hit_rate")
+_LOWER = ("_ms", "seconds")
+
+def flatten(node, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves as {"a.b.c": value}; list items are keyed by their "concurrency" (or index)."""
+    out: Dict[str, float] = {}
+    if isinstance(node, dict):
+        for k, v in node.items():
+            out.update(flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    elif isinstance(node, list):
+        for i, v in enumerate(node):
+            key = f"c{v['concurrency']}" if isinstance(v, dict) and "concurrency" in v else str(i)
+            out.update(flatten(v, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        out[prefix] = float(node)
+    return out
+
+def direction(key: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if informational."""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf.endswith(_HIGHER):
+        return 1
+    if leaf.endswith(_LOWER):
+        return -1
+    return 0
+
+def compare(old: Dict, new: Dict, threshold: float) -> int:
+    """Print the comparison; returns the number of regressions."""
+    a, b = flatten(old.get("results", {})), flatten(new.get("results", {}))
+    for label, report in (("old", old), ("new", new)):
+        git = report.get("git", {})
+        print(f"{label}: {(git.get('commit') or '?')[:10]}{' (dirty)' if git.get('dirty') else ''}  "
+              f"{git.get('subject') or ''}  [{report.get('created', '')}]")
+    width = max((len(k) for k in a.keys() | b.keys()), default=10)
+    regressions = 0
+    for key in sorted(a.keys() | b.keys()):
+        x, y = a.get(key), b.get(key)
+        change: Optional[float] = None
+        if x is not None and y is not None and x != 0:
+            change = (y - x) / abs(x) * 100.0
+        flag = ""
+        sign = direction(key)
+        if change is not None and sign and abs(change) > threshold:
+            better = (change > 0) == (sign > 0)
+            flag = "improved" if better else "REGRESSION"
+            regressions += not better
+        fmt = lambda v: "-" if v is None else f"{v:.4g}"
+        pct = "" if change is None else f"{change:+.1f}%"
+        print(f"{key:<{width}}  {fmt(x):>12}  {fmt(y):>12}  {pct:>9}  {flag}")
+    return regressions
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Compare two bench.run result files")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=10.0, help="Percent change that counts (default 10)")
+    p.add_argument("--fail", action="store_true", help="Exit with status 1 on regressions")
+    args = p.parse_args(argv)
+    with open(args.old, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    regressions = compare(old, new, args.threshold)
+    print(f"\n{regressions} regression(s) beyond {args.threshold:g}%")
+    if args.fail and regressions:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Synthetic benchmark corpora in every loader format (.txt .md .html .csv .docx .pdf).
+
+Text is drawn from a Zipf-distributed vocabulary of made-up words, plus a few
+words unique to each file, so both BM25 and (hash) vector search find the
+source a question was taken from. Files are sized for a target number of
+chunks (at ~`chunk_chars` characters per chunk). A corpus.json manifest
+records the parameters and a question set ({"question", "source"}, taken
+from sentences of random files); an existing corpus with the same parameters
+is reused.
+
+    python -m bench.corpus --chunks 10000 --out bench/corpora/c10k
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import docx  # python-docx  # type: ignore
+except Exception:  # pragma: no cover
+    docx = None  # type: ignore
+
+FORMATS = ("txt", "md", "html", "csv", "docx", "pdf")
+MANIFEST = "corpus.json"
+_SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "ta", "vo", "shi", "den", "pra", "gul", "tor", "bey", "xan", "qui", "zel")
+
+def _vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    words = set()
+    while len(words) < size:
+        n = int(rng.integers(2, 5))
+        words.add("".join(_SYLLABLES[i] for i in rng.integers(0, len(_SYLLABLES), n)))
+    return rng.permutation(np.array(sorted(words)))  # Zipf rank must not follow spelling
+
+class _Writer:
+    """Sentences and paragraphs of synthetic text (vectorized word sampling)."""
+    def __init__(self, vocab: np.ndarray, rng: np.random.Generator):
+        self.vocab = vocab
+        self.lengths = np.char.str_len(vocab) + 1
+        self.rng = rng
+
+    def paragraphs(self, n_chars: int, keywords: Sequence[str]) -> List[List[str]]:
+        """Paragraphs (lists of sentences) of about n_chars characters."""
+        rng = self.rng
+        idx = np.minimum(rng.zipf(1.3, max(8, n_chars // 2)), len(self.vocab)) - 1
+        n_words = max(8, int(np.searchsorted(np.cumsum(self.lengths[idx]), n_chars)))
+        idx = idx[:n_words]
+        words = self.vocab[idx].tolist()
+        for pos in rng.integers(0, n_words, max(1, n_words // 40)):  # sprinkle the file's own words
+            words[pos] = keywords[int(pos) % len(keywords)]
+        paras, sents, i = [], [], 0
+        while i < n_words:
+            k = int(rng.integers(6, 21))
+            sent = " ".join(words[i:i + k])
+            sents.append(sent[:1].upper() + sent[1:] + ".")
+            i += k
+            if len(sents) >= int(rng.integers(3, 9)):
+                paras.append(sents)
+                sents = []
+        if sents:
+            paras.append(sents)
+        return paras
+
+def _write_txt(path: str, title: str, paras: List[List[str]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(title + "\n\n" + "\n\n".join(" ".join(p) for p in paras) + "\n")
+
+def _write_md(path: str, title: str, paras: List[List[str]]) -> None:
+    out = [f"# {title}"]
+    for i, p in enumerate(paras):
+        if i % 4 == 3:
+            out.append("\n".join(f"- {s}" for s in p))
+        else:
+            if i % 4 == 0:
+                out.append(f"## Section {i // 4 + 1}")
+            out.append(" ".join(p))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(out) + "\n")
+
+def _write_html(path: str, title: str, paras: List[List[str]]) -> None:
+    body = "\n".join(f"<p>{' '.join(p)}</p>" for p in paras)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<!doctype html>\n<html><head><title>{title}</title><style>p {{margin: 0}}</style></head>\n"
+                f"<body><h1>{title}</h1>\n{body}\n</body></html>\n")
+
+def _write_csv(path: str, title: str, paras: List[List[str]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id,title,body\n")
+        for i, p in enumerate(paras):
+            f.write(f'{i + 1},"{title}","{" ".join(p)}"\n')
+
+def _write_docx(path: str, title: str, paras: List[List[str]]) -> None:
+    d = docx.Document()
+    d.add_heading(title, level=1)
+    for p in paras:
+        d.add_paragraph(" ".join(p))
+    d.save(path)
+
+def _pdf_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _write_pdf(path: str, title: str, paras: List[List[str]], width: int = 95, lines_per_page: int = 60) -> None:
+    """Minimal text PDF (Helvetica, one text object per page); pypdf extracts it line by line."""
+    lines: List[str] = [title, ""]
+    for p in paras:
+        line = ""
+        for word in " ".join(p).split(" "):
+            if line and len(line) + 1 + len(word) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[""]]
+
+    objects: List[bytes] = []
+    n_pages = len(pages)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n_pages))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    for i, page in enumerate(pages):
+        text = "BT /F1 10 Tf 12 TL 50 770 Td\n" + "\n".join(f"({_pdf_escape(l)}) Tj T*" for l in page) + "\nET"
+        stream = text.encode("latin-1", "replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+_WRITERS = {"txt": _write_txt, "md": _write_md, "html": _write_html, "csv": _write_csv, "docx": _write_docx, "pdf": _write_pdf}
+
+def load_manifest(out_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(out_dir, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def generate_corpus(
+    out_dir: str,
+    chunks: int,
+    formats: Sequence[str] = FORMATS,
+    chunks_per_file: int = 20,
+    chunk_chars: int = 650,
+    queries: int = 200,
+    vocab_size: int = 20000,
+    seed: int = 0,
+) -> Dict:
+    """
+    Write a corpus of about `chunks` chunks into out_dir (files spread evenly over
+    `formats`) and return its manifest. An existing corpus with the same
+    parameters is reused. docx is skipped when python-docx is missing.
+    """
+    formats = [f for f in formats if f in _WRITERS]
+    if "docx" in formats and docx is None:
+        print("Warning: python-docx not installed; generating no .docx files")
+        formats.remove("docx")
+    if not formats:
+        raise ValueError(f"No usable formats (expected some of {', '.join(FORMATS)})")
+    params = {"chunks": chunks, "formats": formats, "chunks_per_file": chunks_per_file,
+              "chunk_chars": chunk_chars, "queries": queries, "vocab_size": vocab_size, "seed": seed}
+    existing = load_manifest(out_dir)
+    if existing and existing.get("params") == params:
+        return existing
+
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    writer = _Writer(_vocabulary(vocab_size, rng), rng)
+    n_files = max(1, -(-chunks // max(1, chunks_per_file)))
+    files: List[Dict] = []
+    questions: List[Dict] = []
+    ask_files = set(rng.choice(n_files, size=min(queries, n_files), replace=False).tolist())
+    total_chars = 0
+    for i in range(n_files):
+        fmt = formats[i % len(formats)]
+        rel = os.path.join(fmt, f"{i // 1000:04d}", f"doc{i:07d}.{fmt}")
+        path = os.path.join(out_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        n_chunks = min(chunks_per_file, chunks - i * chunks_per_file)
+        keywords = [f"{w}{i}" for w in writer.vocab[rng.integers(0, vocab_size, 3)].tolist()]
+        paras = writer.paragraphs(n_chunks * chunk_chars, keywords)
+        _WRITERS[fmt](path, f"Document {i} {' '.join(keywords)}", paras)
+        total_chars += sum(len(s) + 1 for p in paras for s in p)
+        files.append({"path": rel, "format": fmt})
+        if i in ask_files:
+            sents = [s for p in paras for s in p]
+            words = sents[int(rng.integers(0, len(sents)))].rstrip(".").split()
+            k = int(rng.integers(4, 9))
+            start = int(rng.integers(0, max(1, len(words) - k + 1)))
+            questions.append({"question": "What does the text say about " + " ".join(words[start:start + k]).lower() + "?",
+                              "source": rel.replace(os.sep, "/")})
+    by_format: Dict[str, int] = {}
+    for f in files:
+        by_format[f["format"]] = by_format.get(f["format"], 0) + 1
+    manifest = {
+        "params": params,
+        "files": len(files),
+        "files_by_format": by_format,
+        "chars": total_chars,
+        "generate_seconds": round(time.perf_counter() - t0, 3),
+        "queries": questions,
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="Generate a synthetic benchmark corpus")
+    p.add_argument("--out", required=True, help="Output directory")
+    p.add_argument("--chunks", type=int, default=1000, help="Approximate number of chunks")
+    p.add_argument("--formats", default=",".join(FORMATS), help="Comma-separated formats")
+    p.add_argument("--chunks-per-file", type=int, default=20)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+    m = generate_corpus(args.out, args.chunks, [f.strip() for f in args.formats.split(",") if f.strip()],
+                        args.chunks_per_file, queries=args.queries, seed=args.seed)
+    print(f"{m['files']} files ({m['files_by_format']}), {m['chars']} chars, {len(m['queries'])} queries "
+          f"in {m['generate_seconds']}s")
+
+if __name__ == "__main__":
+    main()
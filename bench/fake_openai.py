@@ -0,0 +1,331 @@
+"""
+Local OpenAI-compatible stand-in server for benchmarks and offline runs.
+
+Serves POST /v1/embeddings and POST /v1/chat/completions (plain and streamed),
+plus GET /stats (request counters) and POST /stats/reset. Embeddings are
+deterministic: "hash" vectors come from rag's HashingProvider (lexically
+similar texts get similar vectors, so retrieval behaves like a real index),
+"random" vectors are seeded by the text's sha256. Latency, token rate,
+injected 429/5xx errors (429s carry Retry-After) and occasional slow chat
+replies (a share of requests stalls before the first token, to exercise
+request hedging) are configurable. With --rpm/--tpm the server enforces a
+per-model quota like the real API: every reply carries x-ratelimit-* headers
+and requests beyond the quota get a 429 with Retry-After.
+
+    python -m bench.fake_openai --port 8765 --latency 0.2 --tokens-per-second 50 --error-rate 0.01 \
+        --slow-rate 0.05 --slow-latency 3
+
+Point the engine at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 (any OPENAI_API_KEY).
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+ANSWER = (
+    "Based on the provided context, the answer follows from the passages cited above; "
+    "this reply comes from the local benchmark server and is deterministic."
+)
+
+@dataclass
+class FakeSettings:
+    dim: int = 384
+    vectors: str = "hash"            # "hash" or "random"
+    latency: float = 0.0             # seconds before the first chat token (or the whole reply)
+    embed_latency: float = 0.0       # seconds per embeddings request
+    tokens_per_second: float = 0.0   # chat token rate (0 = unlimited)
+    answer_tokens: int = 32          # words per chat answer
+    error_rate: float = 0.0          # share of requests answered with an injected error
+    error_codes: Tuple[int, ...] = (429, 500, 503)
+    retry_after: float = 1.0         # Retry-After seconds sent with injected 429s
+    slow_rate: float = 0.0           # share of chat requests delayed by slow_latency extra seconds
+    slow_latency: float = 0.0
+    rpm: float = 0.0                 # per-model quota, requests per minute (0 = none)
+    tpm: float = 0.0                 # per-model quota, tokens per minute (0 = none)
+    seed: int = 0
+
+class _State:
+    def __init__(self, settings: FakeSettings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.rng = random.Random(settings.seed)
+        self.hasher = None
+        if settings.vectors == "hash":
+            from rag.embed_providers import HashingProvider
+            self.hasher = HashingProvider(settings.dim)
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters: Dict[str, int] = {
+                "embedding_requests": 0, "embedded_inputs": 0,
+                "chat_requests": 0, "chat_streams": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "slow_replies": 0, "throttled": 0, "quota_tokens": 0,
+            }
+            self.errors: Dict[str, int] = {}
+            self.quotas: Dict[str, List[float]] = {}  # model -> [requests left, tokens left, stamp]
+            self.started = time.monotonic()
+
+    def count(self, **deltas: int) -> None:
+        with self.lock:
+            for k, v in deltas.items():
+                self.counters[k] = self.counters.get(k, 0) + v
+
+    def injected_error(self) -> Optional[int]:
+        s = self.settings
+        if s.error_rate <= 0:
+            return None
+        with self.lock:
+            if self.rng.random() >= s.error_rate:
+                return None
+            code = self.rng.choice(s.error_codes)
+            self.errors[str(code)] = self.errors.get(str(code), 0) + 1
+            return code
+
+    def quota(self, model: str, tokens: int) -> Tuple[Dict[str, str], Optional[float]]:
+        """Charge the model's quota: (x-ratelimit headers, None) or (headers, retry-after seconds) if over it."""
+        s = self.settings
+        if s.rpm <= 0 and s.tpm <= 0:
+            return {}, None
+        with self.lock:
+            now = time.monotonic()
+            q = self.quotas.setdefault(model, [s.rpm, s.tpm, now])
+            q[0] = min(s.rpm, q[0] + (now - q[2]) * s.rpm / 60.0)
+            q[1] = min(s.tpm, q[1] + (now - q[2]) * s.tpm / 60.0)
+            q[2] = now
+            wait = 0.0
+            if s.rpm > 0 and q[0] < 1:
+                wait = (1 - q[0]) * 60.0 / s.rpm
+            if s.tpm > 0 and q[1] < tokens:
+                wait = max(wait, (min(tokens, s.tpm) - q[1]) * 60.0 / s.tpm)
+            if not wait:
+                q[0] -= 1
+                q[1] -= tokens
+                self.counters["quota_tokens"] += tokens
+            else:
+                self.counters["throttled"] += 1
+            headers = {}
+            for kind, limit, left in (("requests", s.rpm, q[0]), ("tokens", s.tpm, q[1])):
+                if limit > 0:
+                    headers[f"x-ratelimit-limit-{kind}"] = f"{limit:g}"
+                    headers[f"x-ratelimit-remaining-{kind}"] = str(max(0, int(left)))
+                    headers[f"x-ratelimit-reset-{kind}"] = f"{max(0.0, limit - left) * 60.0 / limit:.3f}s"
+            return headers, (wait or None)
+
+    def stall(self) -> float:
+        """Extra seconds before this chat reply (slow_latency for a slow_rate share, else 0)."""
+        s = self.settings
+        if s.slow_rate <= 0:
+            return 0.0
+        with self.lock:
+            if self.rng.random() >= s.slow_rate:
+                return 0.0
+            self.counters["slow_replies"] += 1
+            return s.slow_latency
+
+    def vectors(self, texts: List[str]) -> List[List[float]]:
+        if self.hasher is not None:
+            return self.hasher.embed(texts)
+        out = []
+        for t in texts:
+            seed = int.from_bytes(hashlib.sha256(t.encode("utf-8")).digest()[:8], "little")
+            v = np.random.default_rng(seed).standard_normal(self.settings.dim)
+            out.append((v / np.linalg.norm(v)).tolist())
+        return out
+
+    def stats(self) -> Dict:
+        with self.lock:
+            minutes = (time.monotonic() - self.started) / 60.0
+            return {**self.counters, "errors": dict(self.errors),
+                    "quota_tokens_per_min": round(self.counters["quota_tokens"] / minutes, 1) if minutes else 0.0}
+
+def _approx_tokens(text: str) -> int:
+    return max(1, (len(text) + 3) // 4)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    state: _State
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _json(self, code: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code: int, headers: Optional[Dict[str, str]] = None, retry_after: Optional[float] = None) -> None:
+        kind = "rate_limit_exceeded" if code == 429 else "server_error"
+        headers = dict(headers or {})
+        if code == 429:
+            headers["retry-after"] = f"{retry_after if retry_after is not None else self.state.settings.retry_after:.3g}"
+        message = "quota exceeded" if retry_after is not None else f"injected {code}"
+        self._json(code, {"error": {"message": message, "type": kind, "code": kind}}, headers)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") in ("/stats", "/v1/stats"):
+            self._json(200, self.state.stats())
+        elif self.path.rstrip("/") in ("", "/health"):
+            self._json(200, {"status": "ok"})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        n = int(self.headers.get("content-length") or 0)
+        body = json.loads(self.rfile.read(n) or b"{}")
+        if self.path.rstrip("/") == "/stats/reset":
+            self.state.reset()
+            return self._json(200, {"status": "ok"})
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if self.path.endswith("/chat/completions"):
+            return self._chat(body)
+        self._json(404, {"error": {"message": "not found"}})
+
+    def _embeddings(self, body: Dict) -> None:
+        s = self.state.settings
+        if s.embed_latency:
+            time.sleep(s.embed_latency)
+        code = self.state.injected_error()
+        if code:
+            return self._error(code)
+        texts = body.get("input") or []
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        tokens = sum(_approx_tokens(t) for t in texts)
+        headers, wait = self.state.quota(body.get("model", "fake"), tokens)
+        if wait:
+            return self._error(429, headers, wait)
+        self.state.count(embedding_requests=1, embedded_inputs=len(texts))
+        self._json(200, {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(self.state.vectors(texts))],
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }, headers)
+
+    def _chat(self, body: Dict) -> None:
+        s = self.state.settings
+        code = self.state.injected_error()
+        if code:
+            return self._error(code)
+        prompt = sum(_approx_tokens(str(m.get("content") or "")) for m in body.get("messages") or [])
+        words = (ANSWER.split() * (s.answer_tokens // len(ANSWER.split()) + 1))[: max(1, s.answer_tokens)]
+        headers, wait = self.state.quota(body.get("model", "fake"), prompt + len(words))
+        if wait:
+            return self._error(429, headers, wait)
+        self.state.count(chat_requests=1, chat_streams=int(bool(body.get("stream"))),
+                         prompt_tokens=prompt, completion_tokens=len(words))
+        delay = 1.0 / s.tokens_per_second if s.tokens_per_second > 0 else 0.0
+        wait = s.latency + self.state.stall()
+        if wait:
+            time.sleep(wait)
+        model = body.get("model", "fake")
+        if not body.get("stream"):
+            if delay:
+                time.sleep(delay * len(words))
+            return self._json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt, "completion_tokens": len(words), "total_tokens": prompt + len(words)},
+            }, headers)
+
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+
+        def frame(data: str) -> None:
+            raw = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(raw), raw))
+            self.wfile.flush()
+
+        try:
+            for i, word in enumerate(words):
+                if i and delay:
+                    time.sleep(delay)
+                frame(json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": (" " if i else "") + word}, "finish_reason": None}],
+                }))
+            frame("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:  # client went away mid-stream
+            self.close_connection = True
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 2048
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, settings: Optional[FakeSettings] = None):
+        handler = type("Handler", (_Handler,), {"state": _State(settings or FakeSettings())})
+        super().__init__((host, port), handler)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        """Serve from a daemon thread (in-process use); see also main()."""
+        threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True).start()
+        return self
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--dim", type=int, default=384, help="Embedding size")
+    p.add_argument("--vectors", choices=("hash", "random"), default="hash")
+    p.add_argument("--latency", type=float, default=0.0, help="Seconds before the first chat token")
+    p.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per embeddings request")
+    p.add_argument("--tokens-per-second", type=float, default=0.0, help="Chat token rate (0 = unlimited)")
+    p.add_argument("--answer-tokens", type=int, default=32, help="Words per chat answer")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failed on purpose")
+    p.add_argument("--error-codes", default="429,500,503", help="Comma-separated status codes to inject")
+    p.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on injected 429s")
+    p.add_argument("--slow-rate", type=float, default=0.0, help="Share of chat replies delayed by --slow-latency")
+    p.add_argument("--slow-latency", type=float, default=0.0, help="Extra seconds before a slow reply's first token")
+    p.add_argument("--rpm", type=float, default=0.0, help="Per-model quota in requests/min (0 = none)")
+    p.add_argument("--tpm", type=float, default=0.0, help="Per-model quota in tokens/min (0 = none)")
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args(argv)
+
+def settings_from_args(args: argparse.Namespace) -> FakeSettings:
+    return FakeSettings(
+        dim=args.dim, vectors=args.vectors, latency=args.latency, embed_latency=args.embed_latency,
+        tokens_per_second=args.tokens_per_second, answer_tokens=args.answer_tokens,
+        error_rate=args.error_rate, error_codes=tuple(int(c) for c in args.error_codes.split(",") if c.strip()),
+        retry_after=args.retry_after, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        rpm=args.rpm, tpm=args.tpm, seed=args.seed,
+    )
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    server = FakeOpenAIServer(args.host, args.port, settings_from_args(args))
+    print(f"fake OpenAI server on {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Benchmark runner: everything offline, against bench.fake_openai.
+
+Suites (--suites, default all):
+- ingest:      full build of a synthetic corpus (bench.corpus): files/s, chunks/s, embeddings/s
+- query:       retrieve() latency percentiles, vector-only and hybrid, and hit rate
+               (the question's source file among the results)
+- ttft:        streamed POST /ask against api.py under uvicorn: time to first token and to done
+- concurrency: non-streamed POST /ask at increasing client concurrency: requests/s and latency
+
+The fake server and the API run as subprocesses; ingest and query run in
+this process. Query caches are off and every question is embedded through the
+provider, so each query pays its full cost. Results (with the commit, machine
+and effective rag.config settings) are written as JSON for bench.compare.
+
+    python -m bench.run --chunks 10000 --latency 0.3 --tokens-per-second 60
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+
+from .corpus import FORMATS, generate_corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITES = ("ingest", "query", "ttft", "concurrency")
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_http(url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} not up after {timeout:.0f}s")
+
+def _stop(proc: Optional[subprocess.Popen]) -> None:
+    if proc and proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """count, mean and p50/p90/p99/max in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ms = np.asarray(seconds, dtype=np.float64) * 1000.0
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"count": int(ms.size), "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p90_ms": round(float(p90), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3)}
+
+def _git_commit() -> Dict[str, object]:
+    def git(*args) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None, "subject": git("log", "-1", "--format=%s") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def _config_snapshot() -> Dict[str, object]:
+    from rag import config
+    return {k: v for k, v in sorted(vars(config).items())
+            if k.isupper() and k != "OPENAI_API_KEY" and isinstance(v, (str, int, float, bool, type(None)))}
+
+# --- suites ---
+def bench_ingest(corpus_dir: str) -> Dict:
+    from rag.pipeline import build_index
+    last = {}
+    t0 = time.perf_counter()
+    build_index(corpus_dir, use_hybrid=True, full=True, progress=lambda p: last.update(p=p))
+    seconds = time.perf_counter() - t0
+    p = last.get("p")
+    files, chunks = (p.files_done, p.chunks) if p else (0, 0)
+    return {"seconds": round(seconds, 3), "files": files, "chunks": chunks,
+            "files_failed": p.files_failed if p else 0, "embedded": p.embedded if p else 0,
+            "files_per_s": round(files / seconds, 2), "chunks_per_s": round(chunks / seconds, 2),
+            "embeddings_per_s": round((p.embedded if p else 0) / seconds, 2)}
+
+def bench_query(questions: List[Dict], n_results: int, warmup: int = 5) -> Dict:
+    from rag.pipeline import retrieve
+    out = {}
+    for mode, hybrid in (("vector", False), ("hybrid", True)):
+        for q in questions[:warmup]:
+            retrieve(q["question"], n_results, use_hybrid=hybrid)
+        seconds, hits = [], 0
+        t0 = time.perf_counter()
+        for q in questions:
+            t = time.perf_counter()
+            _, metas = retrieve(q["question"], n_results, use_hybrid=hybrid)
+            seconds.append(time.perf_counter() - t)
+            hits += any(str(m.get("source", "")).replace("\\", "/") == q["source"] for m in metas)
+        wall = time.perf_counter() - t0
+        out[mode] = {**latency_summary(seconds), "qps": round(len(questions) / wall, 2),
+                     "hit_rate": round(hits / max(1, len(questions)), 4)}
+    return out
+
+def bench_ttft(api_url: str, questions: List[Dict], n: int) -> Dict:
+    ttft, total, saved, sent = [], [], [], []
+    errors = 0
+    with httpx.Client(timeout=120.0) as client:
+        for q in (questions * (n // max(1, len(questions)) + 1))[:n]:
+            t0 = time.perf_counter()
+            first = None
+            event = ""
+            try:
+                with client.stream("POST", f"{api_url}/ask", json={"question": q["question"], "stream": True}) as r:
+                    for line in r.iter_lines():
+                        if line.startswith("event: "):
+                            event = line[7:]
+                        elif line.startswith("data: ") and event == "token" and first is None:
+                            first = time.perf_counter() - t0
+                        elif line.startswith("data: ") and event == "done":
+                            done = json.loads(line[6:])
+                            sent.append(done.get("context", {}).get("context_tokens", 0))
+                            saved.append(done.get("context", {}).get("saved_tokens", 0))
+                        elif line.startswith("data: ") and event == "error":
+                            errors += 1
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            total.append(time.perf_counter() - t0)
+            if first is not None:
+                ttft.append(first)
+    return {"ttft": latency_summary(ttft), "total": latency_summary(total), "errors": errors,
+            "context_tokens_mean": round(float(np.mean(sent)), 1) if sent else 0.0,
+            "saved_tokens_mean": round(float(np.mean(saved)), 1) if saved else 0.0}
+
+async def _load_level(api_url: str, questions: List[Dict], concurrency: int, requests: int) -> Dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    seconds: List[float] = []
+    errors = 0
+    queue = [questions[i % len(questions)]["question"] for i in range(requests)]
+
+    async with httpx.AsyncClient(timeout=300.0, limits=limits) as client:
+        async def worker() -> None:
+            nonlocal errors
+            while queue:
+                question = queue.pop()
+                t = time.perf_counter()
+                try:
+                    r = await client.post(f"{api_url}/ask", json={"question": question})
+                    ok = r.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    seconds.append(time.perf_counter() - t)
+                else:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    return {"concurrency": concurrency, "requests": requests, "errors": errors,
+            "rps": round(len(seconds) / wall, 2), **latency_summary(seconds)}
+
+def bench_concurrency(api_url: str, questions: List[Dict], levels: Sequence[int], requests: int) -> List[Dict]:
+    return [asyncio.run(_load_level(api_url, questions, c, max(requests, c))) for c in levels]
+
+# --- driver ---
+def _parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Offline RAG benchmarks (local OpenAI stand-in server)")
+    p.add_argument("--suites", default=",".join(SUITES), help="Comma-separated: " + ", ".join(SUITES))
+    p.add_argument("--chunks", type=int, default=1000, help="Corpus size in chunks (1k .. 1M)")
+    p.add_argument("--formats", default=",".join(FORMATS), help="Corpus file formats")
+    p.add_argument("--corpus", default=None, help="Corpus directory (default bench/corpora/c<chunks>-s<seed>)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--queries", type=int, default=200, help="Questions for the query suite")
+    p.add_argument("--n-results", type=int, default=6)
+    p.add_argument("--ttft-requests", type=int, default=50)
+    p.add_argument("--concurrency", default="1,4,16,64", help="Client concurrency levels")
+    p.add_argument("--requests", type=int, default=128, help="Requests per concurrency level")
+    p.add_argument("--work", default=None, help="Index directory (default: a temporary one, removed afterwards)")
+    p.add_argument("--out", default=None, help="Result file (default bench/results/<time>-<commit>.json)")
+    # fake server
+    p.add_argument("--dim", type=int, default=384, help="Fake embedding size")
+    p.add_argument("--latency", type=float, default=0.0, help="Fake chat seconds before the first token")
+    p.add_argument("--embed-latency", type=float, default=0.0, help="Fake seconds per embeddings request")
+    p.add_argument("--tokens-per-second", type=float, default=0.0, help="Fake chat token rate (0 = unlimited)")
+    p.add_argument("--answer-tokens", type=int, default=32)
+    p.add_argument("--error-rate", type=float, default=0.0, help="Share of fake requests failed with 429/5xx")
+    p.add_argument("--error-codes", default="429,500,503")
+    p.add_argument("--slow-rate", type=float, default=0.0, help="Share of fake chat replies delayed by --slow-latency")
+    p.add_argument("--slow-latency", type=float, default=0.0, help="Extra seconds before a slow fake reply")
+    p.add_argument("--rpm", type=float, default=0.0, help="Fake per-model quota, requests/min (0 = none)")
+    p.add_argument("--tpm", type=float, default=0.0, help="Fake per-model quota, tokens/min (0 = none)")
+    return p.parse_args(argv)
+
+def _environment(args: argparse.Namespace, base_url: str, work: str, corpus_dir: str) -> Dict[str, str]:
+    return {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": base_url,
+        "PERSIST_DIR": os.path.join(work, "store"),
+        "DATA_DIR": corpus_dir,
+        "N_RESULTS": str(args.n_results),
+        "LOCAL_EMBED_DIM": str(args.dim),
+        # measure uncached work: no result/answer caches, every question embedded
+        "RESULT_CACHE": "false", "ANSWER_CACHE": "false", "SEMANTIC_CACHE": "false",
+        "EMBED_CACHE": "false", "QUERY_EMBED_CACHE_SIZE": "0",
+    }
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        raise SystemExit(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    corpus_dir = os.path.abspath(args.corpus or os.path.join(ROOT, "bench", "corpora", f"c{args.chunks}-s{args.seed}"))
+    manifest = generate_corpus(corpus_dir, args.chunks, [f.strip() for f in args.formats.split(",") if f.strip()],
+                               queries=args.queries, seed=args.seed)
+    print(f"corpus: {corpus_dir} ({manifest['files']} files)")
+    questions = manifest["queries"]
+    work = os.path.abspath(args.work) if args.work else tempfile.mkdtemp(prefix="rag-bench-")
+
+    fake_port = _free_port()
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_openai", "--port", str(fake_port), "--dim", str(args.dim),
+         "--latency", str(args.latency), "--embed-latency", str(args.embed_latency),
+         "--tokens-per-second", str(args.tokens_per_second), "--answer-tokens", str(args.answer_tokens),
+         "--error-rate", str(args.error_rate), "--error-codes", args.error_codes,
+         "--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency),
+         "--rpm", str(args.rpm), "--tpm", str(args.tpm), "--seed", str(args.seed)],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    api = None
+    results: Dict[str, object] = {}
+    try:
+        _wait_http(f"http://127.0.0.1:{fake_port}/health", fake)
+        env = _environment(args, f"http://127.0.0.1:{fake_port}/v1", work, corpus_dir)
+        os.environ.update(env)  # before rag is imported: rag.config reads the environment once
+        config = _config_snapshot()
+
+        if "ingest" in suites or not os.path.isdir(env["PERSIST_DIR"]):
+            print("ingest…")
+            results["ingest"] = bench_ingest(corpus_dir)
+        if "query" in suites:
+            print("query…")
+            results["query"] = bench_query(questions, args.n_results)
+        if "ttft" in suites or "concurrency" in suites:
+            api_port = _free_port()
+            api = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "api:app", "--port", str(api_port), "--log-level", "warning"],
+                cwd=ROOT, env={**os.environ, **env},
+            )
+            api_url = f"http://127.0.0.1:{api_port}"
+            _wait_http(f"{api_url}/health", api)
+            if "ttft" in suites:
+                print("ttft…")
+                results["ttft"] = bench_ttft(api_url, questions, args.ttft_requests)
+            if "concurrency" in suites:
+                print("concurrency…")
+                levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+                results["concurrency"] = bench_concurrency(api_url, questions, levels, args.requests)
+        results["fake_server"] = httpx.get(f"http://127.0.0.1:{fake_port}/stats", timeout=5).json()
+    finally:
+        _stop(api)
+        _stop(fake)
+        if not args.work:
+            shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "args": vars(args),
+        "corpus": {k: v for k, v in manifest.items() if k != "queries"},
+        "config": config,
+        "results": results,
+    }
+    out = args.out
+    if not out:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(ROOT, "bench", "results", f"{stamp}-{(report['git']['commit'] or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"results: {out}")
+
+if __name__ == "__main__":
+    main()
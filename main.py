@@ -2,7 +2,9 @@ import argparse, json, os, sys, time
 from typing import Optional
 
 from rag.pipeline import build_index, ask
-from rag.config import STREAM_ANSWERS
+from rag.storage import get_collection
+from rag.config import STREAM_ANSWERS, METRICS
+from rag.metrics import format_trace, stage_summary, trace
 
 ANSI = {
     "bold": "\033[1m",
@@ -25,6 +27,7 @@ def parse_args() -> argparse.Namespace:
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
     p.add_argument("--reindex", action="store_true", help="(Re)build/append the index from data dir")
+    p.add_argument("--full", action="store_true", help="Ignore the ingest manifest and re-embed every file")
     p.add_argument("--question", type=str, help="Ask a question against the index")
     p.add_argument("--n_results", type=int, default=6, help="Retrieval depth (top-k after de-dup)")
     p.add_argument("--data_dir", type=str, default=None, help="Override DATA_DIR for this run")
@@ -34,6 +37,10 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--stream", action="store_true", help="Stream tokens as they arrive")
     p.add_argument("--json", action="store_true", help="Emit machine-readable JSON (answer, sources)")
     p.add_argument("--no-color", action="store_true", help="Disable ANSI colors")
+    p.add_argument("--store-stats", action="store_true",
+                   help="Print vector store size, bytes per chunk and (quantized) recall@10 as JSON")
+    p.add_argument("--profile", action="store_true",
+                   help="Print a per-stage time breakdown (the question's trace, totals per stage)")
     return p.parse_args()
 
 def print_header(title: str, use_color: bool):
@@ -57,8 +64,19 @@ def main():
             print(c(f"• data_dir: {args.data_dir}", "dim", use_color=use_color))
         if hybrid_override is not None:
             print(c(f"• hybrid: {hybrid_override}", "dim", use_color=use_color))
+        # Progress after committed batches, at most every 2s
+        last_report = [0.0]
+        def _progress(p):
+            now = time.perf_counter()
+            if now - last_report[0] >= 2.0:
+                last_report[0] = now
+                print(c(
+                    f"• files {p.files_done}/{p.files_total}  chunks {p.chunks}  ({p.chunks_per_s:.0f} chunks/s)",
+                    "dim", use_color=use_color,
+                ))
+
         t0 = time.perf_counter()
-        build_index(data_dir=args.data_dir, use_hybrid=hybrid_override)
+        build_index(data_dir=args.data_dir, use_hybrid=hybrid_override, full=args.full, progress=_progress)
         t1 = time.perf_counter()
         print(c(f"Done in {t1 - t0:.2f}s", "green", use_color=use_color))
 
@@ -75,11 +93,14 @@ def main():
             sys.stdout.flush()
 
         t0 = time.perf_counter()
-        answer, sources = ask(
-            args.question,
-            n_results=args.n_results,
-            stream_handler=_printer if use_stream else None
-        )
+        context = {}
+        with trace("ask") as tr:
+            answer, sources = ask(
+                args.question,
+                n_results=args.n_results,
+                stream_handler=_printer if use_stream else None,
+                context_stats=context,
+            )
         if use_stream:
             print()  # newline after final token
         t1 = time.perf_counter()
@@ -91,13 +112,18 @@ def main():
                 items = sources.split(":", 1)[1].strip()
                 if items and items.lower() != "(none)":
                     for part in [p.strip() for p in items.split(",") if p.strip()]:
-                        # expected "path#chunkN"
+                        # expected "path#chunkN" or "path#chunkN@start-end"
                         if "#chunk" in part:
                             path, chunk_str = part.split("#chunk", 1)
+                            chunk_str, _, span = chunk_str.partition("@")
                             try:
-                                src_list.append({"source": path, "chunk": int(chunk_str)})
+                                item = {"source": path, "chunk": int(chunk_str)}
                             except ValueError:
-                                src_list.append({"source": path, "chunk": chunk_str})
+                                item = {"source": path, "chunk": chunk_str}
+                            if span:
+                                start, _, end = span.partition("-")
+                                item["start"], item["end"] = int(start), int(end)
+                            src_list.append(item)
                         else:
                             src_list.append({"source": part})
             payload = {
@@ -106,14 +132,37 @@ def main():
                 "sources": src_list,
                 "elapsed_seconds": round(t1 - t0, 3),
                 "streamed": bool(use_stream),
+                "context": context,
             }
+            if args.profile:
+                payload["trace"] = tr.to_dict()
             print(json.dumps(payload, ensure_ascii=False, indent=2))
         else:
             print(c("\nAnswer:", "bold", use_color=use_color), answer)
             print(c("Sources:", "bold", use_color=use_color), sources.split(":", 1)[1].strip() if ":" in sources else sources)
             print(c(f"\n⏱  {t1 - t0:.2f}s  (streamed={use_stream})", "yellow", use_color=use_color))
+            if context:
+                print(c(f"• context: {context['context_tokens']} tokens ({context['saved_tokens']} saved)",
+                        "dim", use_color=use_color))
+            if args.profile:
+                print_header("Trace", use_color)
+                print("\n".join(format_trace(tr.to_dict())))
+
+    if args.profile and not args.json:
+        print_header("Stages (totals)", use_color)
+        summary = stage_summary()
+        if not summary:
+            print(c("• nothing recorded (METRICS=false?)" if not METRICS else "• nothing recorded",
+                    "dim", use_color=use_color))
+        for stage, s in summary.items():
+            mean_ms = s["seconds"] / s["calls"] * 1000 if s["calls"] else 0.0
+            print(f"{stage:<20} {s['calls']:>8} calls  {s['seconds']:>10.3f} s  {mean_ms:>10.2f} ms/call")
+
+    if args.store_stats:
+        print_header("Vector store", use_color)
+        print(json.dumps(get_collection().stats(), indent=2))
 
-    if not args.reindex and not args.question:
+    if not args.reindex and not args.question and not args.store_stats:
         # Nothing to do; guide the user
         print(
             "Nothing to do. Try:\n"
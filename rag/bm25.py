@@ -0,0 +1,369 @@
+"""
+BM25 engine: analyzer, CSR postings and a sparse scorer.
+
+BM25 is an inverted index in CSR form (per-term postings of doc ids and
+term frequencies) scored only over the postings of the query terms, with
+MaxScore pruning for exact top-k. Scoring follows BM25Okapi (rank_bm25)
+exactly, including its epsilon floor for negative idf.
+
+Postings from several segments can be merged (minus deleted docs) into one
+index, so corpus statistics are always global. Persistence lives in
+rag.hybrid.
+"""
+
+from __future__ import annotations
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import BM25_TOKEN_PATTERN, BM25_STOPWORDS, BM25_STEM
+
+# Query postings per indexed doc above which MaxScore checks (an O(N) pass per
+# term) cost more than pruning saves: such queries are plain dense accumulation.
+# Crossover measured with bench.bm25 at 1M docs.
+DENSE_COVERAGE = 2.0
+
+# --- analyzer ---
+ENGLISH_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or our
+she so that the their them then there these they this to was we were what when where which who will with
+you your
+""".split())
+
+@lru_cache(maxsize=200_000)
+def _light_stem(token: str) -> str:
+    """Harman S-stemmer plus -ing/-ed stripping: cheap, conservative English stemming."""
+    if len(token) > 4 and token.endswith("ies") and not token.endswith(("eies", "aies")):
+        token = token[:-3] + "y"
+    elif len(token) > 3 and token.endswith("es") and not token.endswith(("aes", "ees", "oes")):
+        token = token[:-1]
+    elif len(token) > 3 and token.endswith("s") and not token.endswith(("us", "ss")):
+        token = token[:-1]
+    if len(token) > 5 and token.endswith("ing"):
+        token = token[:-3]
+    elif len(token) > 4 and token.endswith("ed"):
+        token = token[:-2]
+    return token
+
+@dataclass(frozen=True)
+class Analyzer:
+    """Regex tokenizer + lowercasing + optional stopwords and light stemming."""
+    pattern: str = r"\w+"
+    stopwords: FrozenSet[str] = frozenset()
+    stem: bool = False
+
+    def __post_init__(self):
+        object.__setattr__(self, "_regex", re.compile(self.pattern))
+
+    def __call__(self, text: str) -> List[str]:
+        tokens = self._regex.findall(text.lower())
+        if self.stopwords:
+            tokens = [t for t in tokens if t not in self.stopwords]
+        if self.stem:
+            tokens = [_light_stem(t) for t in tokens]
+        return tokens
+
+    def to_config(self) -> Dict:
+        return {"pattern": self.pattern, "stopwords": sorted(self.stopwords), "stem": self.stem}
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> "Analyzer":
+        return cls(pattern=cfg["pattern"], stopwords=frozenset(cfg["stopwords"]), stem=cfg["stem"])
+
+def default_analyzer() -> Analyzer:
+    if BM25_STOPWORDS.lower() in ("", "none", "false"):
+        stop = frozenset()
+    elif BM25_STOPWORDS.lower() == "english":
+        stop = ENGLISH_STOPWORDS
+    else:
+        stop = frozenset(w.strip().lower() for w in BM25_STOPWORDS.split(",") if w.strip())
+    return Analyzer(pattern=BM25_TOKEN_PATTERN, stopwords=stop, stem=BM25_STEM)
+
+# --- postings ---
+@dataclass
+class Postings:
+    """
+    Raw CSR inverted index: postings of terms[t] are doc_ids[indptr[t]:indptr[t+1]]
+    (ascending) with matching tfs. No scoring state; this is what a segment stores.
+    """
+    terms: List[str]
+    indptr: np.ndarray
+    doc_ids: np.ndarray
+    tfs: np.ndarray
+    doc_len: np.ndarray
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_len)
+
+    @classmethod
+    def from_tokenized(cls, tokenized: Iterable[Sequence[str]]) -> "Postings":
+        vocab: Dict[str, int] = {}
+        term_parts, tf_parts, lens = [], [], []
+        for tokens in tokenized:
+            lens.append(len(tokens))
+            counts = Counter(tokens)
+            term_parts.append(np.fromiter((vocab.setdefault(w, len(vocab)) for w in counts), dtype=np.int64, count=len(counts)))
+            tf_parts.append(np.fromiter(counts.values(), dtype=np.int32, count=len(counts)))
+        doc_len = np.asarray(lens, dtype=np.int32)
+        docs = np.repeat(np.arange(len(lens), dtype=np.int32), [len(p) for p in term_parts])
+        terms = np.concatenate(term_parts) if term_parts else np.zeros(0, dtype=np.int64)
+        tfs = np.concatenate(tf_parts) if tf_parts else np.zeros(0, dtype=np.int32)
+        # Stable sort by term keeps doc ids ascending within each postings list
+        order = np.argsort(terms, kind="stable")
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=indptr[1:])
+        return cls(list(vocab), indptr, docs[order], tfs[order].astype(np.int32), doc_len)
+
+
+def merge_postings(parts: Sequence[Tuple[Postings, Optional[np.ndarray]]]) -> Tuple[Postings, List[np.ndarray]]:
+    """
+    Concatenate segments into one index, dropping docs whose `alive` mask is
+    False (None = all alive). Docs are renumbered in segment order; terms left
+    without postings are dropped, so statistics equal a rebuild of the live docs.
+    O(total postings), no sort: every (segment, term) block is copied to its
+    final offset. Returns the merged postings and, per part, old -> new doc id
+    (-1 for dropped docs).
+    """
+    vocab: Dict[str, int] = {}
+    gmaps = [np.fromiter((vocab.setdefault(w, len(vocab)) for w in p.terms), dtype=np.int64, count=len(p.terms))
+             for p, _ in parts]
+    n_terms = len(vocab)
+
+    remaps, lens, kept = [], [], []
+    counts = np.zeros(n_terms, dtype=np.int64)
+    offset = 0
+    for (p, alive), gmap in zip(parts, gmaps):
+        if alive is None:
+            alive = np.ones(p.n_docs, dtype=bool)
+        remap = np.cumsum(alive, dtype=np.int64) - 1 + offset
+        remap[~alive] = -1
+        offset += int(alive.sum())
+        remaps.append(remap)
+        lens.append(p.doc_len[alive])
+        local_term = np.repeat(np.arange(len(p.terms)), np.diff(p.indptr))
+        keep = remap[p.doc_ids] >= 0 if len(p.doc_ids) else np.zeros(0, dtype=bool)
+        local_counts = np.bincount(local_term[keep], minlength=len(p.terms))
+        counts[gmap] += local_counts
+        kept.append((keep, local_counts))
+
+    indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    doc_ids = np.empty(int(indptr[-1]), dtype=np.int32)
+    tfs = np.empty(int(indptr[-1]), dtype=np.int32)
+    cursor = indptr[:-1].copy()
+    for (p, _), gmap, remap, (keep, local_counts) in zip(parts, gmaps, remaps, kept):
+        # Within a segment each term's postings are one contiguous block; parts are
+        # visited in doc order, so doc ids stay ascending within every merged list.
+        starts = np.cumsum(local_counts) - local_counts
+        pos = np.arange(int(local_counts.sum())) - np.repeat(starts, local_counts)
+        dest = np.repeat(cursor[gmap], local_counts) + pos
+        doc_ids[dest] = remap[p.doc_ids[keep]]
+        tfs[dest] = p.tfs[keep]
+        cursor[gmap] += local_counts
+
+    terms = list(vocab)
+    if (counts == 0).any():
+        live = counts > 0
+        terms = [w for w, ok in zip(terms, live) if ok]
+        indptr = np.concatenate([[0], np.cumsum(counts[live])]).astype(np.int64)
+    doc_len = np.concatenate(lens) if lens else np.zeros(0, dtype=np.int32)
+    return Postings(terms, indptr, doc_ids, tfs, doc_len.astype(np.int32)), remaps
+
+# --- sparse engine ---
+class SparseBm25:
+    """
+    Inverted index in CSR layout: postings of term t are
+    doc_ids[indptr[t]:indptr[t+1]] (ascending) with matching tfs.
+    Statistics (N, avgdl, df, idf) are derived from the arrays, so the same
+    structure serves merged segments.
+    """
+
+    def __init__(self, vocab: Dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_len: np.ndarray, k1: float = 1.5, b: float = 0.75,
+                 epsilon: float = 0.25):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        self._finalize()
+
+    def _finalize(self) -> None:
+        n = len(self.doc_len)
+        self.n_docs = n
+        self.avgdl = float(self.doc_len.sum()) / n if n else 0.0
+        df = np.diff(self.indptr).astype(np.float64)
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            eps = self.epsilon * float(idf.mean())
+            idf[idf < 0] = eps
+        self.idf = idf
+        # Per-doc length normalisation k1 * (1 - b + b * dl / avgdl)
+        avgdl = self.avgdl or 1.0
+        self.norm = self.k1 * (1.0 - self.b + self.b * self.doc_len.astype(np.float64) / avgdl)
+        self.max_score = self._term_bounds()
+
+    def _term_bounds(self, block: int = 1 << 20) -> np.ndarray:
+        """Exact max contribution of each term (MaxScore upper bounds), in blocks of ~`block` postings."""
+        n_terms = len(self.idf)
+        out = np.zeros(n_terms)
+        t0 = 0
+        while t0 < n_terms:
+            t1 = int(np.searchsorted(self.indptr, self.indptr[t0] + block, side="right")) - 1
+            t1 = min(max(t1, t0 + 1), n_terms)
+            lo, hi = self.indptr[t0], self.indptr[t1]
+            if hi > lo:
+                tf = self.tfs[lo:hi].astype(np.float64)
+                contrib = tf * (self.k1 + 1) / (tf + self.norm[self.doc_ids[lo:hi]])
+                starts = self.indptr[t0:t1] - lo
+                nonempty = self.indptr[t0 + 1:t1 + 1] > self.indptr[t0:t1]
+                out[t0:t1][nonempty] = np.maximum.reduceat(contrib, starts[nonempty])
+            t0 = t1
+        return out * self.idf
+
+    @classmethod
+    def build(cls, tokenized: Iterable[Sequence[str]], **params) -> "SparseBm25":
+        return cls.from_postings(Postings.from_tokenized(tokenized), **params)
+
+    @classmethod
+    def from_postings(cls, p: "Postings", **params) -> "SparseBm25":
+        return cls({w: i for i, w in enumerate(p.terms)}, p.indptr, p.doc_ids, p.tfs, p.doc_len, **params)
+
+    def _contrib(self, t: int, lo: int, hi: int) -> np.ndarray:
+        tf = self.tfs[lo:hi].astype(np.float64)
+        return self.idf[t] * (tf * (self.k1 + 1) / (tf + self.norm[self.doc_ids[lo:hi]]))
+
+    def scores(self, tokens: Sequence[str]) -> np.ndarray:
+        """Dense score vector over all docs (same values as BM25Okapi.get_scores)."""
+        out = np.zeros(self.n_docs)
+        for w, qtf in Counter(tokens).items():
+            t = self.vocab.get(w)
+            if t is None:
+                continue
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            out[self.doc_ids[lo:hi]] += qtf * self._contrib(t, lo, hi)
+        return out
+
+    def top_k(self, tokens: Sequence[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k (doc indices, scores) of one query; see _top_k."""
+        return self._top_k(tokens, k, None)
+
+    def top_k_many(self, queries: Sequence[Sequence[str]], k: int,
+                   max_shared: int = 1 << 25) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        top_k for a batch of queries in one pass: the contribution array of each
+        distinct query term is computed once and shared by every query using it
+        (evaluation sets repeat terms heavily). Results match top_k exactly;
+        the memo is dropped whenever it holds more than max_shared values.
+        """
+        shared: Dict[int, np.ndarray] = {}
+        out = []
+        for tokens in queries:
+            out.append(self._top_k(tokens, k, shared))
+            if sum(len(c) for c in shared.values()) > max_shared:
+                shared.clear()
+        return out
+
+    def _top_k(self, tokens: Sequence[str], k: int,
+               shared: Optional[Dict[int, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k (doc indices, scores) over docs matching at least one term.
+        Term-at-a-time MaxScore: terms are visited by decreasing upper bound and
+        fully accumulated until the remaining terms' bounds can no longer lift an
+        unseen doc above the current k-th score. From then on only surviving
+        candidates are updated, by binary search into the remaining postings.
+        Accumulation is dense (O(N) scratch) when the query's postings are large,
+        sparse (merge of sorted postings) when they are small; beyond
+        DENSE_COVERAGE postings per doc, all terms are accumulated without pruning.
+        `shared` memoizes full per-term contribution arrays across calls.
+        """
+        def contrib(t: int) -> np.ndarray:
+            if shared is None:
+                return self._contrib(t, self.indptr[t], self.indptr[t + 1])
+            c = shared.get(t)
+            if c is None:
+                c = shared[t] = self._contrib(t, self.indptr[t], self.indptr[t + 1])
+            return c
+
+        terms = []
+        for w, qtf in Counter(tokens).items():
+            t = self.vocab.get(w)
+            if t is not None and self.indptr[t + 1] > self.indptr[t]:
+                terms.append((qtf * self.max_score[t], t, qtf))
+        if not terms or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        terms.sort(reverse=True)
+        prune = all(ub > 0 for ub, _, _ in terms)  # bounds are only valid with non-negative contributions
+        rest = np.cumsum([ub for ub, _, _ in terms][::-1])[::-1]  # rest[i] = sum of bounds of terms i..
+        total = sum(int(self.indptr[t + 1] - self.indptr[t]) for _, t, _ in terms)
+        dense = total * 32 > self.n_docs
+        prune = prune and total < DENSE_COVERAGE * self.n_docs
+
+        # Phase 1: full accumulation
+        acc = np.zeros(self.n_docs) if dense else None
+        seen = np.zeros(self.n_docs, dtype=bool) if dense else None
+        cand = np.zeros(0, dtype=np.int32)
+        score = np.zeros(0)
+        theta = -np.inf
+        i = 0
+        while i < len(terms):
+            if prune and i > 0:
+                if dense:
+                    cand = np.flatnonzero(seen)
+                    score = acc[cand]
+                if len(score) >= k:
+                    theta = np.partition(score, len(score) - k)[len(score) - k]
+                    if rest[i] < theta:
+                        break
+            _, t, qtf = terms[i]
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            if dense:
+                docs = self.doc_ids[lo:hi]
+                acc[docs] += qtf * contrib(t)  # doc ids are unique within a postings list
+                seen[docs] = True
+            else:
+                docs = np.concatenate([cand, self.doc_ids[lo:hi]])
+                vals = np.concatenate([score, qtf * contrib(t)])
+                cand, inv = np.unique(docs, return_inverse=True)
+                score = np.bincount(inv, weights=vals, minlength=len(cand))
+            i += 1
+        if dense:
+            cand = np.flatnonzero(seen)
+            score = acc[cand]
+
+        # Phase 2: remaining terms only update candidates that can still make the top-k
+        for j in range(i, len(terms)):
+            keep = score + rest[j] >= theta
+            cand, score = cand[keep], score[keep]
+            _, t, qtf = terms[j]
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            postings = self.doc_ids[lo:hi]
+            if dense and len(cand) * 16 > len(postings):
+                # Many survivors: one scatter over the postings beats a binary search per candidate
+                acc[postings] += qtf * contrib(t)
+                score = acc[cand]
+            else:
+                pos = np.minimum(np.searchsorted(postings, cand), len(postings) - 1)
+                hit = postings[pos] == cand
+                if hit.any():
+                    if shared is not None and t in shared:
+                        delta = qtf * shared[t][pos[hit]]
+                    else:
+                        tf = self.tfs[lo + pos[hit]].astype(np.float64)
+                        delta = qtf * self.idf[t] * (tf * (self.k1 + 1) / (tf + self.norm[cand[hit]]))
+                    score[hit] += delta
+                    if dense:
+                        acc[cand[hit]] += delta
+            if len(score) >= k:
+                theta = max(theta, np.partition(score, len(score) - k)[len(score) - k])
+
+        k = min(k, len(score))
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.lexsort((cand[top], -score[top]))]  # score desc, then doc order
+        return cand[top].astype(np.int64), score[top]
@@ -0,0 +1,170 @@
+"""
+Small TTL caches for the query path.
+
+- TTLCache:     in-process LRU with per-entry expiry (thread-safe)
+- SqliteCache:  the same semantics in a SQLite file, shared by processes
+- LayeredCache: memory first, then SQLite (hits are promoted), with stats
+
+Values stored in a LayeredCache carry the seconds it took to compute them,
+so every hit also records the latency it saved. Values must be
+JSON-serializable when a SQLite layer is used.
+"""
+
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteCache:
+    """TTL cache in one table of a SQLite file; safe to share between processes."""
+
+    def __init__(self, path: str, table: str, maxsize: int, ttl: float):
+        self.path = path
+        self.table = table
+        self.maxsize = maxsize
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_lru ON {table} (last_used)")
+        self._db.commit()
+        self._writes = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value FROM {self.table} WHERE key=? AND expires>?", (key, now)
+            ).fetchone()
+            if row is None:
+                return default
+            self._db.execute(f"UPDATE {self.table} SET last_used=? WHERE key=?", (now, key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + (self.ttl if ttl is None else ttl), now),
+            )
+            self._writes += 1
+            if self._writes % 64 == 0:
+                self._prune(now)
+            self._db.commit()
+
+    def _prune(self, now: float) -> None:
+        self._db.execute(f"DELETE FROM {self.table} WHERE expires<=?", (now,))
+        self._db.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f" SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table}")
+            self._db.commit()
+
+
+class LayeredCache:
+    def __init__(self, name: str, maxsize: int, ttl: float, db_path: Optional[str] = None):
+        self.name = name
+        self.memory = TTLCache(maxsize, ttl)
+        self.shared = SqliteCache(db_path, f"cache_{name}", maxsize * 10, ttl) if db_path else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key: str) -> Any:
+        """Cached value or None."""
+        item = self.memory.get(key, _MISSING)
+        shared = False
+        if item is _MISSING and self.shared is not None:
+            item = self.shared.get(key, _MISSING)
+            if item is not _MISSING:
+                shared = True
+                self.memory.set(key, item)
+        with self._lock:
+            if item is _MISSING:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += shared
+            self.saved_seconds += item[1]
+        return item[0]
+
+    def set(self, key: str, value: Any, cost: float = 0.0) -> None:
+        """Store value; cost is the seconds it took to compute (counted as saved on every hit)."""
+        item = [value, cost]
+        self.memory.set(key, item)
+        if self.shared is not None:
+            self.shared.set(key, item)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.memory),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -1,29 +1,189 @@
-from typing import List, Dict
+"""
+Span-based chunking.
+
+The text is scanned once for sentence ends and paragraph breaks; chunks are
+(start, end) character spans over the original text, packed from whole
+sentences, so text is only sliced out when a chunk is materialized.
+Overlap is whole trailing sentences of the previous chunk (at most
+`chunk_overlap`). Sentences longer than a chunk are cut at whitespace.
+
+Modes (CHUNK_MODE):
+- sentence:  chunks of at most CHUNK_SIZE characters
+- paragraph: like sentence, but a chunk ends at the last paragraph break
+             that still leaves it at least half full
+- token:     chunks of at most CHUNK_TOKENS tokens (tiktoken cl100k_base if
+             installed, else ~4 characters per token), overlap CHUNK_OVERLAP_TOKENS
+
+Chunk metadata carries the span ("start", "end") so citations can point at
+exact offsets in the extracted text.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
 import re
 
-def split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
-    """Sentence-aware chunking with overlap; overlap must be < chunk_size."""
-    if not text:
+from .config import CHUNK_MODE, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from .metrics import inc, span
+
+# Optional exact token counts; import guarded so chunking works without it
+try:
+    import tiktoken  # type: ignore
+except Exception:  # pragma: no cover
+    tiktoken = None  # type: ignore
+
+CHUNK_MODES = ("sentence", "paragraph", "token")
+
+# A sentence ends at . ! ? (plus closing quotes/brackets) followed by whitespace;
+# a blank line ends a paragraph (and the sentence in it). One leading character
+# class keeps the regex scan fast; matches of a single line break are skipped.
+_BOUNDARY = re.compile(r"[.!?\n][.!?]*[\"'”’)\]]*\s+")
+_SPACE = re.compile(r"\s")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if tiktoken is None:
+        return max(1, (len(text) + 3) // 4)
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _sentences(text: str) -> List[Tuple[int, int, bool]]:
+    """(start, end, ends_paragraph) of each sentence, whitespace trimmed."""
+    out: List[Tuple[int, int, bool]] = []
+    start = len(text) - len(text.lstrip())
+    for m in _BOUNDARY.finditer(text, start):
+        sep = m.group()
+        para = sep.count("\n") >= 2
+        if sep[0] == "\n" and not para:
+            continue
+        end = m.start() + len(sep.rstrip())
+        if end > start:
+            out.append((start, end, para))
+        elif out and para:
+            out[-1] = (out[-1][0], out[-1][1], True)
+        start = m.end()
+    end = len(text.rstrip())
+    if end > start:
+        out.append((start, end, True))
+    return out
+
+
+def _cut(text: str, start: int, end: int, max_chars: int) -> List[Tuple[int, int, bool]]:
+    """Split an oversized sentence at whitespace into pieces of at most max_chars."""
+    pieces = []
+    while end - start > max_chars:
+        limit = start + max_chars
+        ws = [m.start() for m in _SPACE.finditer(text, start + 1, limit + 1)]
+        cut = ws[-1] if ws else limit
+        pieces.append((start, cut, False))
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if end > start:
+        pieces.append((start, end, False))
+    return pieces
+
+
+def chunk_spans(
+    text: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    mode: str = "sentence",
+    counter: Optional[Callable[[str], int]] = None,
+) -> List[Tuple[int, int]]:
+    """
+    (start, end) spans of the chunks of text. chunk_size/chunk_overlap are
+    characters, or tokens in token mode (counted with `counter`, default
+    count_tokens). Overlap must be < chunk_size.
+    """
+    if mode not in CHUNK_MODES:
+        raise ValueError(f"Unknown chunk mode {mode!r} (expected one of {', '.join(CHUNK_MODES)})")
+    if not text or chunk_size <= 0:
         return []
-    chunk_overlap = max(0, min(chunk_overlap, max(0, chunk_size - 1)))
-    sents = re.split(r'(?<=[.!?])\s+', text.strip())
-    chunks, curr = [], ""
-    for s in sents:
-        if curr and len(curr) + len(s) + 1 > chunk_size:
-            chunks.append(curr)
-            curr = (curr[-chunk_overlap:] if chunk_overlap else "")
-        curr = (curr + " " + s).strip() if curr else s
-    if curr:
-        chunks.append(curr)
-    return chunks
-
-def make_chunk_records(doc_id: str, text: str, chunk_size: int, chunk_overlap: int) -> List[Dict]:
-    chunks = split_text(text, chunk_size, chunk_overlap)
+    chunk_overlap = max(0, min(chunk_overlap, chunk_size - 1))
+    tokens = mode == "token"
+    counter = counter or count_tokens
+
+    units: List[Tuple[int, int, bool]] = []
+    prefix = [0]  # token mode: running token count before each unit
+    for s, e, para in _sentences(text):
+        n = counter(text[s:e]) if tokens else e - s
+        if n <= chunk_size:
+            pieces = [(s, e, para)]
+        else:  # in token mode, cut at the sentence's own characters-per-token ratio
+            pieces = _cut(text, s, e, max(1, (e - s) * chunk_size // n))
+            pieces[-1] = (pieces[-1][0], pieces[-1][1], para)
+        units.extend(pieces)
+        if tokens:
+            for ps, pe, _ in pieces:
+                prefix.append(prefix[-1] + (n if len(pieces) == 1 else counter(text[ps:pe])))
+    if not units:
+        return []
+
+    # Pack greedily by bisection over monotone arrays: in character mode a chunk
+    # units[i:j] spans ends[j-1] - starts[i]; in token mode it holds prefix[j] - prefix[i]
+    starts = [u[0] for u in units]
+    ends = [u[1] for u in units]
+    spans: List[Tuple[int, int]] = []
+    i, n = 0, len(units)
+    while i < n:
+        if tokens:
+            j = bisect_right(prefix, prefix[i] + chunk_size) - 1
+        else:
+            j = bisect_right(ends, starts[i] + chunk_size)
+        j = min(max(j, i + 1), n)
+        if mode == "paragraph" and j < n:
+            floor = (prefix[i] + chunk_size // 2) if tokens else (starts[i] + chunk_size // 2)
+            for p in range(j, i, -1):
+                if (prefix[p] if tokens else ends[p - 1]) < floor:
+                    break
+                if units[p - 1][2]:
+                    j = p
+                    break
+        spans.append((starts[i], ends[j - 1]))
+        if j >= n:
+            break
+        # Next chunk starts at the earliest sentence such that units[k:j] fits in the overlap
+        if tokens:
+            k = bisect_left(prefix, prefix[j] - chunk_overlap)
+        else:
+            k = bisect_left(starts, ends[j - 1] - chunk_overlap)
+        i = max(k, i + 1)
+    return spans
+
+
+def _settings(chunk_size: Optional[int], chunk_overlap: Optional[int], mode: Optional[str]) -> Tuple[int, int, str]:
+    mode = mode or CHUNK_MODE
+    if mode == "token":
+        return chunk_size or CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS if chunk_overlap is None else chunk_overlap, mode
+    return chunk_size or CHUNK_SIZE, CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap, mode
+
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int, mode: Optional[str] = None) -> List[str]:
+    """Chunk texts (see chunk_spans); overlap must be < chunk_size."""
+    return [text[s:e] for s, e in chunk_spans(text, *_settings(chunk_size, chunk_overlap, mode))]
+
+
+def make_chunk_records(
+    doc_id: str,
+    text: str,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    mode: Optional[str] = None,
+) -> List[Dict]:
+    """Chunk records of a document; sizes and mode default to the CHUNK_* settings."""
+    with span("chunk"):
+        spans = chunk_spans(text, *_settings(chunk_size, chunk_overlap, mode))
+    inc("rag_chunks_total", len(spans))
     return [
         {
             "id": f"{doc_id}_chunk{i+1}",
-            "text": chunk,
-            "meta": {"source": doc_id, "chunk": i + 1}
+            "text": text[s:e],
+            "meta": {"source": doc_id, "chunk": i + 1, "start": s, "end": e}
         }
-        for i, chunk in enumerate(chunks)
+        for i, (s, e) in enumerate(spans)
     ]
@@ -0,0 +1,92 @@
+"""
+OpenAI clients, created lazily on first use.
+
+Sync clients are process-wide. An AsyncOpenAI client's connection pool is
+bound to the loop it first ran on, so a single module-level client breaks as
+soon as a second loop (e.g. a later asyncio.run()) uses it; async clients
+are created per running loop and dropped with it.
+
+All clients of a process (or of a loop) share one keep-alive HTTP connection
+pool sized by HTTP_POOL_SIZE, so embedding and chat calls reuse warm
+connections instead of each client variant opening its own. The SDK's own
+retries are off (max_retries=0): rag.ratelimit retries transient errors
+under the shared rate limiter.
+
+Creating the first client checks OPENAI_API_KEY, so modules that may never
+call OpenAI (e.g. with a local embedding provider) import without it.
+"""
+
+from __future__ import annotations
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+# The HTTP library of the installed SDK (httpx2 in recent releases, httpx before)
+try:
+    import httpx2 as httpx  # type: ignore
+except ImportError:  # pragma: no cover
+    import httpx  # type: ignore
+
+from .config import (
+    OPENAI_BASE_URL, REQUEST_TIMEOUT, require_openai_key,
+    HTTP_POOL_SIZE, HTTP_KEEPALIVE, HEDGE_REQUESTS,
+    QUERY_THREADS, BATCH_CONCURRENCY, EMBED_CONCURRENCY,
+)
+
+_sync_clients: Dict[Tuple, OpenAI] = {}
+_sync_lock = threading.Lock()
+_sync_http: Optional[DefaultHttpxClient] = None
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def pool_size() -> int:
+    """Connections in the shared pool (HTTP_POOL_SIZE, or sized for the configured concurrency)."""
+    if HTTP_POOL_SIZE > 0:
+        return HTTP_POOL_SIZE
+    size = max(64, 2 * (QUERY_THREADS + BATCH_CONCURRENCY + EMBED_CONCURRENCY))
+    return size * 2 if HEDGE_REQUESTS else size
+
+
+def _http_options() -> dict:
+    n = pool_size()
+    return {
+        "limits": httpx.Limits(max_connections=n, max_keepalive_connections=n, keepalive_expiry=HTTP_KEEPALIVE),
+        "timeout": httpx.Timeout(REQUEST_TIMEOUT, connect=min(5.0, REQUEST_TIMEOUT)),
+    }
+
+
+def get_client(**kwargs) -> OpenAI:
+    """Shared sync client; kwargs (e.g. default_headers) select a variant."""
+    global _sync_http
+    kwargs.setdefault("max_retries", 0)
+    key = tuple(sorted(kwargs.items()))
+    client = _sync_clients.get(key)
+    if client is None:
+        with _sync_lock:
+            client = _sync_clients.get(key)
+            if client is None:
+                if _sync_http is None:
+                    _sync_http = DefaultHttpxClient(**_http_options())
+                client = OpenAI(api_key=require_openai_key(), base_url=OPENAI_BASE_URL, timeout=REQUEST_TIMEOUT,
+                                http_client=_sync_http, **kwargs)
+                _sync_clients[key] = client
+    return client
+
+
+def get_async_client(**kwargs) -> AsyncOpenAI:
+    """Client for the running loop; kwargs (e.g. default_headers) select a variant."""
+    kwargs.setdefault("max_retries", 0)
+    per_loop = _clients.setdefault(asyncio.get_running_loop(), {})
+    key = tuple(sorted(kwargs.items()))
+    client = per_loop.get(key)
+    if client is None:
+        http = per_loop.get("http")
+        if http is None:
+            http = per_loop["http"] = DefaultAsyncHttpxClient(**_http_options())
+        client = AsyncOpenAI(api_key=require_openai_key(), base_url=OPENAI_BASE_URL, timeout=REQUEST_TIMEOUT,
+                             http_client=http, **kwargs)
+        per_loop[key] = client
+    return client
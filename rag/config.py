@@ -12,9 +12,17 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # === API Keys ===
+# Only needed by what talks to OpenAI (chat, and embeddings with EMBED_PROVIDER=openai);
+# checked when the first OpenAI client is created, so local-only setups import fine
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY not found in environment or .env file")
+
+def require_openai_key() -> str:
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY not found in environment or .env file")
+    return OPENAI_API_KEY
+
+# Optional OpenAI-compatible endpoint (e.g. a local stand-in server for tests/benchmarks)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 
 # === Data paths ===
 # Folder where your documents are stored (can contain .txt, .pdf, .md, .docx, etc.)
@@ -26,13 +34,78 @@ PERSIST_DIR = os.getenv("PERSIST_DIR", "./storage/chroma")
 # Name of the collection inside the vector database
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "rag_collection")
 
+# Vector store backend: "chroma" (ChromaDB under PERSIST_DIR) or "native" (exact
+# memory-mapped float32 matrix under PERSIST_DIR/native; see rag.native_store).
+# The two do not share data: switching needs a full reindex.
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower()
+
+# Native store: rows scanned per matmul block, and threads scanning blocks
+# (0 = one per CPU; with a multithreaded BLAS, 1 avoids oversubscription)
+NATIVE_STORE_BLOCK = int(os.getenv("NATIVE_STORE_BLOCK", "65536"))
+NATIVE_STORE_THREADS = int(os.getenv("NATIVE_STORE_THREADS", "0"))
+
+# Native store quantization: "none" (scan float32), "int8" (per-row scaled int8 codes,
+# ~4x smaller) or "binary" (sign bits, ~32x smaller). Codes are scanned first, then the
+# best k * NATIVE_STORE_RESCORE candidates are rescored against the float32 vectors on disk.
+NATIVE_STORE_QUANT = os.getenv("NATIVE_STORE_QUANT", "none").lower()
+NATIVE_STORE_RESCORE = int(os.getenv("NATIVE_STORE_RESCORE", "10"))
+
 # === Model settings ===
-# Embedding model (used for vector search)
+# Embedding backend: "openai" (EMBED_MODEL via the API), "hash" (in-process hashed
+# features + random projection, no network) or "onnx" (local ONNX model in LOCAL_EMBED_MODEL_DIR).
+# Vectors of different providers are not comparable: switching needs a fresh
+# COLLECTION_NAME (or a full reindex into an empty store).
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "openai").lower()
+
+# Embedding model (used for vector search with EMBED_PROVIDER=openai)
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 
+# Local providers: vector size of "hash", model directory of "onnx" (model.onnx + tokenizer.json),
+# and CPU threads for both (0 = one per CPU)
+LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "384"))
+LOCAL_EMBED_MODEL_DIR = os.getenv("LOCAL_EMBED_MODEL_DIR", "./models/embedder")
+LOCAL_EMBED_THREADS = int(os.getenv("LOCAL_EMBED_THREADS", "0"))
+
 # Chat model (used for generating final answers)
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 
+# === Document loading ===
+# Worker processes for parsing files (0 or 1 = in-process, -1 = one per CPU)
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "0"))
+
+# Per-file parse timeout in seconds (parallel mode); a stuck file's worker is killed and replaced
+LOAD_TIMEOUT = float(os.getenv("LOAD_TIMEOUT", "120"))
+
+# Files handed to a worker per dispatch
+LOAD_CHUNKSIZE = int(os.getenv("LOAD_CHUNKSIZE", "8"))
+
+# multiprocessing start method for loader workers ("fork", "spawn", "forkserver"; empty = platform default)
+LOAD_START_METHOD = os.getenv("LOAD_START_METHOD", "")
+
+# === Ingestion embedding ===
+# Max chunks per embeddings request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+# Approximate token budget per embeddings request (keeps requests under the API size limit)
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "100000"))
+
+# Number of embeddings requests in flight at once
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+# Persistent embedding cache keyed by (embedding provider name, sha256(text)); shared by ingestion and queries
+EMBED_CACHE = os.getenv("EMBED_CACHE", "true").lower() in ("true", "1", "yes")
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(PERSIST_DIR, "embed_cache"))
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "2048"))  # LRU eviction above this size
+# In-memory LRU of query embeddings in front of the embedding cache (hot questions)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+
+# === Streaming ingest ===
+# Chunks per upsert batch (a batch is committed to the manifest as a unit)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1024"))
+
+# Parsed files buffered between the loader and the embed/upsert writer
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "16"))
+
 # === Chunking parameters ===
 # Size of text chunks (in characters if not using token-aware splitter)
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
@@ -40,18 +113,109 @@ CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
 # Overlap between chunks (to preserve context continuity)
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
 
+# How chunks are cut (see rag.chunking): "sentence" (CHUNK_SIZE characters of whole
+# sentences), "paragraph" (same, preferring paragraph breaks) or "token" (CHUNK_TOKENS
+# tokens, overlap CHUNK_OVERLAP_TOKENS). Overlap is always whole sentences.
+CHUNK_MODE = os.getenv("CHUNK_MODE", "sentence").lower()
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+
 # === Retrieval parameters ===
 # Default number of results to fetch from the vector store
 N_RESULTS = int(os.getenv("N_RESULTS", "6"))
 
+# Prompt context (see rag.context): merge overlapping/adjacent chunks of a source, drop
+# passages whose word shingles are at least CONTEXT_DUP_THRESHOLD contained in a better-ranked
+# one, and add passages best first up to CONTEXT_TOKENS tokens (0 = no budget).
+# CONTEXT_PACKING=false sends the retrieved chunks verbatim.
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() in ("true", "1", "yes")
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "3000"))
+CONTEXT_DUP_THRESHOLD = float(os.getenv("CONTEXT_DUP_THRESHOLD", "0.8"))
+
+# Worker threads for blocking retrieval work (vector query, BM25) on the async query path
+QUERY_THREADS = int(os.getenv("QUERY_THREADS", "16"))
+
+# Batch questions (ask_many, /ask/batch): answers generated concurrently per batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Background reindex jobs (/reindex): seconds an old index build is kept after a
+# switch so in-flight queries can finish on it, and finished jobs kept for /jobs
+INDEX_GC_DELAY = float(os.getenv("INDEX_GC_DELAY", "60"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+
+# === Query caches ===
+# Cache fused retrieval results per (index generation, normalized question, n_results, hybrid)
+RESULT_CACHE = os.getenv("RESULT_CACHE", "true").lower() in ("true", "1", "yes")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))  # seconds
+
+# Also cache final answers (same key plus chat model)
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "false").lower() in ("true", "1", "yes")
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+
+# Semantic answer cache: reuse an answer when a new question's embedding is this similar
+# (cosine) to a cached one and the retrieved chunks overlap at least this much (Jaccard)
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "false").lower() in ("true", "1", "yes")
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_MIN_OVERLAP = float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", "0.5"))
+
+# Optional SQLite file backing both caches, shared by all processes (e.g. API workers)
+CACHE_DB = os.getenv("CACHE_DB", "")
+
 # === Optional toggles ===
 # Enable hybrid retrieval (BM25 + vector search)
 USE_HYBRID = os.getenv("USE_HYBRID", "false").lower() in ("true", "1", "yes")
 
+# BM25 analyzer (applied at index and query time; changing it requires a reindex)
+BM25_TOKEN_PATTERN = os.getenv("BM25_TOKEN_PATTERN", r"\w+")
+BM25_STOPWORDS = os.getenv("BM25_STOPWORDS", "english")   # "english", "none", or a comma-separated list
+BM25_STEM = os.getenv("BM25_STEM", "false").lower() in ("true", "1", "yes")
+
+# BM25 segments are merged this many at a time, in the background (0 disables merging)
+BM25_MERGE_FACTOR = int(os.getenv("BM25_MERGE_FACTOR", "10"))
+
+# In-process metrics: stage timings, counters and histograms (GET /metrics, main.py --profile).
+# false makes the instrumentation a no-op; per-request traces still work when asked for.
+METRICS = os.getenv("METRICS", "true").lower() in ("true", "1", "yes")
+
 # Enable debug logging
 DEBUG = os.getenv("DEBUG", "false").lower() in ("true", "1", "yes")
 
 # === Request robustness ===
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30"))  # seconds
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))             # total attempts = 1 + MAX_RETRIES
+# Retries (transient errors only): jittered exponential backoff from RETRY_BACKOFF
+# seconds, capped at RETRY_MAX_BACKOFF, never shorter than the server's Retry-After;
+# an operation gives up when the next wait would pass RETRY_DEADLINE seconds.
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.5"))
+RETRY_MAX_BACKOFF = float(os.getenv("RETRY_MAX_BACKOFF", "20"))
+RETRY_DEADLINE = float(os.getenv("RETRY_DEADLINE", "60"))
+# Client-side rate limiting per model (requests/min and tokens/min). 0 = learn the
+# limits from the x-ratelimit-* response headers; requests are paced to
+# RATE_LIMIT_HEADROOM of the limit so sustained load stays just under the quota.
+RATE_LIMIT = os.getenv("RATE_LIMIT", "true").lower() in ("true", "1", "yes")
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", "0"))
+RATE_LIMIT_HEADROOM = float(os.getenv("RATE_LIMIT_HEADROOM", "0.95"))
 STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "false").lower() in ("true", "1", "yes")
+# SSE: tokens buffered per streaming /ask before generation waits for the client to read
+STREAM_BUFFER = int(os.getenv("STREAM_BUFFER", "64"))
+
+# Shared HTTP connection pool of the OpenAI clients (embeddings and chat): at most
+# HTTP_POOL_SIZE open (and kept-alive) connections. 0 = at least 64, or twice
+# QUERY_THREADS + BATCH_CONCURRENCY + EMBED_CONCURRENCY; doubled with hedging.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "0"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60"))  # seconds an idle connection is kept open
+
+# Hedged chat requests: when the first attempt has no first token after the observed
+# HEDGE_QUANTILE of time-to-first-token (HEDGE_DELAY until HEDGE_MIN_SAMPLES answers
+# were seen), a second attempt starts and the first to answer wins. HEDGE_MAX_RATIO
+# caps the share of requests that get a second attempt.
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() in ("true", "1", "yes")
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "2.0"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
@@ -0,0 +1,197 @@
+"""
+Context assembly: turns the ranked chunks of a retrieval into the prompt context.
+
+Runs between dedupe_top_k and generation:
+1. chunks of the same source that overlap or touch are merged into one passage,
+   so the CHUNK_OVERLAP text they share is sent once (by character span when the
+   chunks have one, else by matching the end of a chunk with the start of the next);
+2. exact and near-duplicate passages are dropped in favor of the better-ranked one;
+3. passages are added best (fused rank) first while they fit in CONTEXT_TOKENS.
+
+PackedContext says what was sent and how many prompt tokens that saved over
+joining the chunks verbatim.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+import re
+
+from .chunking import count_tokens
+from .config import CONTEXT_PACKING, CONTEXT_TOKENS, CONTEXT_DUP_THRESHOLD
+
+SEPARATOR = "\n\n---\n\n"
+
+_WORD = re.compile(r"\w+")
+_SHINGLE = 5        # words per shingle for near-duplicate detection
+_MIN_OVERLAP = 32   # shortest shared text that counts as overlap between chunks without spans
+
+@dataclass
+class PackedContext:
+    text: str                     # prompt context
+    metas: List[Dict]             # chunks that made it in, passage by passage
+    retrieved_tokens: int = 0     # tokens of the verbatim join of every retrieved chunk
+    tokens: int = 0               # tokens of text
+    merged: int = 0               # chunks folded into a neighbour of the same source
+    duplicates: int = 0           # passages dropped as (near-)duplicates
+    over_budget: int = 0          # passages dropped for CONTEXT_TOKENS
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.retrieved_tokens - self.tokens)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "retrieved_tokens": self.retrieved_tokens,
+            "context_tokens": self.tokens,
+            "saved_tokens": self.saved_tokens,
+            "merged": self.merged,
+            "duplicates": self.duplicates,
+            "over_budget": self.over_budget,
+        }
+
+@dataclass
+class _Passage:
+    rank: int                     # best fused rank among its chunks
+    text: str
+    metas: List[Dict] = field(default_factory=list)
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+def _span(doc: str, meta: Dict) -> Optional[Tuple[int, int]]:
+    s, e = meta.get("start"), meta.get("end")
+    if isinstance(s, int) and isinstance(e, int) and e - s == len(doc):
+        return s, e
+    return None
+
+def _text_overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that b starts with (0 if shorter than _MIN_OVERLAP)."""
+    if len(b) < _MIN_OVERLAP:
+        return 0
+    probe = b[:_MIN_OVERLAP]
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+def _merge_source(chunks: List[Tuple[int, str, Dict]]) -> Tuple[List[_Passage], int]:
+    """Passages of one source's chunks (rank, doc, meta) and how many chunks were merged away."""
+    spanned, plain = [], []
+    for rank, doc, meta in chunks:
+        span = _span(doc, meta)
+        if span:
+            spanned.append(_Passage(rank, doc, [meta], *span))
+        else:
+            plain.append(_Passage(rank, doc, [meta]))
+    out: List[_Passage] = []
+    merged = 0
+
+    spanned.sort(key=lambda p: (p.start, -p.end))
+    for p in spanned:
+        cur = out[-1] if out and out[-1].start is not None else None
+        last = cur.metas[-1].get("chunk") if cur else None
+        consecutive = isinstance(last, int) and p.metas[0].get("chunk") == last + 1
+        if cur is None or (p.start > cur.end and not consecutive):
+            out.append(p)
+            continue
+        # Overlapping (or consecutive chunks, which only whitespace separates): keep shared text once
+        if p.end > cur.end:
+            cur.text = cur.text + p.text[cur.end - p.start:] if p.start <= cur.end else cur.text + "\n" + p.text
+            cur.end = p.end
+        cur.rank = min(cur.rank, p.rank)
+        cur.metas.extend(p.metas)
+        merged += 1
+
+    # Chunks without spans (indexed before spans existed): merge consecutive ones that overlap textually
+    plain.sort(key=lambda p: (p.metas[0].get("chunk") if isinstance(p.metas[0].get("chunk"), int) else -1))
+    for p in plain:
+        cur = out[-1] if out and out[-1].start is None else None
+        last = cur.metas[-1].get("chunk") if cur else None
+        if isinstance(last, int) and p.metas[0].get("chunk") == last + 1:
+            shared = _text_overlap(cur.text, p.text)
+            if shared:
+                cur.text += p.text[shared:]
+                cur.rank = min(cur.rank, p.rank)
+                cur.metas.extend(p.metas)
+                merged += 1
+                continue
+        out.append(p)
+    return out, merged
+
+def _shingles(text: str) -> Set[int]:
+    words = _WORD.findall(text.casefold())
+    if len(words) <= _SHINGLE:
+        return {hash(" ".join(words))}
+    return {hash(" ".join(words[i:i + _SHINGLE])) for i in range(len(words) - _SHINGLE + 1)}
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut text at whitespace to roughly max_tokens tokens."""
+    n = count_tokens(text)
+    if n <= max_tokens:
+        return text
+    cut = text[: max(1, len(text) * max_tokens // n)]
+    head = cut.rsplit(None, 1)[0] if len(cut.split(None, 1)) > 1 else cut
+    return head.rstrip()
+
+def pack_context(
+    docs: List[str],
+    metas: List[Dict],
+    budget_tokens: Optional[int] = None,
+    dup_threshold: Optional[float] = None,
+) -> PackedContext:
+    """
+    Prompt context from ranked chunks (best first, as dedupe_top_k returns them).
+    budget_tokens defaults to CONTEXT_TOKENS (0 = no budget); a passage is a
+    near-duplicate when at least dup_threshold (CONTEXT_DUP_THRESHOLD) of its word
+    shingles already appear in one passage that was kept. With CONTEXT_PACKING
+    off, the chunks are joined verbatim.
+    """
+    verbatim = SEPARATOR.join(docs)
+    retrieved = count_tokens(verbatim) if docs else 0
+    if not CONTEXT_PACKING or not docs:
+        return PackedContext(verbatim, list(metas), retrieved, retrieved)
+    budget = CONTEXT_TOKENS if budget_tokens is None else budget_tokens
+    threshold = CONTEXT_DUP_THRESHOLD if dup_threshold is None else dup_threshold
+
+    by_source: Dict[str, List[Tuple[int, str, Dict]]] = {}
+    for rank, (doc, meta) in enumerate(zip(docs, metas)):
+        by_source.setdefault(str(meta.get("source")), []).append((rank, doc, meta))
+    passages: List[_Passage] = []
+    merged = 0
+    for chunks in by_source.values():
+        ps, n = _merge_source(chunks)
+        passages.extend(ps)
+        merged += n
+    passages.sort(key=lambda p: p.rank)
+
+    sep_tokens = count_tokens(SEPARATOR)
+    kept: List[_Passage] = []
+    kept_shingles: List[Set[int]] = []
+    used = duplicates = over_budget = 0
+    for p in passages:
+        sh = _shingles(p.text)
+        if any(len(sh & other) >= threshold * len(sh) for other in kept_shingles):
+            duplicates += 1
+            continue
+        cost = count_tokens(p.text) + (sep_tokens if kept else 0)
+        if budget > 0 and used + cost > budget:
+            if kept:
+                over_budget += 1
+                continue
+            p.text = _truncate(p.text, budget)  # the best passage alone is over budget: send its head
+            cost = count_tokens(p.text)
+        kept.append(p)
+        kept_shingles.append(sh)
+        used += cost
+
+    text = SEPARATOR.join(p.text for p in kept)
+    return PackedContext(
+        text=text,
+        metas=[m for p in kept for m in p.metas],
+        retrieved_tokens=retrieved,
+        tokens=count_tokens(text),
+        merged=merged,
+        duplicates=duplicates,
+        over_budget=over_budget,
+    )
@@ -0,0 +1,309 @@
+"""
+Persistent embedding cache keyed by (model, sha256(text)).
+
+Layout under EMBED_CACHE_DIR:
+- index.sqlite          model/key -> (dim, slot, last_used), plus a free-slot list
+- vectors_<dim>.bin     one record per slot, memory-mapped: the owner tag
+                        (64-bit hash of model and key) and the float32 vector
+
+Size is bounded by EMBED_CACHE_MAX_MB: before a batch is written, least
+recently used entries are evicted to make room for it and their slots are
+reused, and a matrix file never grows past the limit (unless a single batch
+needs more). The file of a dimension with no entries left is deleted, so
+switching models or dimensions does not leave the old matrix behind. Safe to
+share between threads and between processes: SQLite serializes slot
+allocation, matrix files are reopened when another process has grown,
+replaced or deleted them, and a slot's tag is cleared while its vector is
+rewritten, so a reader racing an eviction (or a slot written by a batch that
+rolled back) gets a miss, never another text's vector.
+"""
+
+from __future__ import annotations
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .config import EMBED_CACHE, EMBED_CACHE_DIR, EMBED_CACHE_MAX_MB
+
+_INITIAL_ROWS = 1024
+_TAG_BYTES = 8
+
+
+def _row_dtype(dim: int) -> np.dtype:
+    return np.dtype([("tag", "<u8"), ("vec", "<f4", (dim,))])
+
+
+def _owner_tag(model: str, key: str) -> int:
+    """Nonzero 64-bit tag of an entry (0 marks a slot being written)."""
+    digest = hashlib.blake2b(f"{model}\0{key}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, dim INTEGER NOT NULL,"
+            " slot INTEGER NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS free_slots (dim INTEGER NOT NULL, slot INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS slot_count (dim INTEGER PRIMARY KEY, n INTEGER NOT NULL)")
+        self._db.commit()
+        self._mats: Dict[int, np.memmap] = {}
+        self._inodes: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- matrix files ---
+    def _matrix_path(self, dim: int) -> str:
+        return os.path.join(self.directory, f"vectors_{dim}.bin")
+
+    def _matrix(self, dim: int, min_rows: int = 0) -> np.memmap:
+        """Memory-map the matrix for `dim`, growing the file (doubling) to hold min_rows."""
+        mat = self._mats.get(dim)
+        if mat is not None and mat.shape[0] >= min_rows:
+            return mat
+        path = self._matrix_path(dim)
+        row_bytes = dim * 4 + _TAG_BYTES
+        rows = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+        if rows < min_rows or rows == 0:
+            new_rows = max(_INITIAL_ROWS, rows)
+            while new_rows < min_rows:
+                new_rows *= 2
+            new_rows = min(new_rows, max(min_rows, 1, self.max_bytes // row_bytes))
+            with open(path, "ab") as f:
+                f.truncate(new_rows * row_bytes)
+            rows = new_rows
+        if mat is not None:
+            mat.flush()
+        mat = np.memmap(path, dtype=_row_dtype(dim), mode="r+", shape=(rows,))
+        self._mats[dim] = mat
+        self._inodes[dim] = os.stat(path).st_ino
+        return mat
+
+    def _drop_stale_maps(self) -> None:
+        """Forget mappings of files another process has deleted or replaced."""
+        for dim in list(self._mats):
+            try:
+                same = os.stat(self._matrix_path(dim)).st_ino == self._inodes.get(dim)
+            except OSError:
+                same = False
+            if not same:
+                del self._mats[dim]
+                self._inodes.pop(dim, None)
+
+    @staticmethod
+    def _write_slot(mat: np.memmap, slot: int, tag: int, vec: np.ndarray) -> None:
+        mat["tag"][slot] = 0  # readers of the old owner see a miss from here on
+        mat["vec"][slot] = vec
+        mat["tag"][slot] = tag
+
+    @staticmethod
+    def _read_slot(mat: np.memmap, slot: int, tag: int) -> Optional[np.ndarray]:
+        """The slot's vector if `tag` owned it for the whole copy, else None."""
+        if mat["tag"][slot] != tag:
+            return None
+        vec = np.array(mat["vec"][slot])
+        return vec if mat["tag"][slot] == tag else None
+
+    def _forget_slots(self, slots: List[tuple]) -> None:
+        """After a rollback: drop the entries whose slots the failed batch overwrote."""
+        if not slots:
+            return
+        cur = self._db.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for dim, slot in slots:
+                cur.execute("DELETE FROM entries WHERE dim=? AND slot=?", (dim, slot))
+                if cur.rowcount:
+                    cur.execute("INSERT INTO free_slots (dim, slot) VALUES (?, ?)", (dim, slot))
+            cur.execute("COMMIT")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+
+    def _remove_matrix(self, dim: int) -> None:
+        self._mats.pop(dim, None)
+        self._inodes.pop(dim, None)
+        try:
+            os.remove(self._matrix_path(dim))
+        except OSError:
+            pass  # e.g. still mapped elsewhere on Windows; the file is reused from slot 0
+
+    # --- public API ---
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Return a cached vector (float32 copy) or None for each text."""
+        keys = [text_key(t) for t in texts]
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        if not keys:
+            return out
+        with self._lock:
+            self._drop_stale_maps()
+            found: Dict[str, tuple] = {}
+            uniq = list(dict.fromkeys(keys))
+            for i in range(0, len(uniq), 500):
+                part = uniq[i:i + 500]
+                q = ",".join("?" * len(part))
+                for key, dim, slot in self._db.execute(
+                    f"SELECT key, dim, slot FROM entries WHERE model=? AND key IN ({q})", [model, *part]
+                ):
+                    found[key] = (dim, slot)
+            for i, key in enumerate(keys):
+                hit = found.get(key)
+                if hit is None:
+                    continue
+                dim, slot = hit
+                out[i] = self._read_slot(self._matrix(dim, slot + 1), slot, _owner_tag(model, key))
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE entries SET last_used=? WHERE model=? AND key=?",
+                    [(now, model, k) for k in found],
+                )
+                self._db.commit()
+            n_hit = sum(1 for v in out if v is not None)
+            self.hits += n_hit
+            self.misses += len(out) - n_hit
+        return out
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        with self._lock:
+            now = time.time()
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            touched: List[tuple] = []
+            try:
+                self._drop_stale_maps()
+                batch: Dict[str, np.ndarray] = {}
+                for text, vec in zip(texts, vectors):
+                    batch.setdefault(text_key(text), np.asarray(vec, dtype=np.float32))
+                self._evict(cur, sum(arr.nbytes + _TAG_BYTES for arr in batch.values()))
+                for key, arr in batch.items():
+                    dim = int(arr.shape[0])
+                    row = cur.execute("SELECT dim, slot FROM entries WHERE model=? AND key=?", (model, key)).fetchone()
+                    if row and row[0] == dim:
+                        slot = row[1]
+                    else:
+                        if row:  # dimension changed: the old slot is free again
+                            cur.execute("INSERT INTO free_slots (dim, slot) VALUES (?, ?)", row)
+                        slot = self._alloc_slot(cur, dim)
+                    touched.append((dim, slot))
+                    self._write_slot(self._matrix(dim, slot + 1), slot, _owner_tag(model, key), arr)
+                    cur.execute(
+                        "INSERT OR REPLACE INTO entries (model, key, dim, slot, last_used) VALUES (?, ?, ?, ?, ?)",
+                        (model, key, dim, slot, now),
+                    )
+                unused = self._release_unused_dims(cur)
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                try:
+                    self._forget_slots(touched)
+                except Exception as e:  # their tags no longer match, so reads still miss
+                    print(f"Warning: could not drop overwritten embedding cache entries: {e}")
+                raise
+            for dim in unused:
+                self._remove_matrix(dim)
+            for mat in self._mats.values():
+                mat.flush()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries, nbytes = self._db.execute("SELECT COUNT(*), COALESCE(SUM(dim * 4 + 8), 0) FROM entries").fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("DELETE FROM free_slots")
+            self._db.execute("DELETE FROM slot_count")
+            self._db.commit()
+            self._mats.clear()
+            self._inodes.clear()
+            for fn in os.listdir(self.directory):
+                if fn.startswith("vectors_") and fn.endswith(".bin"):
+                    os.remove(os.path.join(self.directory, fn))
+
+    # --- internals (called inside a write transaction) ---
+    def _alloc_slot(self, cur: sqlite3.Cursor, dim: int) -> int:
+        row = cur.execute("SELECT rowid, slot FROM free_slots WHERE dim=? LIMIT 1", (dim,)).fetchone()
+        if row:
+            cur.execute("DELETE FROM free_slots WHERE rowid=?", (row[0],))
+            return row[1]
+        row = cur.execute("SELECT n FROM slot_count WHERE dim=?", (dim,)).fetchone()
+        slot = row[0] if row else 0
+        cur.execute("INSERT OR REPLACE INTO slot_count (dim, n) VALUES (?, ?)", (dim, slot + 1))
+        return slot
+
+    def _evict(self, cur: sqlite3.Cursor, incoming: int = 0) -> None:
+        """Evict LRU entries so that `incoming` more bytes fit under the limit."""
+        nbytes = cur.execute("SELECT COALESCE(SUM(dim * 4 + 8), 0) FROM entries").fetchone()[0]
+        if nbytes + incoming <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9) - incoming  # evict a little extra so we don't evict on every put
+        victims = []
+        for model, key, dim, slot in cur.execute(
+            "SELECT model, key, dim, slot FROM entries ORDER BY last_used ASC"
+        ):
+            if nbytes <= target:
+                break
+            victims.append((model, key, dim, slot))
+            nbytes -= dim * 4 + _TAG_BYTES
+        cur.executemany("DELETE FROM entries WHERE model=? AND key=?", [(m, k) for m, k, _, _ in victims])
+        cur.executemany("INSERT INTO free_slots (dim, slot) VALUES (?, ?)", [(d, s) for _, _, d, s in victims])
+        self.evictions += len(victims)
+
+    def _release_unused_dims(self, cur: sqlite3.Cursor) -> List[int]:
+        """Drop the slot bookkeeping of dimensions with no entries left; their files can go."""
+        dims = [d for (d,) in cur.execute(
+            "SELECT dim FROM slot_count WHERE dim NOT IN (SELECT DISTINCT dim FROM entries)"
+        ).fetchall()]
+        for dim in dims:
+            cur.execute("DELETE FROM free_slots WHERE dim=?", (dim,))
+            cur.execute("DELETE FROM slot_count WHERE dim=?", (dim,))
+        return dims
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache instance, or None when EMBED_CACHE=false."""
+    global _cache
+    if not EMBED_CACHE:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(EMBED_CACHE_DIR, EMBED_CACHE_MAX_MB * 1024 * 1024)
+    return _cache
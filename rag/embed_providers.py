@@ -0,0 +1,279 @@
+"""
+Embedding providers, selected with EMBED_PROVIDER:
+
+- openai: EMBED_MODEL through the OpenAI (or OPENAI_BASE_URL) embeddings API
+- hash:   in-process, no network, no model files. Lowercased word unigrams,
+          word bigrams and character trigrams are hashed to 64-bit ids,
+          weighted by sublinear term frequency and sparsely randomly
+          projected to LOCAL_EMBED_DIM dimensions (each feature adds +-w to
+          a few hashed coordinates), then L2-normalised. It captures lexical
+          overlap, not meaning, and is deterministic across processes.
+- onnx:   a sentence-embedding model exported to ONNX (LOCAL_EMBED_MODEL_DIR
+          with model.onnx and tokenizer.json), mean-pooled. Needs the optional
+          onnxruntime and tokenizers packages.
+
+A provider's `name` keys the embedding cache and the query caches, so vectors
+of different providers never mix there. The onnx name includes a hash of the
+model and tokenizer files, so replacing them in place does not serve the old
+model's cached vectors.
+"""
+
+from __future__ import annotations
+import asyncio
+import hashlib
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .config import (
+    EMBED_PROVIDER, EMBED_MODEL,
+    LOCAL_EMBED_DIM, LOCAL_EMBED_MODEL_DIR, LOCAL_EMBED_THREADS,
+)
+from .clients import get_async_client, get_client
+from .ratelimit import limited_call, limited_call_async
+
+# Optional deps of the onnx provider; import guarded so the package imports without them
+try:
+    import onnxruntime as ort  # type: ignore
+except Exception:  # pragma: no cover
+    ort = None  # type: ignore
+
+try:
+    from tokenizers import Tokenizer  # type: ignore
+except Exception:  # pragma: no cover
+    Tokenizer = None  # type: ignore
+
+
+class EmbeddingProvider(ABC):
+    name: str = ""
+    cacheable: bool = True  # worth looking up in the embedding cache before computing
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+    async def embed_async(self, texts: List[str]) -> List[List[float]]:
+        """Default: run embed() on a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed, texts)
+
+
+def _tokens(texts: List[str]) -> int:
+    # ~4 characters per token: the rate limiter's estimate, corrected from the reported usage
+    return sum(len(t) for t in texts) // 4 + len(texts)
+
+
+class OpenAIProvider(EmbeddingProvider):
+    def __init__(self, model: str):
+        self.model = model
+        self.name = model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        # Paced by the model's shared rate limiter; transient errors are retried there
+        resp = limited_call(lambda: get_client().embeddings.with_raw_response.create(input=texts, model=self.model),
+                            self.model, _tokens(texts))
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+    async def embed_async(self, texts: List[str]) -> List[List[float]]:
+        resp = await limited_call_async(
+            lambda: get_async_client().embeddings.with_raw_response.create(input=texts, model=self.model),
+            self.model, _tokens(texts))
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
+# --- hash ---
+_U64 = np.uint64
+_GOLDEN = _U64(0x9E3779B97F4A7C15)
+_POLY = 0x100000001B3                      # odd, so invertible mod 2**64
+_POLY_INV = pow(_POLY, -1, 1 << 64)
+# Feature-kind tags: further 64-bit windows of the golden ratio's fraction (like _GOLDEN)
+_TAG_BIGRAM = _U64(0x5CEDC8341082276B)
+_TAG_TRIGRAM = _U64(0x7F4A7C15F39CC060)
+
+# Bytes that belong to words: ASCII letters/digits and every byte of a non-ASCII UTF-8 character
+_WORD_BYTE = np.zeros(256, dtype=bool)
+_WORD_BYTE[ord("0"):ord("9") + 1] = True
+_WORD_BYTE[ord("a"):ord("z") + 1] = True
+_WORD_BYTE[0x80:] = True
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finaliser, elementwise on uint64 (wrapping arithmetic)."""
+    x = x + _GOLDEN
+    x = (x ^ (x >> _U64(30))) * _U64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> _U64(27))) * _U64(0x94D049BB133111EB)
+    return x ^ (x >> _U64(31))
+
+
+class HashingProvider(EmbeddingProvider):
+    cacheable = False  # recomputing is cheaper than a cache lookup
+
+    # Feature weights: words count most, char trigrams add robustness to inflections/typos
+    UNIGRAM, BIGRAM, TRIGRAM = 1.0, 0.5, 0.25
+
+    def __init__(self, dim: int = 384, planes: int = 4, threads: int = 0, block: int = 64):
+        self.dim = dim
+        self.planes = planes  # coordinates each feature is projected onto
+        self.block = block
+        self.threads = threads or os.cpu_count() or 1
+        self.name = f"hash-{dim}x{planes}"
+        self._seeds = [_mix(np.asarray([p], dtype=_U64))[0] for p in range(planes)]
+        self._pow: Tuple[np.ndarray, np.ndarray] = (np.zeros(0, _U64), np.zeros(0, _U64))
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if len(texts) < 2 * self.block or self.threads <= 1:
+            return self._embed_block(texts).tolist()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="hash-embed")
+        blocks = [texts[i:i + self.block] for i in range(0, len(texts), self.block)]
+        out: List[List[float]] = []
+        for arr in self._pool.map(self._embed_block, blocks):
+            out.extend(arr.tolist())
+        return out
+
+    def _powers(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """P**i and P**-i (mod 2**64) for i < n, grown on demand and shared by all blocks."""
+        powers = self._pow
+        if len(powers[0]) < n:
+            size = max(n, 2 * len(powers[0]), 1 << 16)
+            powers = (
+                np.cumprod(np.full(size, _POLY, dtype=_U64)) * _U64(_POLY_INV),
+                np.cumprod(np.full(size, _POLY_INV, dtype=_U64)) * _U64(_POLY),
+            )
+            self._pow = powers  # a single reference swap; concurrent blocks see either table
+        return powers[0][:n], powers[1][:n]
+
+    def _features(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(row, feature id, weight) of every feature occurrence in the block, fully vectorized."""
+        encoded = [t.lower().encode("utf-8") for t in texts]
+        # Every text is followed by a separator that is not a word byte, so a text's
+        # features do not depend on the rest of the block
+        b = np.frombuffer(b" ".join(encoded) + b" ", dtype=np.uint8)
+        lengths = np.fromiter((len(e) + 1 for e in encoded), dtype=np.int64, count=len(encoded))
+        row_of = np.repeat(np.arange(len(texts)), lengths)  # text index of every byte
+        isw = _WORD_BYTE[b]
+
+        # Words: position-independent polynomial hash of each run of word bytes,
+        # from prefix sums of b[i] * P**i (mod 2**64) rescaled by P**-start
+        starts = np.flatnonzero(isw & ~np.concatenate(([False], isw[:-1])))
+        ends = np.flatnonzero(isw & ~np.concatenate((isw[1:], [False]))) + 1
+        pw, inv = self._powers(len(b))
+        prefix = np.concatenate(([_U64(0)], np.cumsum(b.astype(_U64) * pw, dtype=_U64)))
+        words = _mix((prefix[ends] - prefix[starts]) * inv[starts])
+        word_rows = row_of[starts]
+
+        same = word_rows[:-1] == word_rows[1:]
+        bigrams = _mix((words[:-1][same] * _U64(31)) ^ words[1:][same] ^ _TAG_BIGRAM)
+        bigram_rows = word_rows[:-1][same]
+
+        # Char trigrams over the text with non-word bytes read as spaces, centred on a word byte
+        c = np.where(isw, b, 0x20).astype(_U64)
+        keep = isw[1:-1] & (row_of[:-2] == row_of[2:])
+        trigrams = _mix(((c[:-2] << _U64(16)) | (c[1:-1] << _U64(8)) | c[2:])[keep] ^ _TAG_TRIGRAM)
+        trigram_rows = row_of[:-2][keep]
+
+        rows = np.concatenate((word_rows, bigram_rows, trigram_rows)).astype(np.int64)
+        ids = np.concatenate((words, bigrams, trigrams))
+        weights = np.concatenate((
+            np.full(len(words), self.UNIGRAM), np.full(len(bigrams), self.BIGRAM), np.full(len(trigrams), self.TRIGRAM),
+        ))
+        return rows, ids, weights
+
+    def _embed_block(self, texts: List[str]) -> np.ndarray:
+        n, dim = len(texts), self.dim
+        out = np.zeros(n * dim)
+        rows, ids, weights = self._features(texts)
+        if len(ids):
+            # Sublinear tf per (row, feature): 1 + log(count); one 64-bit sort key per pair
+            key = _mix(ids ^ (rows.astype(_U64) * _GOLDEN))
+            order = np.argsort(key)
+            key, rows, ids, weights = key[order], rows[order], ids[order], weights[order]
+            starts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+            counts = np.diff(np.append(starts, len(ids)))
+            rows, ids = rows[starts], ids[starts]
+            weights = weights[starts] * (1.0 + np.log(counts)) / np.sqrt(self.planes)
+            for seed in self._seeds:
+                h = _mix(ids ^ seed)
+                pos = ((h >> _U64(32)) % _U64(dim)).astype(np.int64)
+                sign = 1.0 - 2.0 * (h & _U64(1)).astype(np.float64)
+                out += np.bincount(rows * dim + pos, weights=weights * sign, minlength=n * dim)
+        out = out.reshape(n, dim)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms > 0, norms, 1.0)
+
+
+# --- onnx ---
+def _fingerprint(*paths: str) -> str:
+    """sha256 prefix of the files' contents."""
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()[:12]
+
+
+class OnnxProvider(EmbeddingProvider):
+    def __init__(self, model_dir: str, threads: int = 0, batch_size: int = 32, max_length: int = 256):
+        if ort is None or Tokenizer is None:
+            raise RuntimeError("EMBED_PROVIDER=onnx needs the onnxruntime and tokenizers packages")
+        model_path = os.path.join(model_dir, "model.onnx")
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        for path in (model_path, tokenizer_path):
+            if not os.path.exists(path):
+                raise RuntimeError(f"EMBED_PROVIDER=onnx: {path} not found (set LOCAL_EMBED_MODEL_DIR)")
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads or os.cpu_count() or 1
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+        self.name = f"onnx:{os.path.basename(os.path.normpath(model_dir))}:{_fingerprint(model_path, tokenizer_path)}"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        out: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            enc = self.tokenizer.encode_batch(texts[i:i + self.batch_size])
+            ids = np.asarray([e.ids for e in enc], dtype=np.int64)
+            mask = np.asarray([e.attention_mask for e in enc], dtype=np.int64)
+            feed = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feed["token_type_ids"] = np.zeros_like(ids)
+            hidden = self.session.run(None, {k: v for k, v in feed.items() if k in self.input_names})[0]
+            if hidden.ndim == 3:  # token embeddings: mean-pool over real tokens
+                m = mask[..., None].astype(hidden.dtype)
+                hidden = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+            norms = np.linalg.norm(hidden, axis=1, keepdims=True)
+            out.extend((hidden / np.where(norms > 0, norms, 1.0)).tolist())
+        return out
+
+
+_provider: Optional[EmbeddingProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> EmbeddingProvider:
+    """The configured provider (created on first use)."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if EMBED_PROVIDER == "openai":
+                    _provider = OpenAIProvider(EMBED_MODEL)
+                elif EMBED_PROVIDER == "hash":
+                    _provider = HashingProvider(LOCAL_EMBED_DIM, threads=LOCAL_EMBED_THREADS)
+                elif EMBED_PROVIDER == "onnx":
+                    _provider = OnnxProvider(LOCAL_EMBED_MODEL_DIR, threads=LOCAL_EMBED_THREADS)
+                else:
+                    raise ValueError(f"Unknown EMBED_PROVIDER {EMBED_PROVIDER!r} (expected openai, hash or onnx)")
+    return _provider
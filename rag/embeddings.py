@@ -1,10 +1,259 @@
-from openai import OpenAI
-from typing import List
-from .config import OPENAI_API_KEY, EMBED_MODEL
+"""
+Embedding helpers for ingestion.
+
+Texts are packed into batches bounded by an item count and an approximate
+token budget, then embedded through a bounded thread pool so several
+requests are in flight at once. Results carry per-batch throughput stats.
+
+Both ingestion and query embedding consult the persistent embedding cache
+(rag.embed_cache) first; duplicate texts within a call are embedded once.
+Query embeddings additionally go through a small in-memory LRU, and
+QueryVector carries one question's vector (computed at most once, on first
+use) with its latency through the whole query path.
+
+Vectors come from the configured provider (rag.embed_providers); cache
+entries are keyed by the provider's name.
+"""
+
+from __future__ import annotations
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import EMBED_BATCH_SIZE, EMBED_BATCH_TOKENS, EMBED_CONCURRENCY, DEBUG, QUERY_EMBED_CACHE_SIZE
+from .cache import TTLCache
+from .embed_cache import get_embedding_cache
+from .embed_providers import get_provider
+from .metrics import inc, span
+
+
+@dataclass
+class BatchStats:
+    index: int      # batch number, in submission order (-1 for cache hits)
+    items: int
+    tokens: int     # estimated
+    seconds: float
+    cached: bool = False
+
+    @property
+    def items_per_s(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else float("inf")
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.tokens / self.seconds if self.seconds > 0 else float("inf")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English; only used to size batches, not billed
+    return max(1, (len(text) + 3) // 4)
 
-_client = OpenAI(api_key=OPENAI_API_KEY)
 
 def embed_texts(texts: List[str]) -> List[List[float]]:
-    """Optional manual embedding. Not used if Chroma has an embedding_function."""
-    resp = _client.embeddings.create(input=texts, model=EMBED_MODEL)
-    return [d.embedding for d in resp.data]
+    """Embed texts in a single request (caller keeps it within API limits). Bypasses the cache."""
+    with span("embed"):
+        vectors = get_provider().embed(texts)
+    inc("rag_embedded_texts_total", len(texts))
+    return vectors
+
+
+def _query_cache():
+    """The embedding cache, unless the provider recomputes faster than a lookup."""
+    return get_embedding_cache() if get_provider().cacheable else None
+
+
+# Hot query vectors; embeddings of a given provider never go stale
+_hot_queries = TTLCache(QUERY_EMBED_CACHE_SIZE, float("inf"))
+
+
+def _cached_query_vector(text: str) -> Tuple[Optional[List[float]], str]:
+    """(vector or None, where it came from: "memory", "disk" or "api" for a miss)."""
+    model = get_provider().name
+    key = f"{model}\0{text}"
+    vector = _hot_queries.get(key)
+    if vector is not None:
+        inc("rag_cache_requests_total", cache="query_embedding", result="hit")
+        return vector, "memory"
+    cache = _query_cache()
+    if cache:
+        hit = cache.get_many(model, [text])[0]
+        if hit is not None:
+            vector = hit.tolist()
+            _hot_queries.set(key, vector)
+            inc("rag_cache_requests_total", cache="query_embedding", result="hit")
+            return vector, "disk"
+    inc("rag_cache_requests_total", cache="query_embedding", result="miss")
+    return None, "api"
+
+
+@dataclass
+class QueryVector:
+    """
+    One question's embedding, shared by every stage of a query (vector search,
+    caches, ...): computed on first get(), through the hot LRU and the
+    embedding cache, then reused. seconds/source tell what obtaining it cost.
+    """
+    text: str
+    vector: Optional[List[float]] = None
+    seconds: float = 0.0
+    source: str = ""  # "memory" | "disk" | "api" (computed by the provider, local or not)
+
+    def get(self) -> List[float]:
+        if self.vector is None:
+            t0 = time.perf_counter()
+            with span("embed_query"):
+                vector, source = _cached_query_vector(self.text)
+                if vector is None:
+                    vector = embed_texts([self.text])[0]
+                    _store_query_vector(self.text, vector)
+            self.vector, self.source, self.seconds = vector, source, time.perf_counter() - t0
+        return self.vector
+
+    async def get_async(self) -> List[float]:
+        """get() for the asyncio path (lookups are local; only a miss awaits the provider)."""
+        if self.vector is None:
+            t0 = time.perf_counter()
+            with span("embed_query"):
+                vector, source = _cached_query_vector(self.text)
+                if vector is None:
+                    with span("embed"):
+                        vector = (await get_provider().embed_async([self.text]))[0]
+                    inc("rag_embedded_texts_total")
+                    # The write commits SQLite and flushes the memmap; keep it off the loop
+                    await asyncio.get_running_loop().run_in_executor(None, _store_query_vector, self.text, vector)
+            self.vector, self.source, self.seconds = vector, source, time.perf_counter() - t0
+        return self.vector
+
+
+def _store_query_vector(text: str, vector: List[float]) -> None:
+    model = get_provider().name
+    _hot_queries.set(f"{model}\0{text}", vector)
+    cache = _query_cache()
+    if cache:
+        cache.put_many(model, [text], [vector])
+
+
+def embed_query(text: str) -> List[float]:
+    """Embed one query string, through the hot-query LRU and the embedding cache."""
+    return QueryVector(text).get()
+
+
+async def embed_query_async(text: str) -> List[float]:
+    """embed_query for the asyncio path."""
+    return await QueryVector(text).get_async()
+
+
+def iter_batches(texts: List[str], max_items: int, max_tokens: int) -> Iterator[Tuple[List[int], int]]:
+    """
+    Pack texts (in order) into batches of at most max_items items and about
+    max_tokens tokens. Yields (indices, estimated_tokens). An oversized text
+    gets a batch of its own.
+    """
+    batch: List[int] = []
+    tokens = 0
+    for i, t in enumerate(texts):
+        n = estimate_tokens(t)
+        if batch and (len(batch) >= max_items or tokens + n > max_tokens):
+            yield batch, tokens
+            batch, tokens = [], 0
+        batch.append(i)
+        tokens += n
+    if batch:
+        yield batch, tokens
+
+
+def iter_embedded_batches(
+    texts: List[str],
+    *,
+    batch_size: Optional[int] = None,
+    batch_tokens: Optional[int] = None,
+    concurrency: Optional[int] = None,
+) -> Iterator[Tuple[List[int], List[List[float]], BatchStats]]:
+    """
+    Embed texts batch by batch with up to `concurrency` requests in flight.
+    Yields (indices, vectors, stats) in completion order, from the calling thread.
+    Cache hits come first as a single batch flagged cached=True; only distinct
+    cache misses are sent to the provider (and written back to the cache).
+    """
+    model = get_provider().name
+    cache = _query_cache()
+    hits = cache.get_many(model, texts) if cache else [None] * len(texts)
+    hit_idxs = [i for i, v in enumerate(hits) if v is not None]
+    if hit_idxs:
+        yield hit_idxs, [hits[i].tolist() for i in hit_idxs], BatchStats(-1, len(hit_idxs), 0, 0.0, cached=True)
+
+    groups: Dict[str, List[int]] = {}
+    for i, v in enumerate(hits):
+        if v is None:
+            groups.setdefault(texts[i], []).append(i)
+    uniq = list(groups)
+    for uidxs, vectors, stats in _iter_api_batches(uniq, batch_size, batch_tokens, concurrency):
+        if cache:
+            cache.put_many(model, [uniq[j] for j in uidxs], vectors)
+        idxs: List[int] = []
+        out: List[List[float]] = []
+        for j, v in zip(uidxs, vectors):
+            for i in groups[uniq[j]]:
+                idxs.append(i)
+                out.append(v)
+        yield idxs, out, stats
+
+
+def _iter_api_batches(
+    texts: List[str],
+    batch_size: Optional[int],
+    batch_tokens: Optional[int],
+    concurrency: Optional[int],
+) -> Iterator[Tuple[List[int], List[List[float]], BatchStats]]:
+    """At most 2 * concurrency batches are pending at any time, so memory stays bounded."""
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    batch_tokens = batch_tokens or EMBED_BATCH_TOKENS
+    concurrency = max(1, concurrency or EMBED_CONCURRENCY)
+
+    def _run(index: int, idxs: List[int], tokens: int):
+        t0 = time.perf_counter()
+        vectors = embed_texts([texts[i] for i in idxs])
+        return idxs, vectors, BatchStats(index, len(idxs), tokens, time.perf_counter() - t0)
+
+    batches = enumerate(iter_batches(texts, batch_size, batch_tokens))
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as pool:
+        pending = set()
+        for n, (idxs, tokens) in batches:
+            pending.add(pool.submit(_run, n, idxs, tokens))
+            if len(pending) >= 2 * concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+
+
+def embed_batched(
+    texts: List[str],
+    *,
+    on_batch: Optional[Callable[[BatchStats], None]] = None,
+    **kwargs,
+) -> List[List[float]]:
+    """Embed any number of texts via iter_embedded_batches; returns vectors in input order."""
+    out: List[Optional[List[float]]] = [None] * len(texts)
+    for idxs, vectors, stats in iter_embedded_batches(texts, **kwargs):
+        for i, v in zip(idxs, vectors):
+            out[i] = v
+        report_batch(stats, on_batch)
+    return out  # type: ignore[return-value]
+
+
+def report_batch(stats: BatchStats, on_batch: Optional[Callable[[BatchStats], None]] = None) -> None:
+    if on_batch:
+        on_batch(stats)
+    elif DEBUG and stats.cached:
+        print(f"[embed] cache: {stats.items} items")
+    elif DEBUG:
+        print(
+            f"[embed] batch {stats.index}: {stats.items} items, ~{stats.tokens} tokens "
+            f"in {stats.seconds:.2f}s ({stats.items_per_s:.1f} items/s)"
+        )
@@ -1,12 +1,13 @@
 from __future__ import annotations
-import time, random
-from typing import Callable, Optional
-from openai import OpenAI
-from openai import APIError, APIConnectionError, RateLimitError, APITimeoutError, ServiceUnavailableError
+import time, inspect
+from typing import Awaitable, Callable, Optional
 
-from .config import OPENAI_API_KEY, CHAT_MODEL, REQUEST_TIMEOUT, MAX_RETRIES, STREAM_ANSWERS
-
-_client = OpenAI(api_key=OPENAI_API_KEY, timeout=REQUEST_TIMEOUT)
+from .chunking import count_tokens
+from .clients import get_async_client, get_client
+from .config import CHAT_MODEL, REQUEST_TIMEOUT, STREAM_ANSWERS, METRICS, HEDGE_REQUESTS
+from .hedging import LatencyWindow, hedged, hedged_async
+from .metrics import inc, observe, span
+from .ratelimit import limited_call, limited_call_async
 
 SYSTEM_PROMPT = (
     "You are a helpful assistant for question answering.\n"
@@ -15,31 +16,92 @@ SYSTEM_PROMPT = (
     "Be concise (max three sentences)."
 )
 
-# --- internal: retry w/ exponential backoff ---
-_RETRY_EXCS = (
-    APITimeoutError,
-    RateLimitError,
-    APIConnectionError,
-    ServiceUnavailableError,
-    APIError,
-)
+# Completion tokens reserved with the rate limiter before the reply's usage is known
+_COMPLETION_ESTIMATE = 256
 
-def _with_retries(callable_fn):
-    """
-    Run callable_fn() with exponential backoff retries on transient failures.
-    Total attempts = 1 + MAX_RETRIES.
-    """
-    attempt = 0
-    while True:
-        try:
-            return callable_fn()
-        except _RETRY_EXCS as e:
-            if attempt >= MAX_RETRIES:
-                raise
-            # Exponential backoff with jitter (1, 2, 4, 8...) + [0,1)
-            sleep_s = min(2 ** attempt, 8) + random.random()
-            time.sleep(sleep_s)
-            attempt += 1
+def _estimate(messages: list) -> int:
+    return sum(count_tokens(m["content"]) for m in messages) + _COMPLETION_ESTIMATE
+
+# --- internal: hedging (HEDGE_REQUESTS) ---
+# Latencies raced per path: streamed requests up to their first token, plain requests to the reply
+_FIRST_TOKEN = LatencyWindow("chat_stream")
+_REPLY = LatencyWindow("chat")
+
+def _delta(chunk) -> str:
+    return (getattr(chunk.choices[0].delta, "content", None) or "") if chunk.choices else ""
+
+def _open_stream(messages: list, timeout: Optional[float]):
+    """Start a streamed completion and read it up to the first token: (stream, first delta or "")."""
+    stream = limited_call(lambda: get_client().chat.completions.with_raw_response.create(
+        model=CHAT_MODEL,
+        temperature=0,
+        messages=messages,
+        stream=True,
+        timeout=timeout or REQUEST_TIMEOUT,
+    ), CHAT_MODEL, _estimate(messages))
+    try:
+        while True:
+            delta = _delta(next(stream))
+            if delta:
+                return stream, delta
+    except StopIteration:
+        return stream, ""
+    except BaseException:
+        stream.close()
+        raise
+
+async def _open_stream_async(messages: list, timeout: Optional[float]):
+    """Async twin of _open_stream; a cancelled attempt closes its stream."""
+    stream = await limited_call_async(lambda: get_async_client().chat.completions.with_raw_response.create(
+        model=CHAT_MODEL,
+        temperature=0,
+        messages=messages,
+        stream=True,
+        timeout=timeout or REQUEST_TIMEOUT,
+    ), CHAT_MODEL, _estimate(messages))
+    try:
+        while True:
+            delta = _delta(await stream.__anext__())
+            if delta:
+                return stream, delta
+    except StopAsyncIteration:
+        return stream, ""
+    except BaseException:
+        await stream.close()
+        raise
+
+def _chain(first: str, stream):
+    """The first token, then the stream's remaining deltas."""
+    if first:
+        yield first
+    for chunk in stream:
+        delta = _delta(chunk)
+        if delta:
+            yield delta
+
+async def _chain_async(first: str, stream):
+    if first:
+        yield first
+    async for chunk in stream:
+        delta = _delta(chunk)
+        if delta:
+            yield delta
+
+def _messages(question: str, context_docs: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Context:\n{context_docs}\n\nQuestion:\n{question}"},
+    ]
+
+def _record_tokens(messages: list, answer: str, usage=None) -> None:
+    """Token counters; from the API's usage when it reports one, else counted locally."""
+    if not METRICS:
+        return
+    prompt = getattr(usage, "prompt_tokens", None) or sum(count_tokens(m["content"]) for m in messages)
+    completion = getattr(usage, "completion_tokens", None) or (count_tokens(answer) if answer else 0)
+    inc("rag_tokens_total", prompt, direction="in")
+    inc("rag_tokens_total", completion, direction="out")
+    observe("rag_prompt_tokens", prompt)
 
 # --- public API ---
 def answer_from_context(
@@ -53,45 +115,96 @@ def answer_from_context(
     If stream_handler is provided or STREAM_ANSWERS=true, tokens are emitted to the handler as they arrive.
     Returns the full text either way.
     """
-    user_msg = f"Context:\n{context_docs}\n\nQuestion:\n{question}"
+    messages = _messages(question, context_docs)
     use_stream = STREAM_ANSWERS or (stream_handler is not None)
 
-    if use_stream:
-        # Streamed path
-        def _do_stream():
-            return _client.chat.completions.create(
+    with span("generate"):
+        t0 = time.perf_counter()
+        if use_stream:
+            # Streamed path: the first token is read when the stream is opened (raced when hedging)
+            if HEDGE_REQUESTS:
+                stream, first = hedged(lambda: _open_stream(messages, timeout), _FIRST_TOKEN,
+                                       discard=lambda r: r[0].close())
+            else:
+                stream, first = _open_stream(messages, timeout)
+            parts: list[str] = []
+            try:
+                # The SDK yields chunks with delta content as they arrive
+                for delta in _chain(first, stream):
+                    if not parts:
+                        observe("rag_ttft_seconds", time.perf_counter() - t0)
+                    parts.append(delta)
+                    if stream_handler:
+                        stream_handler(delta)
+            finally:
+                stream.close()  # a handler or read error mid-stream must not leak the connection
+            answer = "".join(parts).strip()
+            _record_tokens(messages, answer)
+            return answer
+
+        # Non-streaming path
+        def _do_call():
+            return limited_call(lambda: get_client().chat.completions.with_raw_response.create(
                 model=CHAT_MODEL,
                 temperature=0,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_msg},
-                ],
-                stream=True,
+                messages=messages,
                 timeout=timeout or REQUEST_TIMEOUT,
-            )
+            ), CHAT_MODEL, _estimate(messages))
 
-        stream = _with_retries(_do_stream)
-        parts: list[str] = []
-        # The SDK yields chunks with delta content as they arrive
-        for chunk in stream:
-            delta = getattr(chunk.choices[0].delta, "content", None)
-            if delta:
-                parts.append(delta)
-                if stream_handler:
-                    stream_handler(delta)
-        return "".join(parts).strip()
-
-    # Non-streaming path
-    def _do_call():
-        return _client.chat.completions.create(
-            model=CHAT_MODEL,
-            temperature=0,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_msg},
-            ],
-            timeout=timeout or REQUEST_TIMEOUT,
-        )
-
-    resp = _with_retries(_do_call)
-    return resp.choices[0].message.content.strip()
+        resp = hedged(_do_call, _REPLY) if HEDGE_REQUESTS else _do_call()
+        answer = resp.choices[0].message.content.strip()
+        _record_tokens(messages, answer, getattr(resp, "usage", None))
+        return answer
+
+
+async def answer_from_context_async(
+    question: str,
+    context_docs: str,
+    *,
+    stream_handler: Optional[Callable[[str], Optional[Awaitable]]] = None,
+    timeout: Optional[float] = None
+) -> str:
+    """
+    Same as answer_from_context, on AsyncOpenAI: never blocks the event loop.
+    stream_handler runs on the loop for every token; if it returns an awaitable
+    (e.g. a bounded asyncio.Queue.put), reading the stream waits for it, so a
+    slow consumer applies backpressure. Cancelling the caller closes the stream.
+    """
+    messages = _messages(question, context_docs)
+
+    with span("generate"):
+        t0 = time.perf_counter()
+        if STREAM_ANSWERS or stream_handler is not None:
+            if HEDGE_REQUESTS:
+                stream, first = await hedged_async(lambda: _open_stream_async(messages, timeout), _FIRST_TOKEN,
+                                                   discard=lambda r: r[0].close())
+            else:
+                stream, first = await _open_stream_async(messages, timeout)
+            parts: list[str] = []
+            try:
+                async for delta in _chain_async(first, stream):
+                    if not parts:
+                        observe("rag_ttft_seconds", time.perf_counter() - t0)
+                    parts.append(delta)
+                    if stream_handler:
+                        pending = stream_handler(delta)
+                        if inspect.isawaitable(pending):
+                            await pending
+            finally:
+                await stream.close()  # stops generation upstream if we were cancelled
+            answer = "".join(parts).strip()
+            _record_tokens(messages, answer)
+            return answer
+
+        async def _do_call():
+            return await limited_call_async(lambda: get_async_client().chat.completions.with_raw_response.create(
+                model=CHAT_MODEL,
+                temperature=0,
+                messages=messages,
+                timeout=timeout or REQUEST_TIMEOUT,
+            ), CHAT_MODEL, _estimate(messages))
+
+        resp = await (hedged_async(_do_call, _REPLY) if HEDGE_REQUESTS else _do_call())
+        answer = resp.choices[0].message.content.strip()
+        _record_tokens(messages, answer, getattr(resp, "usage", None))
+        return answer
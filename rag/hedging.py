@@ -0,0 +1,143 @@
+"""
+Hedged requests: race a second attempt against a slow first one.
+
+hedged(attempt, window) runs attempt(); if it has not returned after
+window.delay() seconds (the HEDGE_QUANTILE of the latencies recorded in the
+window, HEDGE_DELAY until HEDGE_MIN_SAMPLES were seen), a second attempt
+starts and the first one to succeed wins. The loser is cancelled (async) or
+its result is handed to `discard` when it arrives (sync: a blocked HTTP call
+cannot be interrupted). A failed attempt does not fail the request while the
+other one is still running. At most HEDGE_MAX_RATIO of requests get a second
+attempt, so a slow upstream sees little extra load.
+
+An attempt should cover the part worth racing, e.g. a streamed completion up
+to its first token.
+"""
+
+from __future__ import annotations
+import asyncio
+import inspect
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import numpy as np
+
+from .config import HEDGE_QUANTILE, HEDGE_DELAY, HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES, HEDGE_MAX_RATIO
+from .metrics import in_context, inc
+
+T = TypeVar("T")
+
+class LatencyWindow:
+    """Recent attempt latencies of one kind of request, and its hedging budget."""
+    def __init__(self, name: str, size: int = 512):
+        self.name = name
+        self._seconds: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._seconds.append(seconds)
+
+    def delay(self) -> float:
+        """Seconds to wait for the first attempt before hedging."""
+        with self._lock:
+            self.requests += 1
+            if len(self._seconds) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DELAY
+            q = float(np.quantile(np.fromiter(self._seconds, dtype=np.float64), HEDGE_QUANTILE))
+        return max(HEDGE_MIN_DELAY, q)
+
+    def allow_hedge(self) -> bool:
+        """Take a hedge from the budget (HEDGE_MAX_RATIO of the requests so far)."""
+        with self._lock:
+            if self.hedges + 1 > HEDGE_MAX_RATIO * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from .clients import pool_size
+                _executor = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix="hedge")
+    return _executor
+
+def _settled(window: LatencyWindow, started: Dict[Any, float], winner: Any, primary: Any) -> None:
+    window.record(time.perf_counter() - started[winner])
+    if len(started) > 1:
+        inc("rag_hedges_total", request=window.name, winner="primary" if winner is primary else "hedge")
+
+def hedged(attempt: Callable[[], T], window: LatencyWindow, discard: Optional[Callable[[T], Any]] = None) -> T:
+    """Run attempt() on worker threads, with a second attempt if the first is slow."""
+    pool = _pool()
+    primary = pool.submit(in_context(attempt))
+    started: Dict[Future, float] = {primary: time.perf_counter()}
+    done, _ = wait([primary], timeout=window.delay())
+    if not done and window.allow_hedge():
+        started[pool.submit(in_context(attempt))] = time.perf_counter()
+
+    pending, winner, error = set(started), None, None
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None and winner is None:
+                winner = f
+            elif f.exception() is not None:
+                error = f.exception()
+            elif discard is not None:
+                discard(f.result())  # finished together with the winner
+    if winner is None:
+        raise error
+
+    def _drop(f: Future) -> None:
+        if discard is not None and not f.cancelled() and f.exception() is None:
+            discard(f.result())
+
+    for f in pending:
+        if not f.cancel():
+            f.add_done_callback(_drop)
+    _settled(window, started, winner, primary)
+    return winner.result()
+
+async def hedged_async(
+    attempt: Callable[[], Awaitable[T]],
+    window: LatencyWindow,
+    discard: Optional[Callable[[T], Any]] = None,
+) -> T:
+    """Async twin of hedged(): attempts are tasks, the loser is cancelled."""
+    primary = asyncio.ensure_future(attempt())
+    started: Dict[asyncio.Future, float] = {primary: time.perf_counter()}
+    try:
+        done, _ = await asyncio.wait([primary], timeout=window.delay())
+        if not done and window.allow_hedge():
+            started[asyncio.ensure_future(attempt())] = time.perf_counter()
+
+        pending, winner, error = set(started), None, None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None and winner is None:
+                    winner = t
+                elif t.exception() is not None:
+                    error = t.exception()
+                elif discard is not None:
+                    pending_close = discard(t.result())
+                    if inspect.isawaitable(pending_close):
+                        await pending_close
+        if winner is None:
+            raise error
+    finally:
+        for t in started:
+            t.cancel()  # no-op for finished tasks; the attempts clean up on cancellation
+    _settled(window, started, winner, primary)
+    return winner.result()
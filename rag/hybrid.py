@@ -1,77 +1,558 @@
 """
 Hybrid retrieval utilities:
-- Build a BM25 index over chunk texts
+- Maintain a segmented BM25 sidecar over chunk texts
 - Run BM25 search
 - Fuse BM25 + vector results via Reciprocal Rank Fusion (RRF)
 
-Artifacts are saved under PERSIST_DIR so they persist across runs.
+The sidecar of the active index build (PERSIST_DIR/bm25, or bm25__b<n>
+after a background reindex, see rag.state) is a set of immutable segments
+plus a manifest:
+
+    MANIFEST.json                 generation, analyzer, live segments
+    segments/seg_N.npz            CSR postings, doc lengths, chunk ids
+    segments/seg_N.docs.json      texts + metas
+    segments/seg_N.del<gen>.npy   tombstones (deleted local doc ids)
+
+Every change (Bm25Writer.commit) writes new files first and then swaps the
+manifest with an atomic rename, so readers always see a complete index.
+New chunks append a segment; deletes and re-upserted ids become tombstones;
+a background merge compacts similar-sized segments (BM25_MERGE_FACTOR at a
+time) and drops tombstoned docs. Readers merge all live segments into one
+in-memory index, so N, avgdl and df are always global.
+
+The index is loaded once per process and kept resident; it is reloaded only
+when the manifest (or the active build) changes.
 """
 
 from __future__ import annotations
 import os
 import json
-import pickle
-from typing import Dict, List, Tuple
+import math
+import shutil
+import zipfile
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 from dataclasses import dataclass
 
-from rank_bm25 import BM25Okapi  # in requirements
+import numpy as np
+
+from .config import BM25_MERGE_FACTOR
+from .bm25 import Analyzer, Postings, SparseBm25, default_analyzer, merge_postings
+from .state import active_build
+from .metrics import timed
+
+MANIFEST_VERSION = 1
 
-from .config import PERSIST_DIR
+# Pickled rank_bm25 sidecar of earlier releases; migrated into a segment on first write
+_LEGACY_FILES = ("corpus.json", "bm25.pkl")
 
-BM25_DIR = os.path.join(PERSIST_DIR, "bm25")
-BM25_CORPUS_JSON = os.path.join(BM25_DIR, "corpus.json")   # texts + metas
-BM25_MODEL_PKL   = os.path.join(BM25_DIR, "bm25.pkl")
 
 @dataclass
 class Bm25Index:
-    bm25: BM25Okapi
+    engine: SparseBm25
     texts: List[str]
     metas: List[Dict]
+    analyzer: Analyzer
+    generation: int = 0
+
+
+# --- files ---
+def _manifest_path(directory: str) -> str:
+    return os.path.join(directory, "MANIFEST.json")
+
+def _segment_dir(directory: str) -> str:
+    return os.path.join(directory, "segments")
+
+def _atomic_write(path: str, write: Callable, binary: bool = False) -> None:
+    tmp = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8"})) as f:
+        write(f)
+    os.replace(tmp, path)
+
+def _blob(strings: List[str]) -> np.ndarray:
+    # NUL-separated UTF-8 (fixed-width string arrays waste memory)
+    return np.frombuffer("\0".join(strings).encode("utf-8"), dtype=np.uint8)
+
+def _unblob(arr: np.ndarray, n: int) -> List[str]:
+    return arr.tobytes().decode("utf-8").split("\0") if n else []
+
+def _read_manifest(directory: str) -> Optional[Dict]:
+    try:
+        with open(_manifest_path(directory), "r", encoding="utf-8") as f:
+            m = json.load(f)
+    except FileNotFoundError:
+        return None
+    if m.get("version") != MANIFEST_VERSION:
+        raise RuntimeError(f"Unsupported BM25 manifest version in {directory}; rebuild with --reindex --full")
+    return m
+
+def _write_segment(seg_dir: str, name: str, p: Postings, ids: List[str], texts: List[str], metas: List[Dict]) -> None:
+    _atomic_write(os.path.join(seg_dir, f"{name}.docs.json"), lambda f: json.dump({"texts": texts, "metas": metas}, f))
+    _atomic_write(os.path.join(seg_dir, f"{name}.npz"), lambda f: np.savez(
+        f, indptr=p.indptr, doc_ids=p.doc_ids, tfs=p.tfs, doc_len=p.doc_len,
+        vocab=_blob(p.terms), n_terms=np.asarray(len(p.terms)), ids=_blob(ids), n_ids=np.asarray(len(ids)),
+    ), binary=True)
+
+def _read_postings(seg_dir: str, name: str) -> Postings:
+    with np.load(os.path.join(seg_dir, f"{name}.npz"), allow_pickle=False) as z:
+        return Postings(_unblob(z["vocab"], int(z["n_terms"])), z["indptr"], z["doc_ids"], z["tfs"], z["doc_len"])
+
+def _read_ids(seg_dir: str, name: str) -> List[str]:
+    with np.load(os.path.join(seg_dir, f"{name}.npz"), allow_pickle=False) as z:
+        return _unblob(z["ids"], int(z["n_ids"]))
+
+def _read_docs(seg_dir: str, name: str) -> Tuple[List[str], List[Dict]]:
+    with open(os.path.join(seg_dir, f"{name}.docs.json"), "r", encoding="utf-8") as f:
+        obj = json.load(f)
+    return obj["texts"], obj["metas"]
+
+def _read_tombstones(seg_dir: str, entry: Dict) -> np.ndarray:
+    if not entry.get("tombstones"):
+        return np.zeros(0, dtype=np.int64)
+    return np.load(os.path.join(seg_dir, entry["tombstones"]), allow_pickle=False)
+
+def _segment_files(entry: Dict) -> List[str]:
+    files = [f"{entry['name']}.npz", f"{entry['name']}.docs.json"]
+    if entry.get("tombstones"):
+        files.append(entry["tombstones"])
+    return files
+
+def _alive_mask(n_docs: int, tombstones: Iterable[int]) -> Optional[np.ndarray]:
+    dead = np.fromiter(tombstones, dtype=np.int64)
+    if not len(dead):
+        return None
+    alive = np.ones(n_docs, dtype=bool)
+    alive[dead] = False
+    return alive
+
+
+# --- legacy sidecar ---
+def _load_corpus_chunks(directory: str) -> List[Dict]:
+    """Chunks of a legacy sidecar's corpus.json (texts + metas; the pickled model is not needed)."""
+    with open(os.path.join(directory, "corpus.json"), "r", encoding="utf-8") as f:
+        obj = json.load(f)
+    # Ids were not stored: rebuild them the way make_chunk_records names chunks
+    corpus: Dict[str, Dict] = {}
+    for t, m in zip(obj["texts"], obj["metas"]):
+        cid = f"{m.get('source')}_chunk{m.get('chunk')}"
+        corpus[cid] = {"id": cid, "text": t, "meta": m}
+    return list(corpus.values())
+
+def _has_legacy(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, "corpus.json"))
+
+
+# --- writer ---
+class Bm25Writer:
+    """
+    Appends to a segmented sidecar. One writer per directory at a time (the
+    ingest owns it); any number of processes may read concurrently.
+    """
+
+    def __init__(self, directory: str, manifest: Dict, merge_factor: int = BM25_MERGE_FACTOR):
+        self.directory = directory
+        self.seg_dir = _segment_dir(directory)
+        self.merge_factor = merge_factor
+        self.analyzer = Analyzer.from_config(manifest["analyzer"])
+        self.merge_error: Optional[BaseException] = None
+        self._m = manifest
+        self._lock = threading.RLock()
+        self._where: Dict[str, Tuple[str, int]] = {}   # live chunk id -> (segment, local doc id)
+        self._tombs: Dict[str, Set[int]] = {}
+        self._merger: Optional[threading.Thread] = None
+        self._merging: Set[str] = set()
+        self._deferred: List[str] = []                 # files to delete once the running merge is done
+        for e in manifest["segments"]:
+            dead = set(_read_tombstones(self.seg_dir, e).tolist())
+            self._tombs[e["name"]] = dead
+            for j, cid in enumerate(_read_ids(self.seg_dir, e["name"])):
+                if j not in dead:
+                    self._where[cid] = (e["name"], j)
+
+    @classmethod
+    def open(
+        cls,
+        directory: Optional[str] = None,
+        *,
+        seed: Optional[Callable[[], List[Dict]]] = None,
+        full: bool = False,
+    ) -> "Bm25Writer":
+        """
+        Open (or create) the sidecar. A new sidecar starts from a legacy
+        rank_bm25 sidecar (corpus.json + bm25.pkl) if present, else from
+        `seed()` (the chunks already in the vector store). If the configured
+        analyzer differs from the one the index was built with, it is only
+        adopted on a full reindex, which starts from an empty index.
+        """
+        directory = directory or active_build().bm25_dir
+        os.makedirs(_segment_dir(directory), exist_ok=True)
+        analyzer = default_analyzer()
+        m = _read_manifest(directory)
+        if m is not None and Analyzer.from_config(m["analyzer"]) != analyzer:
+            if full:
+                m = {**m, "analyzer": analyzer.to_config(), "segments": []}
+            else:
+                print("Warning: BM25 analyzer settings changed; keeping the indexed ones until a full reindex (--full).")
+        created = m is None
+        if created:
+            m = {"version": MANIFEST_VERSION, "generation": 0, "next_segment": 1,
+                 "analyzer": analyzer.to_config(), "segments": []}
+        writer = cls(directory, m)
+        if created:
+            chunks = _load_corpus_chunks(directory) if _has_legacy(directory) else (seed() if seed else [])
+            writer.commit(chunks)
+            for fn in _LEGACY_FILES:
+                path = os.path.join(directory, fn)
+                if os.path.exists(path):
+                    os.remove(path)
+        elif full and not m["segments"]:
+            writer.commit([])
+        writer._remove_orphans()
+        return writer
+
+    @property
+    def generation(self) -> int:
+        return self._m["generation"]
+
+    def live_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._where)
 
-def _tokenize(text: str) -> List[str]:
-    # Simple whitespace + lower; good baseline, replace with smarter tokenization if needed
-    return text.lower().split()
+    def commit(self, chunks: List[Dict], delete_ids: Iterable[str] = ()) -> None:
+        """
+        Atomically add chunks (replacing any live chunk with the same id) and
+        delete ids: one new segment, tombstones for the rest, then a manifest swap.
+        """
+        uniq = list({c["id"]: c for c in chunks}.values())
+        with self._lock:
+            gen = self._m["generation"] + 1
+            doomed: Dict[str, Set[int]] = {}
+            for cid in list(delete_ids) + [c["id"] for c in uniq]:
+                loc = self._where.pop(cid, None)
+                if loc is not None:
+                    doomed.setdefault(loc[0], set()).add(loc[1])
+
+            segments: List[Dict] = []
+            garbage: List[str] = []
+            for e in self._m["segments"]:
+                locs = doomed.get(e["name"])
+                if not locs:
+                    segments.append(e)
+                    continue
+                dead = self._tombs[e["name"]]
+                dead |= locs
+                if len(dead) >= e["docs"]:
+                    garbage.extend(_segment_files(e))
+                    del self._tombs[e["name"]]
+                    continue
+                if e.get("tombstones"):
+                    garbage.append(e["tombstones"])
+                tomb = f"{e['name']}.del{gen}.npy"
+                _atomic_write(os.path.join(self.seg_dir, tomb),
+                              lambda f: np.save(f, np.asarray(sorted(dead), dtype=np.int64)), binary=True)
+                segments.append({**e, "deleted": len(dead), "tombstones": tomb})
+
+            if uniq:
+                name = self._new_name()
+                p = Postings.from_tokenized(self.analyzer(c["text"]) for c in uniq)
+                _write_segment(self.seg_dir, name, p, [c["id"] for c in uniq],
+                               [c["text"] for c in uniq], [c["meta"] for c in uniq])
+                segments.append({"name": name, "docs": len(uniq), "deleted": 0, "tombstones": None})
+                self._tombs[name] = set()
+                for j, c in enumerate(uniq):
+                    self._where[c["id"]] = (name, j)
+
+            self._publish(segments, gen)
+            self._remove(garbage)
+        self._maybe_merge()
+
+    def close(self) -> None:
+        """Wait for a running background merge."""
+        merger = self._merger
+        if merger is not None:
+            merger.join()
+
+    # --- merging ---
+    def _pick_merge(self) -> List[str]:
+        """
+        Tiered policy: merge_factor segments whose live sizes share an order of
+        magnitude (in base merge_factor), smallest tier first; otherwise rewrite
+        segments that are more than a third tombstones.
+        """
+        tiers: Dict[int, List[str]] = {}
+        heavy: List[str] = []
+        for e in self._m["segments"]:
+            live = e["docs"] - e["deleted"]
+            tiers.setdefault(int(math.log(max(live, 1), self.merge_factor)), []).append(e["name"])
+            if e["deleted"] * 3 > e["docs"]:
+                heavy.append(e["name"])
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        return heavy[:self.merge_factor]
+
+    def _maybe_merge(self) -> None:
+        if self.merge_factor < 2:
+            return
+        with self._lock:
+            if self._merger is not None and self._merger.is_alive():
+                return
+            pick = self._pick_merge()
+            if not pick:
+                return
+            self._merging = set(pick)
+            self._merger = threading.Thread(target=self._merge_loop, args=(pick,), name="bm25-merge", daemon=True)
+            self._merger.start()
+
+    def _merge_loop(self, pick: List[str]) -> None:
+        try:
+            while pick:
+                self._merge(pick)
+                with self._lock:
+                    pick = self._pick_merge()
+                    self._merging = set(pick)
+        except Exception as e:
+            # The index stays valid (merges only publish on success); retried after the next commit
+            self.merge_error = e
+            print(f"Warning: BM25 segment merge failed: {e}")
+        finally:
+            with self._lock:
+                self._merging = set()
+                deferred, self._deferred = self._deferred, []
+            self._remove(deferred)
+
+    def _merge(self, pick: List[str]) -> None:
+        with self._lock:
+            pick = [n for n in pick if n in self._tombs]  # a commit may have dropped a fully deleted one
+            if not pick:
+                return
+            snap = {n: set(self._tombs[n]) for n in pick}
+            name = self._new_name()
+
+        parts, ids, old_locs, texts, metas = [], [], [], [], []
+        for n in pick:
+            p = _read_postings(self.seg_dir, n)
+            seg_ids = _read_ids(self.seg_dir, n)
+            seg_texts, seg_metas = _read_docs(self.seg_dir, n)
+            alive = _alive_mask(p.n_docs, snap[n])
+            parts.append((p, alive))
+            for j in range(p.n_docs):
+                if alive is None or alive[j]:
+                    ids.append(seg_ids[j])
+                    old_locs.append((n, j))
+                    texts.append(seg_texts[j])
+                    metas.append(seg_metas[j])
+        merged, remaps = merge_postings(parts)
+        _write_segment(self.seg_dir, name, merged, ids, texts, metas)
+
+        with self._lock:
+            gen = self._m["generation"] + 1
+            current = {e["name"]: e for e in self._m["segments"]}
+            # Docs deleted (or re-upserted elsewhere) while we were merging stay deleted
+            dead: Set[int] = set()
+            for n, remap in zip(pick, remaps):
+                gone = self._tombs[n] - snap[n] if n in current else range(len(remap))
+                dead.update(int(remap[j]) for j in gone if remap[j] >= 0)
+            for j, (cid, loc) in enumerate(zip(ids, old_locs)):
+                if self._where.get(cid) == loc:
+                    self._where[cid] = (name, j)
+
+            garbage = [fn for n in pick if n in current for fn in _segment_files(current[n])]
+            segments = [e for e in self._m["segments"] if e["name"] not in pick]
+            if len(dead) < len(ids):
+                entry = {"name": name, "docs": len(ids), "deleted": len(dead), "tombstones": None}
+                if dead:
+                    entry["tombstones"] = f"{name}.del{gen}.npy"
+                    _atomic_write(os.path.join(self.seg_dir, entry["tombstones"]),
+                                  lambda f: np.save(f, np.asarray(sorted(dead), dtype=np.int64)), binary=True)
+                first = next((i for i, e in enumerate(self._m["segments"]) if e["name"] in pick), 0)
+                segments.insert(min(first, len(segments)), entry)
+                self._tombs[name] = dead
+            else:
+                garbage.extend(_segment_files({"name": name}))  # everything was deleted meanwhile
+            for n in pick:
+                self._tombs.pop(n, None)
+            self._publish(segments, gen)
+            self._remove(garbage)
+
+    # --- internals ---
+    def _new_name(self) -> str:
+        n = self._m["next_segment"]
+        self._m["next_segment"] = n + 1
+        return f"seg_{n:06d}"
+
+    def _publish(self, segments: List[Dict], generation: int) -> None:
+        m = {**self._m, "generation": generation, "segments": segments}
+        _atomic_write(_manifest_path(self.directory), lambda f: json.dump(m, f))  # the commit point
+        self._m = m
+
+    def _remove(self, files: List[str]) -> None:
+        with self._lock:
+            # Files of segments a running merge is reading are deleted once it finishes
+            busy = tuple(f"{n}." for n in self._merging)
+            if busy:
+                self._deferred.extend(fn for fn in files if fn.startswith(busy))
+                files = [fn for fn in files if not fn.startswith(busy)]
+        for fn in files:
+            try:
+                os.remove(os.path.join(self.seg_dir, fn))
+            except FileNotFoundError:
+                pass
+
+    def _remove_orphans(self) -> None:
+        """Delete segment files no manifest refers to (left by an interrupted commit or merge)."""
+        live = {fn for e in self._m["segments"] for fn in _segment_files(e)}
+        self._remove([fn for fn in os.listdir(self.seg_dir) if fn not in live])
+
+
+def copy_bm25(src: str, dst: str) -> bool:
+    """
+    Seed the sidecar directory dst (replaced if present) with a snapshot of src.
+    Segment files are immutable, so they are hard-linked (copied where links
+    are unsupported); the manifest and legacy files are copied. False if src
+    has no sidecar.
+    """
+    if not bm25_exists(src):
+        return False
+    shutil.rmtree(dst, ignore_errors=True)
+    os.makedirs(_segment_dir(dst))
+    m = _read_manifest(src)
+    if m is None:
+        for fn in _LEGACY_FILES:
+            if os.path.exists(os.path.join(src, fn)):
+                shutil.copy2(os.path.join(src, fn), os.path.join(dst, fn))
+        return True
+    for fn in (fn for e in m["segments"] for fn in _segment_files(e)):
+        a, b = os.path.join(_segment_dir(src), fn), os.path.join(_segment_dir(dst), fn)
+        try:
+            os.link(a, b)
+        except OSError:
+            shutil.copy2(a, b)
+    _atomic_write(_manifest_path(dst), lambda f: json.dump(m, f))
+    return True
 
 def build_bm25_index(chunks: List[Dict]) -> None:
     """
+    Replace the sidecar's contents with exactly these chunks.
     chunks: [{"id": "...", "text": "...", "meta": {...}}, ...]
     """
-    if not chunks:
-        return
-    os.makedirs(BM25_DIR, exist_ok=True)
-    texts = [c["text"] for c in chunks]
-    metas = [c["meta"] for c in chunks]
-    tokenized = [_tokenize(t) for t in texts]
-    bm25 = BM25Okapi(tokenized)
-
-    # Persist model + corpus/meta
-    with open(BM25_MODEL_PKL, "wb") as f:
-        pickle.dump(bm25, f)
-    with open(BM25_CORPUS_JSON, "w", encoding="utf-8") as f:
-        json.dump({"texts": texts, "metas": metas}, f)
-
-def load_bm25_index() -> Bm25Index | None:
-    if not (os.path.exists(BM25_MODEL_PKL) and os.path.exists(BM25_CORPUS_JSON)):
-        return None
-    with open(BM25_MODEL_PKL, "rb") as f:
-        bm25 = pickle.load(f)
-    with open(BM25_CORPUS_JSON, "r", encoding="utf-8") as f:
-        obj = json.load(f)
-    return Bm25Index(bm25=bm25, texts=obj["texts"], metas=obj["metas"])
+    writer = Bm25Writer.open()
+    writer.commit(chunks, delete_ids=writer.live_ids())
+    writer.close()
+
+def bm25_exists(directory: Optional[str] = None) -> bool:
+    directory = directory or active_build().bm25_dir
+    return os.path.exists(_manifest_path(directory)) or _has_legacy(directory)
+
+
+# --- reader ---
+# Segment files are immutable: keyed by file identity, so a build whose segments
+# are hard links of the previous build's reuses the parsed docs
+_docs_cache: Dict[Tuple, Tuple[List[str], List[Dict]]] = {}
+
+def load_bm25_index(directory: Optional[str] = None) -> Bm25Index | None:
+    """
+    Read the sidecar from disk and merge its live segments into one index
+    (retrying if a concurrent commit or merge removes a segment mid-read).
+    """
+    directory = directory or active_build().bm25_dir
+    seg_dir = _segment_dir(directory)
+    for _ in range(5):
+        m = _read_manifest(directory)
+        if m is None:
+            if not _has_legacy(directory):
+                return None
+            # Sidecar from before segments: index its corpus in memory until the next ingest migrates it
+            chunks = _load_corpus_chunks(directory)
+            analyzer = default_analyzer()
+            engine = SparseBm25.build(analyzer(c["text"]) for c in chunks)
+            return Bm25Index(engine, [c["text"] for c in chunks], [c["meta"] for c in chunks], analyzer)
+        try:
+            parts, texts, metas, keys = [], [], [], set()
+            for e in m["segments"]:
+                p = _read_postings(seg_dir, e["name"])
+                alive = _alive_mask(p.n_docs, _read_tombstones(seg_dir, e).tolist())
+                st = os.stat(os.path.join(seg_dir, f"{e['name']}.docs.json"))
+                key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+                if key not in _docs_cache:
+                    _docs_cache[key] = _read_docs(seg_dir, e["name"])
+                seg_texts, seg_metas = _docs_cache[key]
+                keys.add(key)
+                if alive is None:
+                    texts.extend(seg_texts)
+                    metas.extend(seg_metas)
+                else:
+                    texts.extend(t for t, ok in zip(seg_texts, alive) if ok)
+                    metas.extend(x for x, ok in zip(seg_metas, alive) if ok)
+                parts.append((p, alive))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            continue
+        if len(parts) == 1 and parts[0][1] is None:
+            postings = parts[0][0]
+        else:
+            postings, _ = merge_postings(parts)
+        for key in [k for k in _docs_cache if k not in keys]:
+            del _docs_cache[key]
+        return Bm25Index(SparseBm25.from_postings(postings), texts, metas,
+                         Analyzer.from_config(m["analyzer"]), m["generation"])
+    raise RuntimeError("BM25 sidecar kept changing while loading; try again")
+
+# --- resident index ---
+_resident: Optional[Bm25Index] = None
+_resident_key: Optional[Tuple] = None
+_resident_lock = threading.Lock()
+
+def _sidecar_key(directory: str) -> Optional[Tuple]:
+    """Cheap change detector: one stat() of the manifest (or the corpus, for old sidecars)."""
+    for path in (_manifest_path(directory), os.path.join(directory, "corpus.json")):
+        try:
+            st = os.stat(path)
+            return (path, st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            continue
+    return None
 
+def get_bm25_index() -> Bm25Index | None:
+    """
+    Process-wide resident BM25 index. Loaded on first use and reloaded only when
+    the sidecar (or the active build) changes. The returned object is never
+    mutated, so callers can keep using it while a reload swaps in a newer one.
+    """
+    global _resident, _resident_key
+    directory = active_build().bm25_dir
+    key = _sidecar_key(directory)
+    idx = _resident
+    if idx is not None and key == _resident_key:
+        return idx
+    with _resident_lock:
+        if _resident is not None and key == _resident_key:
+            return _resident
+        _resident = load_bm25_index(directory) if key is not None else None
+        _resident_key = key
+        return _resident
+
+@timed("bm25")
 def bm25_search(query: str, k: int = 20) -> Tuple[List[str], List[Dict], List[float]]:
-    idx = load_bm25_index()
-    if not idx:
+    idx = get_bm25_index()
+    if not idx or not idx.texts:
         return [], [], []
-    tokenized_q = _tokenize(query)
-    scores = idx.bm25.get_scores(tokenized_q)
-    # rank top-k
-    ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:k]
-    docs = [idx.texts[i] for i, _ in ranked]
-    metas = [idx.metas[i] for i, _ in ranked]
-    scs  = [float(s) for _, s in ranked]
+    top, scores = idx.engine.top_k(idx.analyzer(query), k)
+    docs = [idx.texts[i] for i in top]
+    metas = [idx.metas[i] for i in top]
+    scs  = [float(s) for s in scores]
     return docs, metas, scs
 
+@timed("bm25_many")
+def bm25_search_many(queries: List[str], k: int = 20) -> List[Tuple[List[str], List[Dict], List[float]]]:
+    """bm25_search for a batch of queries, scored in one pass (SparseBm25.top_k_many)."""
+    idx = get_bm25_index()
+    if not idx or not idx.texts:
+        return [([], [], []) for _ in queries]
+    out = []
+    for top, scores in idx.engine.top_k_many([idx.analyzer(q) for q in queries], k):
+        out.append(([idx.texts[i] for i in top], [idx.metas[i] for i in top], [float(s) for s in scores]))
+    return out
+
 def rrf_fuse(
     a_metas: List[Dict],    # list of metas in rank order (method A)
     b_metas: List[Dict],    # list of metas in rank order (method B)
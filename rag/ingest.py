@@ -0,0 +1,232 @@
+"""
+Streaming ingest: load -> chunk -> embed -> upsert.
+
+Documents are parsed lazily (rag.loaders.iter_documents, optionally in a
+process pool), chunked one file at a time and handed through a bounded queue
+to a writer thread that embeds and upserts batches of ~INGEST_BATCH_SIZE
+chunks. Peak memory is bounded by the queue depth and batch size rather than
+by the corpus, and chunks land in the index while the ingest is running.
+
+A file's manifest entry is journaled only after the batch holding its chunks
+(and their BM25 segment) has been written, so an interrupted ingest resumes
+from the last committed batch.
+"""
+
+from __future__ import annotations
+import time
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from .config import DATA_DIR, USE_HYBRID, INGEST_BATCH_SIZE, INGEST_QUEUE_DEPTH
+from .loaders import LoadReport, iter_documents
+from .chunking import make_chunk_records
+from .storage import get_collection, add_chunks, delete_chunks, get_all_chunks
+from .metrics import span
+from .hybrid import Bm25Writer
+from .manifest import FileEntry, IngestManifest, manifest_path
+
+
+@dataclass
+class IngestProgress:
+    files_total: int = 0        # files that needed (re)loading
+    files_done: int = 0
+    files_failed: int = 0
+    files_unchanged: int = 0
+    files_removed: int = 0
+    chunks: int = 0
+    stale_deleted: int = 0
+    batches: int = 0
+    embedded: int = 0           # chunks that went to the embeddings API (cache misses)
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def embeddings_per_s(self) -> float:
+        return self.embedded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        if not self.files_total and not self.files_removed:
+            return f"Index up to date ({self.files_unchanged} unchanged files)."
+        failed = f", {self.files_failed} failed" if self.files_failed else ""
+        return (
+            f"Indexed {self.chunks} chunks from {self.files_done} files "
+            f"({self.files_unchanged} unchanged, {self.files_removed} removed{failed}, "
+            f"{self.stale_deleted} stale chunks deleted) in {self.elapsed:.2f}s."
+        )
+
+
+@dataclass
+class _FileWork:
+    rel_id: str
+    records: List[Dict]
+    stale: List[str]
+    entry: FileEntry
+
+
+_DONE = object()
+
+
+class _Writer(threading.Thread):
+    """Consumes per-file work from a bounded queue; embeds, upserts and commits in batches."""
+
+    def __init__(self, collection, manifest: IngestManifest, bm25: Optional[Bm25Writer], batch_size: int,
+                 queue_depth: int, prog: IngestProgress,
+                 progress: Optional[Callable[[IngestProgress], None]]):
+        super().__init__(name="ingest-writer", daemon=True)
+        self.collection = collection
+        self.manifest = manifest
+        self.bm25 = bm25
+        self.batch_size = batch_size
+        self.prog = prog
+        self.progress = progress
+        self.q: "queue.Queue[object]" = queue.Queue(maxsize=queue_depth)
+        self.error: Optional[BaseException] = None
+
+    def put(self, item: object) -> None:
+        # Never block forever on a full queue if the writer has died
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"Ingest writer failed: {self.error}") from self.error
+            try:
+                self.q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> None:
+        if self.is_alive():
+            self.put(_DONE)
+        self.join()
+        if self.error is not None:
+            raise RuntimeError(f"Ingest writer failed: {self.error}") from self.error
+
+    def run(self) -> None:
+        files: List[_FileWork] = []
+        n_records = 0
+        try:
+            while True:
+                item = self.q.get()
+                if item is _DONE:
+                    break
+                files.append(item)
+                n_records += len(item.records)
+                if n_records >= self.batch_size:
+                    self._flush(files)
+                    files, n_records = [], 0
+            self._flush(files)
+        except BaseException as e:
+            self.error = e
+
+    def _flush(self, files: List[_FileWork]) -> None:
+        if not files:
+            return
+        records = [r for f in files for r in f.records]
+        stale = [cid for f in files for cid in f.stale]
+
+        def _count(stats):
+            if not stats.cached:
+                self.prog.embedded += stats.items
+
+        delete_chunks(stale, self.collection)
+        add_chunks(records, self.collection, on_batch=_count)
+        if self.bm25:
+            with span("bm25_index"):
+                self.bm25.commit(records, stale)
+        self.manifest.commit([(f.rel_id, f.entry) for f in files])
+
+        self.prog.files_done += len(files)
+        self.prog.chunks += len(records)
+        self.prog.stale_deleted += len(stale)
+        self.prog.batches += 1
+        if self.progress:
+            self.progress(self.prog)
+
+
+def run_ingest(
+    data_dir: Optional[str] = None,
+    *,
+    collection=None,
+    bm25_dir: Optional[str] = None,
+    hybrid: Optional[bool] = None,
+    full: bool = False,
+    progress: Optional[Callable[[IngestProgress], None]] = None,
+    batch_size: Optional[int] = None,
+    queue_depth: Optional[int] = None,
+) -> IngestProgress:
+    """
+    Incrementally ingest data_dir into `collection` (default: the active build's),
+    with that collection's manifest and the BM25 sidecar in `bm25_dir` (default:
+    the active build's). `progress` is called after every committed batch.
+    """
+    data_dir = data_dir or DATA_DIR
+    collection = collection if collection is not None else get_collection()
+    hybrid = USE_HYBRID if hybrid is None else hybrid
+
+    manifest = IngestManifest.load(manifest_path(collection.name))
+    plan = manifest.plan(data_dir, full=full)
+    bm25 = Bm25Writer.open(bm25_dir, seed=lambda: get_all_chunks(collection), full=full) if hybrid else None
+    prog = IngestProgress(
+        files_total=len(plan.to_load),
+        files_unchanged=len(plan.unchanged),
+        files_removed=len(plan.removed),
+    )
+
+    # Removed files and touched-but-identical files need no embedding: commit them up front
+    removed_ids = [cid for rel_id in plan.removed for cid in manifest.chunk_ids(rel_id)]
+    if removed_ids:
+        delete_chunks(removed_ids, collection)
+        if bm25:
+            bm25.commit([], removed_ids)
+        prog.stale_deleted += len(removed_ids)
+    manifest.commit(
+        [(rel_id, manifest.entry(rel_id, plan.fingerprints[rel_id])) for rel_id in plan.unchanged
+         if rel_id in plan.fingerprints],
+        forgets=plan.removed,
+    )
+
+    if plan.to_load:
+        writer = _Writer(
+            collection, manifest, bm25, batch_size or INGEST_BATCH_SIZE,
+            queue_depth or INGEST_QUEUE_DEPTH, prog, progress,
+        )
+        writer.start()
+        report = LoadReport()
+        try:
+            for doc in iter_documents(data_dir, only=[rel_id for _, rel_id in plan.to_load], report=report):
+                rel_id = doc["id"]
+                records = make_chunk_records(rel_id, doc["text"])
+                new_ids = [r["id"] for r in records]
+                keep = set(new_ids)
+                writer.put(_FileWork(
+                    rel_id=rel_id,
+                    records=records,
+                    stale=[cid for cid in manifest.chunk_ids(rel_id) if cid not in keep],
+                    entry=manifest.entry(rel_id, plan.fingerprints[rel_id], new_ids),
+                ))
+            for e in report.errors:
+                if e.kind == "empty":
+                    # Parsed fine but has no text: drop its old chunks, remember it as indexed
+                    writer.put(_FileWork(e.rel_id, [], manifest.chunk_ids(e.rel_id),
+                                         manifest.entry(e.rel_id, plan.fingerprints[e.rel_id], [])))
+                else:
+                    # Failed files keep their previous chunks and manifest entry; retried next run
+                    print(f"Warning: {e.rel_id}: {e.kind}: {e.message}")
+                    prog.files_failed += 1
+        finally:
+            writer.close()
+
+    if bm25:
+        bm25.close()  # let a running segment merge finish
+    manifest.save()
+    prog.finished = time.perf_counter()
+    return prog
@@ -1,7 +1,11 @@
-
+def format_source(m) -> str:
+    """path#chunkN, plus @start-end (character offsets in the extracted text) when the chunk has a span."""
+    ref = f"{m.get('source')}#chunk{m.get('chunk')}"
+    if m.get("start") is not None and m.get("end") is not None:
+        ref += f"@{m['start']}-{m['end']}"
+    return ref
 
 def format_sources(metas):
     if not metas:
         return "Sources: (none)"
-    parts = [f"{m.get('source')}#chunk{m.get('chunk')}" for m in metas]
-    return "Sources: " + ", ".join(parts)
+    return "Sources: " + ", ".join(format_source(m) for m in metas)
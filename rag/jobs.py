@@ -0,0 +1,242 @@
+"""
+Background reindex jobs with double-buffered index builds.
+
+A job never writes to the build queries are reading (see rag.state):
+  1. seed a staging build n+1 from the active build n: Chroma rows are copied
+     with their stored embeddings, BM25 segments are hard-linked (they are
+     immutable) and the ingest manifest is copied; full=True starts empty
+     instead (unchanged texts still come from the embedding cache);
+  2. run the incremental ingest against the staging build;
+  3. switch ACTIVE_INDEX.json to it atomically (which also bumps the cache
+     generation).
+Queries resolve the active build per call, so in-flight ones finish on the
+old build. Older builds are deleted INDEX_GC_DELAY seconds after a switch
+(failed staging builds right away).
+
+Jobs run one at a time per process, in submission order, and hold the
+cross-process index lock (rag.state.index_lock) from choosing the staging
+build until it is active, as does build GC, so jobs started by different
+API workers queue instead of writing into the same build or deleting one
+another is using. Their status is kept in memory for the last JOB_HISTORY
+jobs.
+
+A job without use_hybrid builds a BM25 sidecar when USE_HYBRID is set or
+the active build has one. An explicit use_hybrid=False is refused while the
+active build has a sidecar: its build would have none, silently turning
+hybrid retrieval off for every reader.
+"""
+
+from __future__ import annotations
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from .config import DATA_DIR, USE_HYBRID, INDEX_GC_DELAY, JOB_HISTORY
+from .hybrid import bm25_exists, copy_bm25
+from .ingest import IngestProgress, run_ingest
+from .manifest import manifest_path
+from .state import IndexBuild, active_build, activate_build, index_build, index_lock, parse_build
+from .storage import copy_collection, drop_collection, get_collection, list_collection_names
+
+
+@dataclass
+class Job:
+    id: str
+    data_dir: str
+    hybrid: bool
+    full: bool
+    use_hybrid: Optional[bool] = None  # as requested; None follows the active build
+    status: str = "queued"          # queued | running | done | failed
+    phase: str = ""                 # waiting (for another worker's job) | copying | ingesting | activating
+    build: Optional[int] = None     # staging build number
+    copied: int = 0                 # rows copied from the active build
+    progress: Optional[IngestProgress] = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        p = self.progress
+        return {
+            "id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "build": self.build,
+            "data_dir": self.data_dir,
+            "hybrid": self.hybrid,
+            "full": self.full,
+            "copied_chunks": self.copied,
+            "files_total": p.files_total if p else 0,
+            "files_done": p.files_done if p else 0,
+            "files_failed": p.files_failed if p else 0,
+            "files_unchanged": p.files_unchanged if p else 0,
+            "files_removed": p.files_removed if p else 0,
+            "chunks": p.chunks if p else 0,
+            "embedded": p.embedded if p else 0,
+            "chunks_per_s": round(p.chunks_per_s, 1) if p else 0.0,
+            "embeddings_per_s": round(p.embeddings_per_s, 1) if p else 0.0,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "elapsed_seconds": round((self.finished or time.time()) - self.started, 3) if self.started else 0.0,
+        }
+
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_jobs_lock = threading.Lock()
+_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reindex")
+
+
+def submit_reindex(data_dir: Optional[str] = None, use_hybrid: Optional[bool] = None, full: bool = False) -> Job:
+    """
+    Queue a staged reindex; returns immediately with the job (poll get_job(job.id)).
+    Raises ValueError for use_hybrid=False while the active build has a BM25 sidecar.
+    """
+    active = active_build()
+    job = Job(
+        id=uuid.uuid4().hex[:12],
+        data_dir=data_dir or DATA_DIR,
+        hybrid=_wants_hybrid(use_hybrid, active),
+        full=full,
+        use_hybrid=use_hybrid,
+    )
+    _check_hybrid(job, active)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > JOB_HISTORY:
+            oldest = next(iter(_jobs.values()))
+            if oldest.status in ("queued", "running"):
+                break
+            _jobs.popitem(last=False)
+    _runner.submit(_run, job)
+    return job
+
+
+def _wants_hybrid(use_hybrid: Optional[bool], active: IndexBuild) -> bool:
+    if use_hybrid is None:
+        return USE_HYBRID or bm25_exists(active.bm25_dir)
+    return use_hybrid
+
+
+def _check_hybrid(job: Job, active: IndexBuild) -> None:
+    if not job.hybrid and bm25_exists(active.bm25_dir):
+        raise ValueError("the active index has a BM25 sidecar; a reindex without use_hybrid would drop it "
+                         "and turn hybrid retrieval off for every reader (reindex with use_hybrid=true)")
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    return _jobs.get(job_id)
+
+
+def list_jobs() -> List[Job]:
+    with _jobs_lock:
+        return list(_jobs.values())
+
+
+def _run(job: Job) -> None:
+    job.status, job.started = "running", time.time()
+    job.phase = "waiting"
+    try:
+        with index_lock():
+            _build_and_activate(job)
+        _schedule_gc(INDEX_GC_DELAY)
+        job.status = "done"
+    except Exception as e:
+        job.status, job.error = "failed", str(e)
+        print(f"Warning: reindex job {job.id} failed: {e}")
+    finally:
+        job.finished = time.time()
+
+
+def _build_and_activate(job: Job) -> None:
+    """Steps 1-3 above; the caller holds the index lock. A failed staging build is removed."""
+    active = active_build()
+    job.hybrid = _wants_hybrid(job.use_hybrid, active)
+    _check_hybrid(job, active)
+    staging = index_build(active.build + 1)
+    job.build = staging.build
+    try:
+        _drop_build(staging)  # leftovers of a crashed job
+
+        collection = get_collection(staging.collection)
+        if not job.full:
+            job.phase = "copying"
+            job.copied = copy_collection(get_collection(active.collection), collection,
+                                         on_batch=lambda n: setattr(job, "copied", n))
+            _copy_manifest(active.collection, staging.collection)
+            if job.hybrid:
+                copy_bm25(active.bm25_dir, staging.bm25_dir)
+
+        job.phase = "ingesting"
+        job.progress = run_ingest(
+            job.data_dir, collection=collection, bm25_dir=staging.bm25_dir, hybrid=job.hybrid, full=job.full,
+            progress=lambda p: setattr(job, "progress", p),
+        )
+
+        job.phase = "activating"
+        if active_build() != active:
+            raise RuntimeError("the active index changed while this job was running; resubmit it")
+        activate_build(staging)
+        print(f"[reindex {job.id}] {job.progress.summary()} Active build: {staging.build}.")
+    except Exception:
+        if active_build() != staging:
+            try:
+                _drop_build(staging)
+            except Exception as cleanup_error:
+                print(f"Warning: could not remove staging build {staging.build}: {cleanup_error}")
+        raise
+
+
+def _copy_manifest(src_collection: str, dst_collection: str) -> None:
+    src, dst = manifest_path(src_collection), manifest_path(dst_collection)
+    for suffix in ("", ".journal"):
+        if os.path.exists(src + suffix):
+            shutil.copy2(src + suffix, dst + suffix)
+
+
+def _drop_build(build: IndexBuild) -> None:
+    drop_collection(build.collection)
+    shutil.rmtree(build.bm25_dir, ignore_errors=True)
+    path = manifest_path(build.collection)
+    for suffix in ("", ".journal", ".tmp"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def gc_builds(keep: Iterable[int] = ()) -> List[int]:
+    """
+    Delete the builds older than the active one, except `keep`; returns the
+    builds removed. Runs under the index lock, so no job is switching builds
+    meanwhile; newer builds are staging builds of jobs.
+    """
+    with index_lock():
+        active = active_build().build
+        found = {b for b in (parse_build(name) for name in list_collection_names()) if b is not None}
+        removed = []
+        for b in sorted(b for b in found - set(keep) if b < active):
+            _drop_build(index_build(b))
+            removed.append(b)
+        return removed
+
+
+def _schedule_gc(delay: float) -> None:
+    """Collect old builds once queries that started on them have had `delay` seconds to finish."""
+    def collect():
+        try:
+            removed = gc_builds()
+            if removed:
+                print(f"[reindex] removed old index builds: {removed}")
+        except Exception as e:
+            print(f"Warning: index build GC failed: {e}")
+
+    timer = threading.Timer(max(0.0, delay), collect)
+    timer.daemon = True
+    timer.start()
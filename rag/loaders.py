@@ -14,11 +14,22 @@ Each loader returns a list of {"id": <relative-path>, "text": <string>} dicts.
 Notes:
 - Binary/scanned PDFs are not OCR'd.
 - CSVs are flattened conservatively to keep things readable.
+- With LOAD_WORKERS > 1, files are parsed in a pool of worker processes
+  (chunked dispatch, per-file LOAD_TIMEOUT); per-file failures are collected
+  in a LoadReport instead of being printed.
 """
 
 from __future__ import annotations
 import os
-from typing import Dict, List, Iterable, Tuple
+import time
+import multiprocessing as mp
+from multiprocessing.connection import wait as wait_conns
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterator, List, Iterable, Optional, Tuple
+
+from .config import LOAD_WORKERS, LOAD_TIMEOUT, LOAD_CHUNKSIZE, LOAD_START_METHOD
+from .metrics import observe, span
 
 # Optional deps are already in requirements; import guarded so repo still imports gracefully
 try:
@@ -92,73 +103,52 @@ def _load_md(path: str) -> str:
 
 def _load_pdf(path: str) -> str:
     if PdfReader is None:
-        print("Warning: pypdf not installed; skipping PDF:", path)
-        return ""
-    try:
-        reader = PdfReader(path)
-        parts = []
-        for page in reader.pages:
-            txt = page.extract_text() or ""
-            if txt:
-                parts.append(txt)
-        return "\n".join(parts).strip()
-    except Exception as e:
-        print(f"Error reading PDF {path}: {e}")
-        return ""
+        raise RuntimeError("pypdf not installed; skipping PDF")
+    reader = PdfReader(path)
+    parts = []
+    for page in reader.pages:
+        txt = page.extract_text() or ""
+        if txt:
+            parts.append(txt)
+    return "\n".join(parts).strip()
 
 
 def _load_docx(path: str) -> str:
     if docx is None:
-        print("Warning: python-docx not installed; skipping DOCX:", path)
-        return ""
-    try:
-        d = docx.Document(path)
-        paras = [p.text for p in d.paragraphs if p.text and p.text.strip()]
-        return "\n".join(paras).strip()
-    except Exception as e:
-        print(f"Error reading DOCX {path}: {e}")
-        return ""
+        raise RuntimeError("python-docx not installed; skipping DOCX")
+    d = docx.Document(path)
+    paras = [p.text for p in d.paragraphs if p.text and p.text.strip()]
+    return "\n".join(paras).strip()
 
 
 def _load_html(path: str) -> str:
-    raw = _read_text(path)
     if BeautifulSoup is None:
-        print("Warning: beautifulsoup4 not installed; returning raw HTML:", path)
-        return raw
-    try:
-        soup = BeautifulSoup(raw, "lxml")
-        # Remove script/style
-        for tag in soup(["script", "style", "noscript"]):
-            tag.extract()
-        return soup.get_text(separator="\n").strip()
-    except Exception as e:
-        print(f"Error parsing HTML {path}: {e}")
-        return raw
+        raise RuntimeError("beautifulsoup4 not installed; skipping HTML")
+    soup = BeautifulSoup(_read_text(path), "lxml")
+    # Remove script/style
+    for tag in soup(["script", "style", "noscript"]):
+        tag.extract()
+    return soup.get_text(separator="\n").strip()
 
 
 def _load_csv(path: str, max_rows: int = 5000) -> str:
     if pd is None:
-        print("Warning: pandas not installed; skipping CSV:", path)
-        return ""
-    try:
-        df = pd.read_csv(path)
-        if len(df) > max_rows:
-            df = df.iloc[:max_rows].copy()
-        # Flatten: "col1: v1 | col2: v2"
-        cols = list(map(str, df.columns))
-        rows = []
-        for _, row in df.iterrows():
-            cells = []
-            for c in cols:
-                val = row[c]
-                # Cast cleanly and collapse newlines/tabs
-                sval = str(val).replace("\n", " ").replace("\r", " ").replace("\t", " ").strip()
-                cells.append(f"{c}: {sval}")
-            rows.append(" | ".join(cells))
-        return "\n".join(rows).strip()
-    except Exception as e:
-        print(f"Error reading CSV {path}: {e}")
-        return ""
+        raise RuntimeError("pandas not installed; skipping CSV")
+    df = pd.read_csv(path)
+    if len(df) > max_rows:
+        df = df.iloc[:max_rows].copy()
+    # Flatten: "col1: v1 | col2: v2"
+    cols = list(map(str, df.columns))
+    rows = []
+    for _, row in df.iterrows():
+        cells = []
+        for c in cols:
+            val = row[c]
+            # Cast cleanly and collapse newlines/tabs
+            sval = str(val).replace("\n", " ").replace("\r", " ").replace("\t", " ").strip()
+            cells.append(f"{c}: {sval}")
+        rows.append(" | ".join(cells))
+    return "\n".join(rows).strip()
 
 
 def _load_one(path: str) -> str:
@@ -178,22 +168,238 @@ def _load_one(path: str) -> str:
     return ""
 
 
-def load_documents(directory_path: str) -> List[Dict[str, str]]:
+@dataclass
+class LoadError:
+    rel_id: str
+    path: str
+    kind: str       # "error" | "empty" | "timeout" | "crash"
+    message: str
+
+
+@dataclass
+class LoadReport:
+    loaded: int = 0
+    errors: List[LoadError] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def failed_ids(self) -> List[str]:
+        """Files that could not be parsed (empty files are not failures)."""
+        return [e.rel_id for e in self.errors if e.kind != "empty"]
+
+    def summary(self) -> str:
+        kinds: Dict[str, int] = {}
+        for e in self.errors:
+            kinds[e.kind] = kinds.get(e.kind, 0) + 1
+        extra = ", ".join(f"{n} {k}" for k, n in sorted(kinds.items()))
+        return f"loaded {self.loaded} files in {self.seconds:.2f}s" + (f" ({extra})" if extra else "")
+
+
+def _worker_main(conn) -> None:
+    """Worker process: receive chunks of (abs_path, rel_id), report each file back."""
+    while True:
+        try:
+            items = conn.recv()
+        except EOFError:
+            return
+        if items is None:
+            return
+        for abs_path, rel_id in items:
+            conn.send(("start", rel_id))
+            try:
+                conn.send(("ok", rel_id, _load_one(abs_path)))
+            except Exception as e:
+                conn.send(("error", rel_id, f"{type(e).__name__}: {e}"))
+        conn.send(("idle",))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        self.proc.start()
+        child.close()
+        self.items: Deque[Tuple[str, str]] = deque()   # assigned, not yet finished
+        self.current: Optional[Tuple[str, str]] = None
+        self.started = 0.0
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.items)
+
+    def assign(self, items: List[Tuple[str, str]]) -> None:
+        self.items.extend(items)
+        self.conn.send(items)
+
+    def kill(self) -> None:
+        self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+
+
+def _iter_parallel(
+    paths: Iterable[Tuple[str, str]],
+    workers: int,
+    timeout: float,
+    chunksize: int,
+    report: LoadReport,
+) -> Iterator[Dict[str, str]]:
+    """
+    Fan files out over `workers` processes in chunks of `chunksize`; yield docs in
+    completion order. A file exceeding `timeout` seconds (or crashing its worker)
+    gets its worker killed and replaced; the rest of that worker's chunk is requeued.
+    """
+    ctx = mp.get_context(LOAD_START_METHOD or None)
+    source = iter(paths)
+    requeued: Deque[List[Tuple[str, str]]] = deque()
+
+    def next_chunk() -> List[Tuple[str, str]]:
+        if requeued:
+            return requeued.popleft()
+        chunk = []
+        for item in source:
+            chunk.append(item)
+            if len(chunk) >= chunksize:
+                break
+        return chunk
+
+    def fail(item: Tuple[str, str], kind: str, message: str) -> None:
+        report.errors.append(LoadError(rel_id=item[1], path=item[0], kind=kind, message=message))
+
+    pool: List[_Worker] = [_Worker(ctx) for _ in range(workers)]
+    try:
+        while True:
+            for w in pool:
+                if not w.busy:
+                    chunk = next_chunk()
+                    if chunk:
+                        w.assign(chunk)
+            busy = [w for w in pool if w.busy]
+            if not busy:
+                break
+            ready = wait_conns([w.conn for w in busy], timeout=min(1.0, timeout))
+            now = time.perf_counter()
+            for w in busy:
+                lost = False
+                if w.conn in ready:
+                    try:
+                        while w.conn.poll():
+                            msg = w.conn.recv()
+                            if msg[0] == "start":
+                                w.current = w.items[0]
+                                w.started = time.perf_counter()
+                            elif msg[0] in ("ok", "error"):
+                                item = w.items.popleft()
+                                w.current = None
+                                observe("rag_stage_seconds", time.perf_counter() - w.started, stage="load")
+                                if msg[0] == "error":
+                                    fail(item, "error", msg[2])
+                                elif msg[2] and msg[2].strip():
+                                    report.loaded += 1
+                                    yield {"id": item[1], "text": msg[2]}
+                                else:
+                                    fail(item, "empty", "no text extracted")
+                    except (EOFError, OSError):
+                        lost = True
+                if lost or not w.proc.is_alive():
+                    if not w.items:
+                        victim = None
+                    else:
+                        victim = w.current or w.items[0]
+                        w.proc.join(timeout=0.5)
+                        fail(victim, "crash", f"worker exited (code {w.proc.exitcode})")
+                elif w.current is not None and now - w.started > timeout:
+                    victim = w.current
+                    fail(victim, "timeout", f"exceeded {timeout:g}s")
+                else:
+                    continue
+                # Replace the worker; requeue whatever it had not started yet
+                rest = [it for it in w.items if it != victim]
+                w.kill()
+                if rest:
+                    requeued.append(rest)
+                pool[pool.index(w)] = _Worker(ctx)
+    finally:
+        for w in pool:
+            try:
+                w.conn.send(None)
+            except OSError:
+                pass
+        for w in pool:
+            w.proc.join(timeout=1)
+            if w.proc.is_alive():
+                w.proc.kill()
+            w.conn.close()
+
+
+def iter_documents(
+    directory_path: str,
+    only: Optional[Iterable[str]] = None,
+    *,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    chunksize: Optional[int] = None,
+    report: Optional[LoadReport] = None,
+) -> Iterator[Dict[str, str]]:
+    """
+    Yield {"id", "text"} for supported documents under directory_path.
+    workers > 1 parses files in a process pool and yields in completion order;
+    otherwise files are parsed in this process, in walk order (no timeout).
+    Failures and empty files are recorded in `report`.
+    """
+    report = report if report is not None else LoadReport()
+    workers = LOAD_WORKERS if workers is None else workers
+    if workers < 0:
+        workers = os.cpu_count() or 1
+    wanted = set(only) if only is not None else None
+    paths = (
+        (abs_path, rel_id)
+        for abs_path, rel_id in _iter_paths(directory_path) or []
+        if wanted is None or rel_id in wanted
+    )
+    t0 = time.perf_counter()
+    try:
+        if workers > 1:
+            yield from _iter_parallel(
+                paths, workers, timeout or LOAD_TIMEOUT, max(1, chunksize or LOAD_CHUNKSIZE), report
+            )
+            return
+        for abs_path, rel_id in paths:
+            try:
+                with span("load"):
+                    text = _load_one(abs_path)
+            except Exception as e:
+                report.errors.append(LoadError(rel_id, abs_path, "error", f"{type(e).__name__}: {e}"))
+                continue
+            if text and text.strip():
+                report.loaded += 1
+                yield {"id": rel_id, "text": text}
+            else:
+                report.errors.append(LoadError(rel_id, abs_path, "empty", "no text extracted"))
+    finally:
+        report.seconds = time.perf_counter() - t0
+
+
+def load_documents(
+    directory_path: str,
+    only: Optional[Iterable[str]] = None,
+    *,
+    workers: Optional[int] = None,
+    report: Optional[LoadReport] = None,
+) -> List[Dict[str, str]]:
     """
     Load all supported documents under directory_path (recursively).
+    If `only` is given, restrict loading to those relative ids.
+    Per-file problems go to `report`; without one they are printed.
 
     Returns: [{"id": "<relative/path.ext>", "text": "..."}]
     """
-    docs: List[Dict[str, str]] = []
-    for abs_path, rel_id in _iter_paths(directory_path) or []:
-        try:
-            text = _load_one(abs_path)
-            if text and text.strip():
-                docs.append({"id": rel_id, "text": text})
-            else:
-                print(f"Warning: no text extracted from {abs_path}")
-        except Exception as e:
-            print(f"Error loading {abs_path}: {e}")
-    if not docs:
+    own_report = report is None
+    report = LoadReport() if own_report else report
+    docs = list(iter_documents(directory_path, only, workers=workers, report=report))
+    if own_report:
+        for e in report.errors:
+            print(f"Warning: {e.path}: {e.message}" if e.kind == "empty" else f"Error loading {e.path}: {e.message}")
+    if not docs and only is None:
         print(f"No supported documents found in {directory_path}.")
     return docs
@@ -0,0 +1,169 @@
+"""
+Ingest manifest for incremental reindexing.
+
+Remembers, per source file, what was indexed last time (mtime, size,
+content hash and the chunk ids it produced) so `build_index` only has to
+touch files that were added, changed or removed since the previous run.
+
+Stored as JSON under PERSIST_DIR, one manifest per collection:
+    {"version": 1,
+     "files": {"<rel_id>": {"root": "...", "mtime": ..., "size": ...,
+                            "sha256": "...", "chunk_ids": [...]}}}
+
+During an ingest, changes are appended to "<manifest>.journal" (one JSON op
+per line, fsynced per committed batch) and replayed on load, so an
+interrupted ingest resumes after the last committed batch. save() folds the
+journal back into the base file.
+"""
+
+from __future__ import annotations
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import PERSIST_DIR, COLLECTION_NAME
+from .loaders import _iter_paths
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(collection_name: Optional[str] = None) -> str:
+    return os.path.join(PERSIST_DIR, f"ingest_manifest_{collection_name or COLLECTION_NAME}.json")
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+@dataclass
+class FileEntry:
+    root: str
+    mtime: float
+    size: int
+    sha256: str
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ReindexPlan:
+    """What a reindex has to do, relative to the manifest."""
+    to_load: List[Tuple[str, str]] = field(default_factory=list)   # (abs_path, rel_id), added or changed
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # Fresh fingerprints (root, mtime, size, sha256) for every file in to_load / touched unchanged files
+    fingerprints: Dict[str, Tuple[str, float, int, str]] = field(default_factory=dict)
+
+    @property
+    def is_noop(self) -> bool:
+        return not self.to_load and not self.removed
+
+
+class IngestManifest:
+    def __init__(self, path: str, files: Optional[Dict[str, FileEntry]] = None):
+        self.path = path
+        self.files: Dict[str, FileEntry] = files or {}
+
+    @property
+    def journal_path(self) -> str:
+        return self.path + ".journal"
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "IngestManifest":
+        path = path or manifest_path()
+        manifest = cls(path)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    obj = json.load(f)
+                if obj.get("version") == MANIFEST_VERSION:
+                    manifest.files = {rel: FileEntry(**entry) for rel, entry in obj.get("files", {}).items()}
+            except (OSError, ValueError) as e:
+                print(f"Warning: unreadable ingest manifest {path} ({e}); doing a full reindex.")
+        manifest._replay_journal()
+        return manifest
+
+    def _replay_journal(self) -> None:
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    break  # torn last line from an interrupted write
+                if op["op"] == "record":
+                    self.files[op["rel_id"]] = FileEntry(**op["entry"])
+                elif op["op"] == "forget":
+                    self.files.pop(op["rel_id"], None)
+
+    def commit(self, records: Iterable[Tuple[str, FileEntry]] = (), forgets: Iterable[str] = ()) -> None:
+        """Apply and durably journal a batch of changes (cheap; no full rewrite)."""
+        lines = []
+        for rel_id, entry in records:
+            self.files[rel_id] = entry
+            lines.append(json.dumps({"op": "record", "rel_id": rel_id, "entry": asdict(entry)}))
+        for rel_id in forgets:
+            self.files.pop(rel_id, None)
+            lines.append(json.dumps({"op": "forget", "rel_id": rel_id}))
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "files": {rel: asdict(e) for rel, e in self.files.items()}},
+                f,
+            )
+        os.replace(tmp, self.path)  # atomic: readers never see a half-written manifest
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def plan(self, data_dir: str, full: bool = False) -> ReindexPlan:
+        """
+        Compare files under data_dir with the manifest.
+        mtime+size equal -> unchanged without reading the file; otherwise the
+        content hash decides (a touched-but-identical file is not re-embedded).
+        Only entries previously indexed from this same root can be "removed".
+        """
+        root = os.path.abspath(data_dir)
+        plan = ReindexPlan()
+        seen = set()
+        for abs_path, rel_id in _iter_paths(data_dir) or []:
+            seen.add(rel_id)
+            st = os.stat(abs_path)
+            prev = None if full else self.files.get(rel_id)
+            if prev and prev.root == root and prev.mtime == st.st_mtime and prev.size == st.st_size:
+                plan.unchanged.append(rel_id)
+                continue
+            sha = file_sha256(abs_path)
+            plan.fingerprints[rel_id] = (root, st.st_mtime, st.st_size, sha)
+            if prev and prev.sha256 == sha:
+                plan.unchanged.append(rel_id)
+            else:
+                plan.to_load.append((abs_path, rel_id))
+        plan.removed = [rel for rel, e in self.files.items() if e.root == root and rel not in seen]
+        return plan
+
+    def chunk_ids(self, rel_id: str) -> List[str]:
+        entry = self.files.get(rel_id)
+        return list(entry.chunk_ids) if entry else []
+
+    def entry(self, rel_id: str, fingerprint: Tuple[str, float, int, str], chunk_ids: Optional[List[str]] = None) -> FileEntry:
+        """Build an entry from a fresh fingerprint; chunk_ids=None keeps the previously indexed ids."""
+        root, mtime, size, sha = fingerprint
+        if chunk_ids is None:
+            chunk_ids = self.chunk_ids(rel_id)
+        return FileEntry(root=root, mtime=mtime, size=size, sha256=sha, chunk_ids=list(chunk_ids))
@@ -0,0 +1,251 @@
+"""
+In-process metrics and per-request tracing (no dependencies).
+
+- span(stage):   times a block into the rag_stage_seconds histogram; inside a
+                 trace() the spans also form a tree of nested stages
+- timed(stage):  span() as a function decorator
+- inc / observe: counters (retries, cache hits, tokens) and histograms
+- trace():       collects the spans of one request (also across worker
+                 threads started with in_context) for a per-request breakdown
+- render_prometheus(): everything in the Prometheus text format (GET /metrics)
+- stage_summary(): calls and seconds per stage (main.py --profile)
+
+With METRICS=false, span/inc/observe do nothing (a span only checks whether a
+trace is active), so the instrumentation costs next to nothing.
+"""
+
+from __future__ import annotations
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import METRICS
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# name -> (type, help, histogram buckets)
+_METRICS: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {
+    "rag_stage_seconds": ("histogram", "Seconds spent per pipeline stage (ingest and query)", LATENCY_BUCKETS),
+    "rag_request_seconds": ("histogram", "Seconds per API request", LATENCY_BUCKETS),
+    "rag_ttft_seconds": ("histogram", "Seconds from the chat request to the first answer token", LATENCY_BUCKETS),
+    "rag_prompt_tokens": ("histogram", "Prompt tokens per chat request", TOKEN_BUCKETS),
+    "rag_stage_errors_total": ("counter", "Stages that raised", None),
+    "rag_retries_total": ("counter", "OpenAI calls retried after a transient error", None),
+    "rag_rate_limit_wait_seconds_total": ("counter", "Seconds callers waited for the client-side rate limiter", None),
+    "rag_hedges_total": ("counter", "Hedged chat requests by the attempt that won (primary or hedge)", None),
+    "rag_cache_requests_total": ("counter", "Query cache lookups by cache and result (hit or miss)", None),
+    "rag_tokens_total": ("counter", "Chat model tokens in (prompt) and out (completion)", None),
+    "rag_embedded_texts_total": ("counter", "Texts embedded by the provider (cache misses)", None),
+    "rag_chunks_total": ("counter", "Chunks produced by the chunker", None),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        # histogram series -> [count per bucket (last: +Inf)..., sum, count]
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+    def inc(self, name: str, labels: Labels, value: float) -> None:
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        buckets = _METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            h[bisect_left(buckets, value)] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def snapshot(self) -> Tuple[Dict, Dict]:
+        with self._lock:
+            return dict(self.counters), {k: list(v) for k, v in self.histograms.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+_registry = _Registry()
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    if METRICS:
+        _registry.inc(name, _labels(labels), value)
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    if METRICS:
+        _registry.observe(name, _labels(labels), value)
+
+# --- spans and traces ---
+class _Node:
+    __slots__ = ("stage", "seconds", "error", "children")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.seconds = 0.0
+        self.error = False
+        self.children: List[_Node] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"stage": self.stage, "ms": round(self.seconds * 1000, 3)}
+        if self.error:
+            out["error"] = True
+        if self.children:
+            out["children"] = [c.to_dict() for c in self.children]
+        return out
+
+_current: contextvars.ContextVar[Optional[_Node]] = contextvars.ContextVar("rag_trace", default=None)
+
+class _Span:
+    __slots__ = ("stage", "node", "token", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "_Span":
+        parent = _current.get()
+        self.node = None
+        if parent is not None:
+            self.node = _Node(self.stage)
+            parent.children.append(self.node)
+            self.token = _current.set(self.node)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        seconds = time.perf_counter() - self.t0
+        if self.node is not None:
+            self.node.seconds, self.node.error = seconds, exc_type is not None
+            _current.reset(self.token)
+        if METRICS:
+            labels = (("stage", self.stage),)
+            _registry.observe("rag_stage_seconds", labels, seconds)
+            if exc_type is not None:
+                _registry.inc("rag_stage_errors_total", labels, 1.0)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(stage: str):
+    """Context manager timing one stage (a no-op with METRICS=false outside a trace)."""
+    if not METRICS and _current.get() is None:
+        return _NO_SPAN
+    return _Span(stage)
+
+def timed(stage: str) -> Callable:
+    """Decorator: run the function inside span(stage)."""
+    def wrap(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+class trace:
+    """
+    Record the spans run inside the block as a tree:
+        with trace("ask") as t: ...
+        t.to_dict() -> {"stage": "ask", "ms": ..., "children": [...]}
+    """
+    def __init__(self, stage: str = "request"):
+        self.root = _Node(stage)
+
+    def __enter__(self) -> "trace":
+        self._token = _current.set(self.root)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.root.seconds = time.perf_counter() - self._t0
+        self.root.error = exc_type is not None
+        _current.reset(self._token)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.root.to_dict()
+
+def in_context(fn: Callable, *args, **kwargs) -> Callable[[], Any]:
+    """fn bound to the caller's context, for executors: its spans join the caller's trace."""
+    return functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def format_trace(node: Dict[str, Any], indent: int = 0) -> List[str]:
+    """Indented lines of a trace dict (stage, milliseconds), children under their parent."""
+    mark = " !" if node.get("error") else ""
+    lines = [f"{'  ' * indent}{node['stage']:<{max(1, 28 - 2 * indent)}} {node['ms']:>10.2f} ms{mark}"]
+    for child in node.get("children", []):
+        lines.extend(format_trace(child, indent + 1))
+    return lines
+
+# --- export ---
+def stage_summary() -> Dict[str, Dict[str, float]]:
+    """{stage: {"calls", "seconds"}} from the stage histogram, slowest total first."""
+    _, histograms = _registry.snapshot()
+    out = {dict(labels)["stage"]: {"calls": int(h[-1]), "seconds": h[-2]}
+           for (name, labels), h in histograms.items() if name == "rag_stage_seconds"}
+    return dict(sorted(out.items(), key=lambda kv: kv[1]["seconds"], reverse=True))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _series(name: str, labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _number(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    counters, histograms = _registry.snapshot()
+    lines: List[str] = []
+    for name, (kind, help_text, buckets) in _METRICS.items():
+        if kind == "counter":
+            series = sorted((labels, v) for (n, labels), v in counters.items() if n == name)
+        else:
+            series = sorted((labels, h) for (n, labels), h in histograms.items() if n == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind == "counter":
+                lines.append(f"{_series(name, labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ["+Inf"], value[:-2]):
+                cumulative += n
+                le = bound if isinstance(bound, str) else _number(bound)
+                lines.append(f"{_series(name + '_bucket', labels, (('le', le),))} {cumulative}")
+            lines.append(f"{_series(name + '_sum', labels)} {_number(value[-2])}")
+            lines.append(f"{_series(name + '_count', labels)} {int(value[-1])}")
+    return "\n".join(lines) + "\n"
+
+def reset() -> None:
+    """Forget all recorded metrics (e.g. between benchmark phases)."""
+    _registry.clear()
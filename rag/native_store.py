@@ -0,0 +1,535 @@
+"""
+Native exact vector store (VECTOR_STORE=native), an alternative to Chroma.
+
+Layout of one store directory (PERSIST_DIR/native/<collection name>):
+- rows.sqlite         row number -> (id, document, metadata JSON) for live rows,
+                      plus the matrix file name, dimension and rows written
+- vectors.<n>.f32     append-only float32 matrix, one L2-normalised row per write
+
+Queries are exact cosine top-k: the matrix is memory-mapped read-only and
+scanned in blocks of NATIVE_STORE_BLOCK rows (one BLAS matmul per block for
+all queries of a batch, then argpartition), blocks spread over
+NATIVE_STORE_THREADS threads. Pages come from the OS page cache, so every
+process (e.g. API workers) shares one copy of the index instead of holding
+its own.
+
+With NATIVE_STORE_QUANT=int8 or binary, each row also gets a compact code
+(vectors.<n>.int8 + .scale: int8 scaled by the row's max |value|; or
+vectors.<n>.bits: sign bits, compared by XOR + popcount). Queries scan the
+codes, which is all that needs to stay resident, then rescore the best
+k * NATIVE_STORE_RESCORE candidates against the float32 rows, read through
+the memory map. stats() reports bytes per chunk and recall@k against exact
+search.
+
+Upserts append rows and drop the old row of a replaced id; deletes only drop
+table rows. Dead rows are skipped by a per-process live mask and reclaimed by
+compact(), which runs by itself once they outnumber live rows. Writers are
+serialized across processes by SQLite; readers reload their snapshot when
+another process has committed (PRAGMA data_version), and look rows up in a
+transaction that checks the snapshot's matrix file is still current, so row
+numbers a compaction has renumbered meanwhile are rescanned, never misread.
+"""
+
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import NATIVE_STORE_BLOCK, NATIVE_STORE_THREADS, NATIVE_STORE_QUANT, NATIVE_STORE_RESCORE
+from .storage import VectorStore
+
+_COMPACT_MIN_DEAD = 4096  # don't rewrite the matrix for a handful of dead rows
+_SQL_CHUNK = 500          # ids per IN (...) clause
+_CODE_BLOCK = 8192        # rows per block when scanning codes (each block is widened to float32)
+QUANTIZATIONS = ("none", "int8", "binary")
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _scan_pool() -> Optional[ThreadPoolExecutor]:
+    """Shared block-scan threads (None when NATIVE_STORE_THREADS resolves to 1)."""
+    global _pool
+    threads = NATIVE_STORE_THREADS or os.cpu_count() or 1
+    if threads <= 1:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="vector-scan")
+    return _pool
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat / np.where(norms > 0, norms, 1.0)
+
+
+def _code_files(quant: str, dim: int) -> List[Tuple[str, Any, Tuple[int, ...]]]:
+    """(extension, dtype, row shape) of each code file of a quantization."""
+    if quant == "int8":
+        return [(".int8", np.int8, (dim,)), (".scale", np.float32, ())]
+    if quant == "binary":
+        return [(".bits", np.uint64, ((dim + 63) // 64,))]
+    return []
+
+
+def _encode(quant: str, vectors: np.ndarray) -> List[np.ndarray]:
+    """Codes of normalised float32 rows, one array per _code_files entry."""
+    if quant == "int8":
+        scale = np.abs(vectors).max(axis=1) / 127.0
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        return [np.rint(vectors / scale[:, None]).astype(np.int8), scale]
+    if quant == "binary":
+        return [_pack_bits(vectors)]
+    return []
+
+
+# Set bits per byte, for numpy < 2.0 (no np.bitwise_count)
+_POPCOUNT8 = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+def _popcount_bytes(words: np.ndarray) -> np.ndarray:
+    """Set bits of uint64 words, per byte: (rows, 8 * words); sums like np.bitwise_count's."""
+    return _POPCOUNT8[np.ascontiguousarray(words).view(np.uint8)]
+
+_popcount = getattr(np, "bitwise_count", _popcount_bytes)
+
+def _pack_bits(vectors: np.ndarray) -> np.ndarray:
+    """Sign bits packed into uint64 words, (rows, ceil(dim / 64))."""
+    bits = np.packbits(vectors > 0, axis=1)
+    pad = (-bits.shape[1]) % 8
+    if pad:
+        bits = np.pad(bits, ((0, 0), (0, pad)))
+    return np.ascontiguousarray(bits).view(np.uint64)
+
+
+def _append(path: str, row_offset: int, array: np.ndarray) -> None:
+    """Write rows of `array` starting at row `row_offset`, cutting off anything after them."""
+    row_bytes = array.itemsize * int(np.prod(array.shape[1:], dtype=np.int64))
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+        f.seek(row_offset * row_bytes)
+        f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate((row_offset + len(array)) * row_bytes)  # drop leftovers of an aborted write
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    data_version: int
+    dim: int
+    file: str                       # matrix file; a compaction (renumbering rows) switches to a new one
+    rows: int                       # rows in the matrix (live and dead)
+    matrix: Optional[np.ndarray]    # read-only memmap (rows, dim), None when empty
+    live: np.ndarray                # bool per row
+    n_live: int
+    codes: Tuple[np.ndarray, ...] = ()  # read-only memmaps, per _code_files(quant)
+
+
+class NativeStore(VectorStore):
+    def __init__(self, name: str, directory: str, block_rows: int = NATIVE_STORE_BLOCK,
+                 quant: str = NATIVE_STORE_QUANT, rescore: int = NATIVE_STORE_RESCORE):
+        if quant not in QUANTIZATIONS:
+            raise ValueError(f"Unknown NATIVE_STORE_QUANT {quant!r} (expected one of {', '.join(QUANTIZATIONS)})")
+        self.name = name
+        self.directory = directory
+        self.block_rows = max(1, block_rows)
+        self.quant = quant
+        self.rescore = max(1, rescore)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "rows.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+        self._snap: Optional[_Snapshot] = None
+
+    # --- snapshot ---
+    def _meta(self, cur: sqlite3.Cursor) -> Tuple[int, str, int]:
+        """(dim, matrix file, rows written); dim 0 until the first upsert."""
+        meta = dict(cur.execute("SELECT key, value FROM meta").fetchall())
+        return int(meta.get("dim", 0)), meta.get("file", "vectors.0.f32"), int(meta.get("rows", 0))
+
+    def _map(self, file: str, rows: int, dim: int) -> Optional[np.ndarray]:
+        if rows == 0:
+            return None
+        return np.memmap(os.path.join(self.directory, file), dtype=np.float32, mode="r", shape=(rows, dim))
+
+    def _code_path(self, file: str, ext: str) -> str:
+        return os.path.join(self.directory, file[:-len(".f32")] + ext)
+
+    def _map_codes(self, file: str, rows: int, dim: int) -> Tuple[np.ndarray, ...]:
+        if rows == 0:
+            return ()
+        return tuple(
+            np.memmap(self._code_path(file, ext), dtype=dtype, mode="r", shape=(rows, *shape))
+            for ext, dtype, shape in _code_files(self.quant, dim)
+        )
+
+    def _write_codes(self, file: str, row_offset: int, vectors: np.ndarray) -> None:
+        for (ext, _, _), codes in zip(_code_files(self.quant, vectors.shape[1]), _encode(self.quant, vectors)):
+            _append(self._code_path(file, ext), row_offset, codes)
+
+    def _backfill_codes(self, file: str, rows: int, dim: int) -> None:
+        """Encode rows the code files lack (a store written with another quantization)."""
+        coded = rows
+        for ext, dtype, shape in _code_files(self.quant, dim):
+            path = self._code_path(file, ext)
+            row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+            coded = min(coded, os.path.getsize(path) // row_bytes if os.path.exists(path) else 0)
+        if coded >= rows:
+            return
+        matrix = self._map(file, rows, dim)
+        for start in range(coded, rows, self.block_rows):
+            self._write_codes(file, start, np.asarray(matrix[start:start + self.block_rows]))
+
+    def _data_version(self) -> int:
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _snapshot(self) -> _Snapshot:
+        """Current snapshot, reloaded when another process has committed since it was taken."""
+        with self._lock:
+            version = self._data_version()
+            snap = self._snap
+            if snap is not None and snap.data_version == version:
+                return snap
+            for attempt in range(3):
+                cur = self._db.cursor()
+                # Meta and row list from one transaction; IMMEDIATE also serializes code backfills
+                cur.execute("BEGIN IMMEDIATE" if self.quant != "none" else "BEGIN")
+                try:
+                    dim, file, rows = self._meta(cur)
+                    live_rows = np.fromiter((r for (r,) in cur.execute("SELECT row FROM rows")), dtype=np.int64)
+                    if self.quant != "none" and rows:
+                        self._backfill_codes(file, rows, dim)
+                finally:
+                    cur.execute("COMMIT")
+                try:
+                    matrix = self._map(file, rows, dim)
+                    codes = self._map_codes(file, rows, dim)
+                except FileNotFoundError:  # compacted (and the old file removed) since we read meta
+                    if attempt == 2:
+                        raise
+                    continue
+                live = np.zeros(rows, dtype=bool)
+                live[live_rows[live_rows < rows]] = True
+                self._snap = _Snapshot(version, dim, file, rows, matrix, live, int(live.sum()), codes)
+                return self._snap
+        raise AssertionError("unreachable")
+
+    # --- writes ---
+    def upsert(self, ids: Sequence[str], embeddings: Any, documents: Optional[Sequence[str]] = None,
+               metadatas: Optional[Sequence[Dict]] = None) -> None:
+        if not len(ids):
+            return
+        latest = {id_: i for i, id_ in enumerate(ids)}  # a repeated id: the last one wins
+        order = sorted(latest.values())
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32)[order]).astype(np.float32)
+        records = [
+            (ids[i], documents[i] if documents is not None else None,
+             json.dumps(metadatas[i]) if metadatas is not None and metadatas[i] is not None else None)
+            for i in order
+        ]
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                stale = self._data_version() != (self._snap.data_version if self._snap else -1)
+                dim, file, rows = self._meta(cur)
+                if dim == 0:
+                    dim = vectors.shape[1]
+                    cur.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                    [("dim", str(dim)), ("file", file)])
+                elif vectors.shape[1] != dim:
+                    raise ValueError(f"{self.name}: embedding dimension {vectors.shape[1]} != store dimension {dim}")
+                replaced = self._drop_ids(cur, [r[0] for r in records])
+                _append(os.path.join(self.directory, file), rows, vectors)
+                self._write_codes(file, rows, vectors)
+                cur.executemany(
+                    "INSERT INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(rows + j, *rec) for j, rec in enumerate(records)],
+                )
+                cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rows', ?)", (str(rows + len(vectors)),))
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            if stale or self._snap is None:
+                self._snap = None
+            else:
+                live = np.concatenate((self._snap.live, np.ones(len(vectors), dtype=bool)))
+                live[replaced] = False
+                self._set_snapshot(dim, file, live)
+        self._maybe_compact()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        if not len(ids):
+            return
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                stale = self._data_version() != (self._snap.data_version if self._snap else -1)
+                removed = self._drop_ids(cur, list(ids))
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            if stale or self._snap is None:
+                self._snap = None
+            elif removed:
+                live = self._snap.live.copy()
+                live[removed] = False
+                self._set_snapshot(self._snap.dim, None, live)
+        self._maybe_compact()
+
+    def _drop_ids(self, cur: sqlite3.Cursor, ids: List[str]) -> List[int]:
+        """Delete the rows of ids (inside a write transaction); returns their row numbers."""
+        removed: List[int] = []
+        for i in range(0, len(ids), _SQL_CHUNK):
+            part = ids[i:i + _SQL_CHUNK]
+            q = ",".join("?" * len(part))
+            removed.extend(r for (r,) in cur.execute(f"SELECT row FROM rows WHERE id IN ({q})", part))
+            cur.execute(f"DELETE FROM rows WHERE id IN ({q})", part)
+        return removed
+
+    def _set_snapshot(self, dim: int, file: Optional[str], live: np.ndarray) -> None:
+        """Snapshot after our own commit (which leaves data_version unchanged)."""
+        old = self._snap
+        if file is None and old is not None:
+            file, matrix, codes = old.file, old.matrix, old.codes
+        else:
+            file = file or ""
+            matrix, codes = self._map(file, len(live), dim), self._map_codes(file, len(live), dim)
+        self._snap = _Snapshot(old.data_version if old else self._data_version(), dim, file, len(live), matrix, live,
+                               int(live.sum()), codes)
+
+    def compact(self) -> int:
+        """Rewrite the matrix with live rows only (renumbering them); returns dead rows reclaimed."""
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                dim, file, rows = self._meta(cur)
+                live_rows = np.fromiter((r for (r,) in cur.execute("SELECT row FROM rows ORDER BY row")), dtype=np.int64)
+                if rows == 0 or len(live_rows) == rows:
+                    cur.execute("COMMIT")
+                    return 0
+                epoch = int(file.split(".")[1]) + 1
+                new_file = f"vectors.{epoch}.f32"
+                old = self._map(file, rows, dim)
+                for i in range(0, len(live_rows), self.block_rows):
+                    block = np.asarray(old[live_rows[i:i + self.block_rows]])
+                    _append(os.path.join(self.directory, new_file), i, block)
+                    self._write_codes(new_file, i, block)
+                # Ascending renumbering never collides: the i-th live row number is >= i
+                cur.executemany("UPDATE rows SET row=? WHERE row=?",
+                                [(i, int(r)) for i, r in enumerate(live_rows) if i != r])
+                cur.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                [("file", new_file), ("rows", str(len(live_rows)))])
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            # Processes still mapping the old files keep their pages until they reload
+            for path in [os.path.join(self.directory, file)] + [self._code_path(file, ext) for ext in (".int8", ".scale", ".bits")]:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._snap = None
+            return rows - len(live_rows)
+
+    def _maybe_compact(self) -> None:
+        snap = self._snap
+        if snap is not None and snap.rows - snap.n_live >= max(_COMPACT_MIN_DEAD, snap.n_live):
+            self.compact()
+
+    # --- reads ---
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def _fetch(self, snap: _Snapshot, selects: List[Tuple[str, Sequence]]) -> Optional[List[Tuple]]:
+        """
+        Rows of the selects, read in one transaction; None when the store was
+        compacted after `snap` was taken (its row numbers now name other rows).
+        """
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN")
+            try:
+                if self._meta(cur)[1] != snap.file:
+                    return None
+                found: List[Tuple] = []
+                for sql, params in selects:
+                    found += cur.execute(sql, params).fetchall()
+                return found
+            finally:
+                cur.execute("COMMIT")
+
+    def get(self, ids: Optional[Sequence[str]] = None, include: Sequence[str] = ("documents", "metadatas"),
+            limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        """Rows in insertion order (Chroma's get() result shape)."""
+        if ids is not None:
+            selects = [
+                (f"SELECT row, id, document, metadata FROM rows WHERE id IN ({','.join('?' * len(part))})", part)
+                for part in (list(ids[i:i + _SQL_CHUNK]) for i in range(0, len(ids), _SQL_CHUNK))
+            ]
+        else:
+            selects = [("SELECT row, id, document, metadata FROM rows ORDER BY row LIMIT ? OFFSET ?",
+                        (-1 if limit is None else limit, offset))]
+        for _ in range(3):
+            snap = self._snapshot()
+            found = self._fetch(snap, selects)
+            if found is not None:
+                break
+        else:
+            raise RuntimeError(f"{self.name}: compacted repeatedly during the read; retry")
+        if ids is not None:
+            found.sort(key=lambda r: r[0])
+            found = found[offset:offset + limit] if limit is not None else found[offset:]
+        found = [r for r in found if r[0] < snap.rows]  # appended after our snapshot
+        out: Dict[str, Any] = {"ids": [r[1] for r in found]}
+        if "documents" in include:
+            out["documents"] = [r[2] for r in found]
+        if "metadatas" in include:
+            out["metadatas"] = [json.loads(r[3]) if r[3] else None for r in found]
+        if "embeddings" in include:
+            rows = np.asarray([r[0] for r in found], dtype=np.int64)
+            out["embeddings"] = np.array(snap.matrix[rows]) if len(rows) else np.zeros((0, snap.dim), np.float32)
+        return out
+
+    def query(self, query_embeddings: Any, n_results: int = 10, include: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Cosine top-n_results per query (Chroma's query() result shape; distance = 1 - cosine)."""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries.reshape(1, -1) if queries.ndim == 1 else queries
+        for _ in range(3):  # rescan when a compaction renumbered the rows we found
+            snap = self._snapshot()
+            k = min(n_results, snap.n_live)
+            if k <= 0 or snap.matrix is None:
+                return {key: [[] for _ in range(len(queries))] for key in ("ids", "documents", "metadatas", "distances")}
+            if queries.shape[1] != snap.dim:
+                raise ValueError(f"{self.name}: query dimension {queries.shape[1]} != store dimension {snap.dim}")
+            rows, scores = self._search(snap, _normalize(queries).astype(np.float32), k)
+            wanted = [int(r) for r in np.unique(rows)]
+            records = self._fetch(snap, [
+                (f"SELECT row, id, document, metadata FROM rows WHERE row IN ({','.join('?' * len(part))})", part)
+                for part in (wanted[i:i + _SQL_CHUNK] for i in range(0, len(wanted), _SQL_CHUNK))
+            ])
+            if records is not None:
+                break
+        else:
+            raise RuntimeError(f"{self.name}: compacted repeatedly during the read; retry")
+        found: Dict[int, Tuple] = {
+            row: (id_, doc, json.loads(meta) if meta else None) for row, id_, doc, meta in records
+        }
+        out: Dict[str, List[List]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q_rows, q_scores in zip(rows.tolist(), scores.tolist()):
+            hits = [(found[r], s) for r, s in zip(q_rows, q_scores) if r in found]  # deleted meanwhile: skip
+            out["ids"].append([h[0][0] for h in hits])
+            out["documents"].append([h[0][1] for h in hits])
+            out["metadatas"].append([h[0][2] for h in hits])
+            out["distances"].append([1.0 - s for _, s in hits])
+        return out
+
+    def _search(self, snap: _Snapshot, queries: np.ndarray, k: int, quant: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, exact scores), each (n_queries, k), best first; quant overrides the store's ("none" = exact)."""
+        quant = quant or self.quant
+        if quant == "none":
+            return self._top_k(snap, k, self.block_rows, lambda s, e: queries @ snap.matrix[s:e].T)
+        if quant == "int8":
+            codes, scales = snap.codes
+            score = lambda s, e: (queries @ codes[s:e].astype(np.float32).T) * scales[s:e]
+        else:
+            (bits,) = snap.codes
+            qbits = _pack_bits(queries)
+            # Fewer differing sign bits = closer; negated so larger is better like the others
+            score = lambda s, e: -np.stack([
+                _popcount(bits[s:e] ^ qb).sum(axis=1, dtype=np.int32) for qb in qbits
+            ]).astype(np.float32)
+        candidates, _ = self._top_k(snap, min(k * self.rescore, snap.n_live), _CODE_BLOCK, score)
+        return self._rescore(snap, queries, candidates, k)
+
+    def _rescore(self, snap: _Snapshot, queries: np.ndarray, candidates: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k among each query's candidate rows, from the float32 vectors."""
+        n, c = candidates.shape
+        full = np.asarray(snap.matrix[candidates.ravel()]).reshape(n, c, snap.dim)
+        scores = np.einsum("ncd,nd->nc", full, queries)
+        if c > k:
+            idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            candidates, scores = np.take_along_axis(candidates, idx, axis=1), np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    def _top_k(self, snap: _Snapshot, k: int, block_rows: int, score: Callable[[int, int], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores), each (n_queries, k), best first, with score(start, end) per block of rows."""
+        def scan(start: int) -> Tuple[np.ndarray, np.ndarray]:
+            end = min(start + block_rows, snap.rows)
+            scores = score(start, end)
+            live = snap.live[start:end]
+            if not live.all():
+                scores[:, ~live] = -np.inf
+            if scores.shape[1] > k:
+                idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                return idx + start, np.take_along_axis(scores, idx, axis=1)
+            return np.broadcast_to(np.arange(start, end), scores.shape), scores
+
+        starts = range(0, snap.rows, block_rows)
+        pool = _scan_pool() if len(starts) > 1 else None
+        parts = list(pool.map(scan, starts)) if pool else [scan(s) for s in starts]
+        rows = np.concatenate([p[0] for p in parts], axis=1)
+        scores = np.concatenate([p[1] for p in parts], axis=1)
+        if scores.shape[1] > k:
+            idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            rows, scores = np.take_along_axis(rows, idx, axis=1), np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    def recall_at_k(self, k: int = 10, sample: int = 200, seed: int = 0) -> float:
+        """Mean overlap of this store's top-k with exact top-k, querying with `sample` stored vectors."""
+        snap = self._snapshot()
+        k = min(k, snap.n_live)
+        if k <= 0:
+            return 1.0
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(np.flatnonzero(snap.live), size=min(sample, snap.n_live), replace=False))
+        queries = np.asarray(snap.matrix[rows])
+        exact, _ = self._search(snap, queries, k, quant="none")
+        approx, _ = self._search(snap, queries, k)
+        return float(np.mean([len(set(a) & set(e)) / k for a, e in zip(approx.tolist(), exact.tolist())]))
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, bytes per chunk (what is scanned vs the float32 rows on disk), and recall@10 when quantized."""
+        snap = self._snapshot()
+        code_bytes = sum(
+            np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+            for _, dtype, shape in _code_files(self.quant, snap.dim)
+        )
+        out: Dict[str, Any] = {
+            "backend": "native",
+            "name": self.name,
+            "chunks": snap.n_live,
+            "dead_rows": snap.rows - snap.n_live,
+            "dim": snap.dim,
+            "quantization": self.quant,
+            "float32_bytes_per_chunk": snap.dim * 4,
+            "scanned_bytes_per_chunk": code_bytes or snap.dim * 4,
+            "disk_bytes": sum(os.path.getsize(os.path.join(self.directory, f)) for f in os.listdir(self.directory)),
+        }
+        if self.quant != "none":
+            out["rescore_candidates_per_result"] = self.rescore
+            out["recall@10"] = round(self.recall_at_k(10), 4)
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+            self._snap = None
@@ -1,40 +1,70 @@
-from typing import Optional
-from .config import DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP, N_RESULTS, USE_HYBRID
+import time
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
+from .config import (
+    N_RESULTS, USE_HYBRID, CHAT_MODEL,
+    RESULT_CACHE, RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+    ANSWER_CACHE, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, CACHE_DB,
+    SEMANTIC_CACHE, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MIN_OVERLAP, QUERY_THREADS,
+    BATCH_CONCURRENCY, DEBUG,
+)
 from .io_utils import format_sources
-from .loaders import load_documents
-from .chunking import make_chunk_records
-from .storage import get_collection, add_chunks, query_collection
+from .storage import get_collection, query_collection, query_collection_many
 from .retriever import dedupe_top_k
-from .generator import answer_from_context
-from .hybrid import build_bm25_index, bm25_search, rrf_fuse
+from .context import PackedContext, pack_context
+from .metrics import in_context, inc, span
+from .generator import answer_from_context, answer_from_context_async
+from .embeddings import QueryVector, embed_batched
+from .embed_providers import get_provider
+from .hybrid import bm25_search, bm25_search_many, rrf_fuse
+from .ingest import IngestProgress, run_ingest
+from .cache import LayeredCache
+from .semantic_cache import SemanticCache
+from .state import current_generation, bump_generation, index_lock
 
-def build_index(data_dir: Optional[str] = None, use_hybrid: Optional[bool] = None):
-    data_dir = data_dir or DATA_DIR
-    collection = get_collection()
+_retrieval_cache = LayeredCache("retrieval", RESULT_CACHE_SIZE, RESULT_CACHE_TTL, CACHE_DB or None) if RESULT_CACHE else None
+_answer_cache = LayeredCache("answer", ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, CACHE_DB or None) if ANSWER_CACHE else None
+_semantic_cache = (
+    SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MIN_OVERLAP) if SEMANTIC_CACHE else None
+)
 
-    docs = load_documents(data_dir)
-    if not docs:
-         print("No documents found to index.")
-         return collection
-    chunked = []
-    for d in docs:
-         chunked.extend(make_chunk_records(d["id"], d["text"], CHUNK_SIZE, CHUNK_OVERLAP))
-    add_chunks(chunked, collection)
-
-    # Allow CLI to override hybrid mode at runtime
-    hybrid = USE_HYBRID if use_hybrid is None else use_hybrid
-    if hybrid:
-        build_bm25_index(chunked)
+# Blocking retrieval work (Chroma query, BM25 scoring) for the asyncio path
+_executor = ThreadPoolExecutor(max_workers=QUERY_THREADS, thread_name_prefix="query")
 
-    print(f"Indexed {len(chunked)} chunks from {len(docs)} files.")
+def build_index(
+    data_dir: Optional[str] = None,
+    use_hybrid: Optional[bool] = None,
+    full: bool = False,
+    progress: Optional[Callable[[IngestProgress], None]] = None,
+):
+    """
+    Incrementally (re)index data_dir with the streaming ingest (see rag.ingest).
+    Unchanged files are skipped, changed files have their chunks upserted, and
+    chunks of removed files are deleted from Chroma and the BM25 sidecar.
+    full=True ignores the manifest and re-embeds everything.
+    Writes the active build in place under the index lock, so a reindex job
+    or build GC never copies, switches away from or deletes it meanwhile.
+    """
+    with index_lock():
+        collection = get_collection()
+        prog = run_ingest(data_dir, collection=collection, hybrid=use_hybrid, full=full, progress=progress)
+        if prog.files_total or prog.files_removed:
+            bump_generation()  # invalidates cached retrievals/answers in every process
+    print(prog.summary())
     return collection
 
-def ask(question: str, n_results: int = N_RESULTS, stream_handler=None):
-    collection = get_collection()
-    v_docs, v_metas = query_collection(collection, question, max(n_results, 20))
+def normalize_question(question: str) -> str:
+    return " ".join(question.casefold().split())
+
+def _cache_key(question: str, n_results: int, hybrid: bool, model: str) -> str:
+    return f"{current_generation()}|{model}|{n_results}|{int(hybrid)}|{normalize_question(question)}"
 
-    if USE_HYBRID:
-        b_docs, b_metas, _ = bm25_search(question, k=max(n_results, 20))
+def _fuse(v_docs, v_metas, b_docs, b_metas, n_results: int) -> Tuple[List[str], List[Dict]]:
+    """RRF-fuse vector and BM25 results, keeping the first n_results that resolve to a chunk."""
+    with span("fuse"):
         fused = rrf_fuse(v_metas, b_metas, k=60)
         key_to_v = { (m.get("source"), m.get("chunk")): (d, m) for d, m in zip(v_docs, v_metas) }
         key_to_b = { (m.get("source"), m.get("chunk")): (d, m) for d, m in zip(b_docs, b_metas) }
@@ -47,12 +77,399 @@ def ask(question: str, n_results: int = N_RESULTS, stream_handler=None):
                 docs.append(d); metas.append(m)
             if len(docs) == n_results:
                 break
-    else:
-        docs, metas = v_docs, v_metas
+    return docs, metas
+
+def _cached_retrieval(question: str, n_results: int, hybrid: bool):
+    """(cache key or None, cached (docs, metas) or None)"""
+    if not _retrieval_cache:
+        return None, None
+    key = _cache_key(question, n_results, hybrid, get_provider().name)
+    hit = _retrieval_cache.get(key)
+    inc("rag_cache_requests_total", cache="retrieval", result="miss" if hit is None else "hit")
+    return key, hit
+
+def retrieve(
+    question: str,
+    n_results: int = N_RESULTS,
+    use_hybrid: Optional[bool] = None,
+    query_vector: Optional[QueryVector] = None,
+) -> Tuple[List[str], List[Dict]]:
+    """
+    Top n_results (docs, metas) for question: vector search, fused with BM25 when hybrid.
+    Pass query_vector to share the question's embedding with other stages.
+    """
+    hybrid = USE_HYBRID if use_hybrid is None else use_hybrid
+    key, hit = _cached_retrieval(question, n_results, hybrid)
+    if hit is not None:
+        return hit[0], hit[1]
+
+    t0 = time.perf_counter()
+    with span("retrieve"):
+        qv = query_vector or QueryVector(question)
+        collection = get_collection()
+        v_docs, v_metas = query_collection(collection, question, max(n_results, 20), qv.get())
+        if hybrid:
+            b_docs, b_metas, _ = bm25_search(question, k=max(n_results, 20))
+            docs, metas = _fuse(v_docs, v_metas, b_docs, b_metas, n_results)
+        else:
+            docs, metas = v_docs, v_metas
+
+        docs, metas = dedupe_top_k(docs, metas, k=n_results)
+    if key and docs:
+        _retrieval_cache.set(key, [docs, metas], time.perf_counter() - t0)
+    return docs, metas
+
+async def retrieve_async(
+    question: str,
+    n_results: int = N_RESULTS,
+    use_hybrid: Optional[bool] = None,
+    query_vector: Optional[QueryVector] = None,
+) -> Tuple[List[str], List[Dict]]:
+    """retrieve() for the event loop: the vector query and BM25 run concurrently on worker threads."""
+    hybrid = USE_HYBRID if use_hybrid is None else use_hybrid
+    key, hit = _cached_retrieval(question, n_results, hybrid)
+    if hit is not None:
+        return hit[0], hit[1]
+
+    t0 = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    k = max(n_results, 20)
+    with span("retrieve"):
+        # BM25 needs no embedding: start it first so it overlaps an embedding API call.
+        # in_context: spans on the worker threads join this request's trace
+        bm25 = loop.run_in_executor(_executor, in_context(bm25_search, question, k)) if hybrid else None
+        qvec = await (query_vector or QueryVector(question)).get_async()
+        vector = loop.run_in_executor(_executor, in_context(query_collection, get_collection(), question, k, qvec))
+        if hybrid:
+            (v_docs, v_metas), (b_docs, b_metas, _) = await asyncio.gather(vector, bm25)
+            docs, metas = _fuse(v_docs, v_metas, b_docs, b_metas, n_results)
+        else:
+            docs, metas = await vector
+
+        docs, metas = dedupe_top_k(docs, metas, k=n_results)
+    if key and docs:
+        _retrieval_cache.set(key, [docs, metas], time.perf_counter() - t0)
+    return docs, metas
 
-    docs, metas = dedupe_top_k(docs, metas, k=n_results)
+def _cached_answer(question: str, n_results: int, hybrid: bool):
+    """(cache key or None, cached (answer, sources) or None)"""
+    if not _answer_cache:
+        return None, None
+    key = _cache_key(question, n_results, hybrid, CHAT_MODEL)
+    hit = _answer_cache.get(key)
+    inc("rag_cache_requests_total", cache="answer", result="miss" if hit is None else "hit")
+    return key, hit
+
+def _semantic_lookup(qvec, metas):
+    chunk_keys = frozenset((m.get("source"), m.get("chunk")) for m in metas)
+    generation = current_generation()
+    hit = _semantic_cache.lookup(qvec, chunk_keys, generation)
+    inc("rag_cache_requests_total", cache="semantic", result="miss" if hit is None else "hit")
+    return chunk_keys, generation, hit
+
+def _record(timings: Optional[Dict[str, float]], qv: QueryVector, retrieve_s: float, generate_s: float) -> None:
+    if timings is not None:
+        timings.update(embed=round(qv.seconds, 4), retrieve=round(retrieve_s, 4), generate=round(generate_s, 4))
+
+def _packed(docs: List[str], metas: List[Dict], context_stats: Optional[Dict[str, int]] = None) -> PackedContext:
+    with span("context"):
+        packed = pack_context(docs, metas)
+    if context_stats is not None:
+        context_stats.update(packed.stats())
+    if DEBUG:
+        print(f"[context] {packed.tokens} of {packed.retrieved_tokens} tokens "
+              f"({packed.merged} merged, {packed.duplicates} duplicates, {packed.over_budget} over budget)")
+    return packed
+
+def ask(
+    question: str,
+    n_results: int = N_RESULTS,
+    stream_handler=None,
+    use_hybrid: Optional[bool] = None,
+    query_vector: Optional[QueryVector] = None,
+    timings: Optional[Dict[str, float]] = None,
+    context_stats: Optional[Dict[str, int]] = None,
+):
+    """
+    Answer question from the index; returns (answer, sources string).
+    The question is embedded at most once (query_vector, if given, is used and
+    filled in). timings, if given, receives the seconds spent in embed /
+    retrieve (including embed) / generate; stages served from cache count 0.
+    context_stats, if given, receives the prompt context token counts
+    (PackedContext.stats) when an answer is generated.
+    """
+    hybrid = USE_HYBRID if use_hybrid is None else use_hybrid
+    qv = query_vector or QueryVector(question)
+    key, hit = _cached_answer(question, n_results, hybrid)
+    if hit is not None:
+        _record(timings, qv, 0.0, 0.0)
+        if stream_handler:
+            stream_handler(hit[0])
+        return hit[0], hit[1]
+
+    t0 = time.perf_counter()
+    docs, metas = retrieve(question, n_results, use_hybrid=hybrid, query_vector=qv)
+    t_gen = time.perf_counter()
     if not docs:
+        _record(timings, qv, t_gen - t0, 0.0)
         return "No relevant information found.", "Sources: (none)"
-    context = "\n\n---\n\n".join(docs)
-    answer = answer_from_context(question, context, stream_handler=stream_handler)
-    return answer, format_sources(metas)
+
+    if _semantic_cache:
+        # Paraphrase of a cached question with (mostly) the same context: skip generation
+        chunk_keys, generation, sem = _semantic_lookup(qv.get(), metas)
+        t_gen = time.perf_counter()
+        if sem:
+            _record(timings, qv, t_gen - t0, 0.0)
+            if stream_handler:
+                stream_handler(sem.answer)
+            return sem.answer, sem.sources
+
+    packed = _packed(docs, metas, context_stats)
+    answer = answer_from_context(question, packed.text, stream_handler=stream_handler)
+    sources = format_sources(packed.metas)
+    if key:
+        _answer_cache.set(key, [answer, sources], time.perf_counter() - t0)
+    if _semantic_cache:
+        _semantic_cache.store(qv.get(), chunk_keys, answer, sources, generation, time.perf_counter() - t_gen)
+    _record(timings, qv, t_gen - t0, time.perf_counter() - t_gen)
+    return answer, sources
+
+async def _emit(handler, text: str) -> None:
+    if handler:
+        pending = handler(text)
+        if inspect.isawaitable(pending):
+            await pending
+
+async def ask_async(
+    question: str,
+    n_results: int = N_RESULTS,
+    stream_handler=None,
+    use_hybrid: Optional[bool] = None,
+    sources_handler=None,
+    query_vector: Optional[QueryVector] = None,
+    timings: Optional[Dict[str, float]] = None,
+    context_stats: Optional[Dict[str, int]] = None,
+):
+    """
+    ask() on the event loop: AsyncOpenAI for embeddings/chat, retrieval offloaded to threads.
+    Handlers may be plain callables or return awaitables (awaited, for backpressure);
+    sources_handler receives the formatted sources of the answer (a semantic
+    cache hit's own sources) as soon as they are known, before any token.
+    """
+    hybrid = USE_HYBRID if use_hybrid is None else use_hybrid
+    qv = query_vector or QueryVector(question)
+    key, hit = _cached_answer(question, n_results, hybrid)
+    if hit is not None:
+        _record(timings, qv, 0.0, 0.0)
+        await _emit(sources_handler, hit[1])
+        await _emit(stream_handler, hit[0])
+        return hit[0], hit[1]
+
+    t0 = time.perf_counter()
+    docs, metas = await retrieve_async(question, n_results, use_hybrid=hybrid, query_vector=qv)
+    t_gen = time.perf_counter()
+    if not docs:
+        _record(timings, qv, t_gen - t0, 0.0)
+        return "No relevant information found.", "Sources: (none)"
+
+    if _semantic_cache:
+        chunk_keys, generation, sem = _semantic_lookup(await qv.get_async(), metas)
+        t_gen = time.perf_counter()
+        if sem:
+            _record(timings, qv, t_gen - t0, 0.0)
+            await _emit(sources_handler, sem.sources)
+            await _emit(stream_handler, sem.answer)
+            return sem.answer, sem.sources
+
+    packed = _packed(docs, metas, context_stats)
+    sources = format_sources(packed.metas)
+    await _emit(sources_handler, sources)
+    answer = await answer_from_context_async(question, packed.text, stream_handler=stream_handler)
+    if key:
+        _answer_cache.set(key, [answer, sources], time.perf_counter() - t0)
+    if _semantic_cache:
+        _semantic_cache.store(qv.vector, chunk_keys, answer, sources, generation, time.perf_counter() - t_gen)
+    _record(timings, qv, t_gen - t0, time.perf_counter() - t_gen)
+    return answer, sources
+
+# --- batches ---
+@dataclass
+class BatchAnswer:
+    index: int                    # position in the submitted batch
+    question: str
+    answer: str = ""
+    sources: str = ""
+    elapsed_seconds: float = 0.0  # generation time (0 for cache hits)
+    error: Optional[str] = None
+    context: Dict[str, int] = field(default_factory=dict)  # PackedContext.stats of generated answers
+
+@dataclass
+class _BatchItem:
+    out: BatchAnswer
+    key: Optional[str] = None     # answer cache key
+    docs: Optional[List[str]] = None
+    metas: Optional[List[Dict]] = None
+    qvec: Optional[List[float]] = None
+    chunk_keys: FrozenSet = frozenset()
+    generation: int = 0
+    cost: float = 0.0             # this question's share of the batch retrieval time
+    done: bool = False
+
+def _prepare_many(questions: List[str], n_results: int, hybrid: bool) -> List[_BatchItem]:
+    """
+    Everything up to generation, shared across the batch: answer cache lookups,
+    then for the rest one embedding pass (cache + batched API calls), one
+    multi-query vector search and one BM25 pass. Items answered from a cache
+    (or with nothing retrieved) come back done.
+    """
+    items = [_BatchItem(BatchAnswer(i, q)) for i, q in enumerate(questions)]
+    todo = []
+    for item in items:
+        item.key, hit = _cached_answer(item.out.question, n_results, hybrid)
+        if hit is not None:
+            item.out.answer, item.out.sources, item.done = hit[0], hit[1], True
+        else:
+            todo.append(item)
+    if not todo:
+        return items
+
+    t0 = time.perf_counter()
+    retrieved: Dict[int, Tuple[List[str], List[Dict]]] = {}
+    misses: List[_BatchItem] = []
+    for item in todo:
+        _, hit = _cached_retrieval(item.out.question, n_results, hybrid)
+        if hit is not None:
+            retrieved[item.out.index] = (hit[0], hit[1])
+        else:
+            misses.append(item)
+    # Query vectors: for the vector search, and for the semantic cache
+    need = todo if _semantic_cache else misses
+    if need:
+        for item, vec in zip(need, embed_batched([item.out.question for item in need])):
+            item.qvec = vec
+    if misses:
+        k = max(n_results, 20)
+        texts = [item.out.question for item in misses]
+        vector_hits = query_collection_many(get_collection(), [item.qvec for item in misses], k)
+        bm25_hits = bm25_search_many(texts, k) if hybrid else None
+        for j, item in enumerate(misses):
+            v_docs, v_metas = vector_hits[j]
+            if hybrid:
+                docs, metas = _fuse(v_docs, v_metas, bm25_hits[j][0], bm25_hits[j][1], n_results)
+            else:
+                docs, metas = v_docs, v_metas
+            retrieved[item.out.index] = dedupe_top_k(docs, metas, k=n_results)
+    cost = (time.perf_counter() - t0) / len(todo)
+
+    fresh = {item.out.index for item in misses}
+    for item in todo:
+        item.docs, item.metas = retrieved[item.out.index]
+        item.cost = cost
+        if item.out.index in fresh and _retrieval_cache and item.docs:
+            _retrieval_cache.set(_cache_key(item.out.question, n_results, hybrid, get_provider().name),
+                                 [item.docs, item.metas], cost)
+        if not item.docs:
+            item.out.answer, item.out.sources, item.done = "No relevant information found.", "Sources: (none)", True
+        elif _semantic_cache:
+            item.chunk_keys, item.generation, sem = _semantic_lookup(item.qvec, item.metas)
+            if sem:
+                item.out.answer, item.out.sources, item.done = sem.answer, sem.sources, True
+    return items
+
+def _finish(item: _BatchItem, packed: PackedContext, answer: str, seconds: float) -> BatchAnswer:
+    """Record a generated answer on the item and in the answer caches."""
+    item.out.answer, item.out.sources = answer, format_sources(packed.metas)
+    item.out.elapsed_seconds = round(seconds, 3)
+    if item.key:
+        _answer_cache.set(item.key, [item.out.answer, item.out.sources], item.cost + seconds)
+    if _semantic_cache:
+        _semantic_cache.store(item.qvec, item.chunk_keys, item.out.answer, item.out.sources, item.generation, seconds)
+    return item.out
+
+def ask_many(
+    questions: List[str],
+    n_results: int = N_RESULTS,
+    use_hybrid: Optional[bool] = None,
+    concurrency: Optional[int] = None,
+) -> Iterator[BatchAnswer]:
+    """
+    Answer a batch of questions, yielding each BatchAnswer as soon as it is ready
+    (cache hits first, then generated answers in completion order). Retrieval is
+    shared across the batch (see _prepare_many); up to `concurrency`
+    (BATCH_CONCURRENCY) answers are generated at once. A failed generation is
+    reported in its BatchAnswer.error and does not stop the batch.
+    """
+    hybrid = USE_HYBRID if use_hybrid is None else use_hybrid
+    items = _prepare_many(questions, n_results, hybrid)
+    for item in items:
+        if item.done:
+            yield item.out
+
+    def generate(item: _BatchItem) -> BatchAnswer:
+        t0 = time.perf_counter()
+        packed = _packed(item.docs, item.metas, item.out.context)
+        try:
+            answer = answer_from_context(item.out.question, packed.text)
+        except Exception as e:
+            item.out.error = str(e)
+            return item.out
+        return _finish(item, packed, answer, time.perf_counter() - t0)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency or BATCH_CONCURRENCY), thread_name_prefix="batch")
+    try:
+        futures = [pool.submit(generate, item) for item in items if not item.done]
+        for fut in as_completed(futures):
+            yield fut.result()
+    finally:
+        # A consumer that stops early must not leave the rest of the batch queued
+        pool.shutdown(wait=False, cancel_futures=True)
+
+async def ask_many_async(
+    questions: List[str],
+    n_results: int = N_RESULTS,
+    use_hybrid: Optional[bool] = None,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[BatchAnswer]:
+    """ask_many() on the event loop; closing the iterator cancels the answers still pending."""
+    hybrid = USE_HYBRID if use_hybrid is None else use_hybrid
+    loop = asyncio.get_running_loop()
+    items = await loop.run_in_executor(_executor, _prepare_many, questions, n_results, hybrid)
+    for item in items:
+        if item.done:
+            yield item.out
+
+    limit = asyncio.Semaphore(max(1, concurrency or BATCH_CONCURRENCY))
+
+    async def generate(item: _BatchItem) -> BatchAnswer:
+        async with limit:
+            t0 = time.perf_counter()
+            packed = _packed(item.docs, item.metas, item.out.context)
+            try:
+                answer = await answer_from_context_async(item.out.question, packed.text)
+            except Exception as e:
+                item.out.error = str(e)
+                return item.out
+        return _finish(item, packed, answer, time.perf_counter() - t0)
+
+    tasks = [asyncio.ensure_future(generate(item)) for item in items if not item.done]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def cache_stats() -> Dict[str, Dict]:
+    """Hit rate and saved seconds of the query caches (only the enabled ones)."""
+    out = {}
+    for cache in (_retrieval_cache, _answer_cache):
+        if cache:
+            out[cache.name] = cache.stats()
+    if _semantic_cache:
+        out["semantic"] = _semantic_cache.stats()
+    return out
+
+def clear_caches() -> None:
+    for cache in (_retrieval_cache, _answer_cache, _semantic_cache):
+        if cache:
+            cache.clear()
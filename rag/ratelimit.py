@@ -0,0 +1,242 @@
+"""
+Process-wide rate limiting and retries for OpenAI calls (embeddings and chat).
+
+Each model gets a RateLimiter with two token buckets, requests/min and
+tokens/min. Limits come from RATE_LIMIT_RPM / RATE_LIMIT_TPM or are learned
+from the server's x-ratelimit-limit-* headers, and the buckets refill
+continuously at RATE_LIMIT_HEADROOM of the limit. The server's
+x-ratelimit-remaining-* values cap what the buckets think is left, so
+quota used by other processes is accounted for too. A 429 pauses every
+caller of that model for its Retry-After. Before the first limit is
+known, only 429 pauses apply.
+
+limited_call(fn, model, tokens) reserves the estimated tokens, runs fn() (an
+SDK call made through `.with_raw_response`, so the headers can be read) and
+returns the parsed result. The reservation is corrected from the reported
+usage. Only transient errors are retried: timeouts, connection errors,
+408/409/429 and 5xx. The backoff is jittered, waits at least the server's
+Retry-After, and stops after MAX_RETRIES retries or RETRY_DEADLINE seconds.
+Clients are created with the SDK's own retries off (rag.clients), so
+this is the only retry layer.
+"""
+
+from __future__ import annotations
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+from .config import (
+    RATE_LIMIT, RATE_LIMIT_RPM, RATE_LIMIT_TPM, RATE_LIMIT_HEADROOM,
+    MAX_RETRIES, RETRY_DEADLINE, RETRY_BACKOFF, RETRY_MAX_BACKOFF,
+)
+from .metrics import inc
+
+_TRANSIENT_STATUS = (408, 409, 429)
+
+class _Bucket:
+    """Continuously refilled bucket of `limit` per minute; the level may go negative (reservations)."""
+    def __init__(self, limit: float = 0.0):
+        self.limit = 0.0
+        self.level = 0.0
+        self.stamp = time.monotonic()
+        if limit > 0:
+            self.set_limit(limit)
+
+    def set_limit(self, limit: float) -> None:
+        if limit == self.limit:
+            return
+        if self.limit == 0:
+            self.level = limit * RATE_LIMIT_HEADROOM
+        self.limit = limit
+
+    @property
+    def rate(self) -> float:
+        return self.limit * RATE_LIMIT_HEADROOM / 60.0
+
+    def refill(self, now: float) -> None:
+        if self.limit:
+            self.level = min(self.limit * RATE_LIMIT_HEADROOM, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, amount: float) -> float:
+        """Reserve amount; seconds until the reservation is covered."""
+        if not self.limit:
+            return 0.0
+        self.level -= min(amount, self.limit * RATE_LIMIT_HEADROOM)  # a huge request must not wait forever
+        return max(0.0, -self.level / self.rate)
+
+class RateLimiter:
+    """requests/min and tokens/min buckets of one model, fed by the response headers."""
+    def __init__(self, model: str, rpm: float = 0.0, tpm: float = 0.0):
+        self.model = model
+        self._lock = threading.Lock()
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.blocked_until = 0.0
+        self.fixed = (rpm > 0, tpm > 0)  # configured limits are not overridden by headers
+
+    def reserve(self, tokens: int) -> float:
+        """Take one request and `tokens` tokens; seconds the caller must wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.take(1), self.tokens.take(tokens), self.blocked_until - now)
+        if wait > 0:
+            inc("rag_rate_limit_wait_seconds_total", wait, model=self.model)
+        return wait
+
+    def acquire(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        """Give back (or charge) the difference between the estimate and the reported usage."""
+        if used is None:
+            return
+        with self._lock:
+            self.tokens.level += reserved - used
+
+    def update(self, headers) -> None:
+        """Learn limits and the remaining quota from x-ratelimit-* headers."""
+        if headers is None:
+            return
+        with self._lock:
+            for bucket, kind, fixed in ((self.requests, "requests", self.fixed[0]), (self.tokens, "tokens", self.fixed[1])):
+                limit = _number(headers.get(f"x-ratelimit-limit-{kind}"))
+                if limit and not fixed:
+                    bucket.refill(time.monotonic())
+                    bucket.set_limit(limit)
+                remaining = _number(headers.get(f"x-ratelimit-remaining-{kind}"))
+                if remaining is not None and bucket.limit:
+                    bucket.level = min(bucket.level, remaining * RATE_LIMIT_HEADROOM)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for `seconds` (after a 429)."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.requests.level = min(self.requests.level, 0.0)
+            self.tokens.level = min(self.tokens.level, 0.0)
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(model: str) -> RateLimiter:
+    """The process-wide limiter of a model."""
+    limiter = _limiters.get(model)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.setdefault(model, RateLimiter(model, RATE_LIMIT_RPM, RATE_LIMIT_TPM))
+    return limiter
+
+# --- retries ---
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+def retry_after(headers) -> Optional[float]:
+    """Seconds from retry-after-ms / Retry-After (seconds or an HTTP date)."""
+    if headers is None:
+        return None
+    ms = _number(headers.get("retry-after-ms"))
+    if ms is not None:
+        return ms / 1000.0
+    value = headers.get("retry-after")
+    seconds = _number(value)
+    if seconds is None and value:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return None if seconds is None else max(0.0, seconds)
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in _TRANSIENT_STATUS or exc.status_code >= 500
+    return False
+
+def _backoff(exc: BaseException, attempt: int, limiter: Optional[RateLimiter]) -> float:
+    """Seconds before the next attempt: full jitter, but never less than the server's Retry-After."""
+    delay = random.uniform(0, min(RETRY_MAX_BACKOFF, RETRY_BACKOFF * 2 ** attempt))
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    after = retry_after(headers)
+    if limiter is not None:
+        limiter.update(headers)
+        if getattr(exc, "status_code", None) == 429:
+            limiter.pause(after if after is not None else delay)
+    if after is not None:
+        delay = after + random.uniform(0, min(1.0, after * 0.1 + 0.05))
+    return delay
+
+def _retry_delay(exc: BaseException, attempt: int, deadline: float, limiter: Optional[RateLimiter]) -> float:
+    """Backoff before retry number attempt + 1; re-raises exc when it must not be retried."""
+    if not is_transient(exc) or attempt >= MAX_RETRIES:
+        raise exc
+    delay = _backoff(exc, attempt, limiter)
+    if time.monotonic() + delay > deadline:
+        raise exc
+    inc("rag_retries_total", error=str(getattr(exc, "status_code", None) or type(exc).__name__))
+    return delay
+
+def _usage_tokens(result) -> Optional[int]:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+def limited_call(fn: Callable[[], Any], model: str, tokens: int = 0):
+    """
+    Run fn() (returning an SDK raw response) under the model's rate limiter,
+    retrying transient errors; returns the parsed result.
+    """
+    limiter = get_limiter(model) if RATE_LIMIT else None
+    deadline = time.monotonic() + RETRY_DEADLINE
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            raw = fn()
+        except Exception as e:
+            time.sleep(_retry_delay(e, attempt, deadline, limiter))
+            attempt += 1
+            continue
+        result = raw.parse()
+        if limiter is not None:
+            limiter.update(raw.headers)
+            limiter.settle(tokens, _usage_tokens(result))
+        return result
+
+async def limited_call_async(fn: Callable[[], Awaitable[Any]], model: str, tokens: int = 0):
+    """Async twin of limited_call: fn() returns a fresh awaitable per attempt."""
+    limiter = get_limiter(model) if RATE_LIMIT else None
+    deadline = time.monotonic() + RETRY_DEADLINE
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire_async(tokens)
+        try:
+            raw = await fn()
+        except Exception as e:
+            await asyncio.sleep(_retry_delay(e, attempt, deadline, limiter))
+            attempt += 1
+            continue
+        result = raw.parse()
+        if limiter is not None:
+            limiter.update(raw.headers)
+            limiter.settle(tokens, _usage_tokens(result))
+        return result
@@ -0,0 +1,112 @@
+"""
+Semantic answer cache: reuse an answer for a paraphrased question.
+
+Query embeddings are kept as unit rows of a fixed-size float32 matrix, so a
+lookup is one matrix-vector product. A cached answer is returned only if
+  - the cosine similarity to its question is >= threshold, and
+  - the chunks retrieved now overlap the chunks it was generated from
+    (Jaccard >= min_overlap), i.e. the same context would be sent anyway.
+Bounded by maxsize (least recently used slot is reused) and emptied when the
+index generation changes.
+"""
+
+from __future__ import annotations
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class SemanticHit:
+    answer: str
+    sources: str
+    similarity: float
+    overlap: float
+
+
+class SemanticCache:
+    def __init__(self, maxsize: int, threshold: float, min_overlap: float):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self._lock = threading.Lock()
+        self._vecs: Optional[np.ndarray] = None          # (maxsize, dim), unit rows
+        self._valid = np.zeros(maxsize, dtype=bool)
+        self._last_used = np.zeros(maxsize, dtype=np.int64)
+        self._entries: Dict[int, Tuple[str, str, FrozenSet, float]] = {}  # slot -> (answer, sources, chunk keys, cost)
+        self._tick = 0
+        self._generation: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n > 0 else v
+
+    def _check_generation(self, generation: int) -> None:
+        if generation != self._generation:
+            self._valid[:] = False
+            self._entries.clear()
+            self._generation = generation
+
+    def lookup(self, vector: Sequence[float], chunk_keys: FrozenSet, generation: int) -> Optional[SemanticHit]:
+        q = self._unit(vector)
+        with self._lock:
+            self._check_generation(generation)
+            if self._vecs is None or not self._valid.any() or self._vecs.shape[1] != len(q):
+                self.misses += 1
+                return None
+            sims = self._vecs @ q
+            sims[~self._valid] = -np.inf
+            above = np.flatnonzero(sims >= self.threshold)
+            for slot in above[np.argsort(-sims[above])]:
+                answer, sources, keys, cost = self._entries[int(slot)]
+                union = len(keys | chunk_keys)
+                overlap = len(keys & chunk_keys) / union if union else 1.0
+                if overlap >= self.min_overlap:
+                    self._tick += 1
+                    self._last_used[slot] = self._tick
+                    self.hits += 1
+                    self.saved_seconds += cost
+                    return SemanticHit(answer, sources, float(sims[slot]), overlap)
+            self.misses += 1
+            return None
+
+    def store(self, vector: Sequence[float], chunk_keys: FrozenSet, answer: str, sources: str,
+              generation: int, cost: float = 0.0) -> None:
+        if self.maxsize <= 0:
+            return
+        q = self._unit(vector)
+        with self._lock:
+            self._check_generation(generation)
+            if self._vecs is None or self._vecs.shape[1] != len(q):
+                self._vecs = np.zeros((self.maxsize, len(q)), dtype=np.float32)
+                self._valid[:] = False
+                self._entries.clear()
+            free = np.flatnonzero(~self._valid)
+            slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+            self._vecs[slot] = q
+            self._valid[slot] = True
+            self._tick += 1
+            self._last_used[slot] = self._tick
+            self._entries[slot] = (answer, sources, chunk_keys, cost)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._valid[:] = False
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": int(self._valid.sum()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -0,0 +1,157 @@
+"""
+Index state shared by all processes (API workers, CLI), under PERSIST_DIR:
+
+- INDEX_GENERATION: a counter bumped by every build_index that changed the
+  index (and by every build switch). Query caches include it in their keys,
+  so nothing cached against an older index is ever served.
+- ACTIVE_INDEX.json: which index build queries read. Build 0 is the plain
+  COLLECTION_NAME collection and bm25/ sidecar; background reindex jobs
+  (rag.jobs) write build n to COLLECTION_NAME__b<n> and bm25__b<n>, then
+  switch to it atomically.
+- INDEX.lock: held (index_lock()) by whoever writes, creates, switches or
+  deletes builds, so build_index, reindex jobs and build GC in different
+  processes never overlap.
+
+Readers re-read a file only when its stat changes.
+"""
+
+from __future__ import annotations
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterator, Optional, Tuple
+
+try:
+    import fcntl  # POSIX
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore
+    import msvcrt
+
+from .config import PERSIST_DIR, COLLECTION_NAME
+
+GENERATION_FILE = os.path.join(PERSIST_DIR, "INDEX_GENERATION")
+ACTIVE_FILE = os.path.join(PERSIST_DIR, "ACTIVE_INDEX.json")
+BM25_DIR = os.path.join(PERSIST_DIR, "bm25")
+LOCK_FILE = os.path.join(PERSIST_DIR, "INDEX.lock")
+
+_lock = threading.Lock()
+_cached: Tuple[Optional[Tuple], int] = (None, 0)
+
+
+def _read(path: str) -> int:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def current_generation() -> int:
+    global _cached
+    try:
+        st = os.stat(GENERATION_FILE)
+        key: Optional[Tuple] = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        key = None
+    if key == _cached[0]:
+        return _cached[1]
+    gen = _read(GENERATION_FILE) if key else 0
+    _cached = (key, gen)
+    return gen
+
+
+def bump_generation() -> int:
+    with _lock:
+        gen = _read(GENERATION_FILE) + 1
+        os.makedirs(os.path.dirname(GENERATION_FILE) or ".", exist_ok=True)
+        tmp = f"{GENERATION_FILE}.tmp.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(gen))
+        os.replace(tmp, GENERATION_FILE)
+    return gen
+
+
+# --- index builds ---
+@dataclass(frozen=True)
+class IndexBuild:
+    build: int
+    collection: str   # Chroma collection name (its ingest manifest follows the name)
+    bm25_dir: str
+
+
+def index_build(build: int) -> IndexBuild:
+    """Names of build n (0 = the unsuffixed collection and sidecar)."""
+    if build == 0:
+        return IndexBuild(0, COLLECTION_NAME, BM25_DIR)
+    return IndexBuild(build, f"{COLLECTION_NAME}__b{build}", f"{BM25_DIR}__b{build}")
+
+
+def parse_build(collection_name: str) -> Optional[int]:
+    """Build number of one of our collections, None for foreign names."""
+    if collection_name == COLLECTION_NAME:
+        return 0
+    m = re.fullmatch(re.escape(COLLECTION_NAME) + r"__b(\d+)", collection_name)
+    return int(m.group(1)) if m else None
+
+
+_active: Tuple[Optional[Tuple], IndexBuild] = (None, index_build(0))
+
+
+def active_build() -> IndexBuild:
+    """The build queries should read (build 0 until a reindex job switches)."""
+    global _active
+    try:
+        st = os.stat(ACTIVE_FILE)
+        key: Optional[Tuple] = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        key = None
+    if key == _active[0]:
+        return _active[1]
+    build = index_build(0)
+    if key:
+        try:
+            with open(ACTIVE_FILE, "r", encoding="utf-8") as f:
+                build = IndexBuild(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Warning: unreadable {ACTIVE_FILE} ({e}); using build 0.")
+    _active = (key, build)
+    return build
+
+
+def activate_build(build: IndexBuild) -> None:
+    """Atomically make `build` the active one and invalidate query caches."""
+    with _lock:
+        os.makedirs(PERSIST_DIR, exist_ok=True)
+        tmp = f"{ACTIVE_FILE}.tmp.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(asdict(build), f)
+        os.replace(tmp, ACTIVE_FILE)
+    bump_generation()
+
+
+@contextmanager
+def index_lock() -> Iterator[None]:
+    """Exclusive lock across processes (and threads) for writing, creating, switching and deleting builds."""
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    with open(LOCK_FILE, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:  # pragma: no cover
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10 s
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:  # pragma: no cover
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
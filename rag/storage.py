@@ -1,30 +1,229 @@
 import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
 import chromadb
-from chromadb.utils import embedding_functions
-from typing import List, Dict, Tuple
-from .config import OPENAI_API_KEY, EMBED_MODEL, PERSIST_DIR, COLLECTION_NAME
-
-def get_collection():
-    os.makedirs(PERSIST_DIR, exist_ok=True)
-    ef = embedding_functions.OpenAIEmbeddingFunction(
-        api_key=OPENAI_API_KEY, model_name=EMBED_MODEL
-    )
-    client = chromadb.PersistentClient(path=PERSIST_DIR)
-    return client.get_or_create_collection(
-        name=COLLECTION_NAME, embedding_function=ef
-    )
-
-def add_chunks(chunks: List[Dict], collection) -> None:
+from typing import Any, Callable, List, Dict, Optional, Sequence, Tuple
+from .config import PERSIST_DIR, VECTOR_STORE
+from .embeddings import BatchStats, embed_query, iter_embedded_batches, report_batch
+from .embed_cache import get_embedding_cache
+from .state import active_build
+from .metrics import span
+
+NATIVE_DIR = os.path.join(PERSIST_DIR, "native")
+
+class VectorStore(ABC):
+    """
+    What the rest of the package needs from a vector store (the subset of a
+    Chroma collection's API we use, with Chroma's result shapes). Callers
+    always pass precomputed embeddings. Backends: ChromaStore, and NativeStore
+    (rag.native_store); VECTOR_STORE picks one.
+    """
+    name: str
+
+    @abstractmethod
+    def upsert(self, ids: Sequence[str], embeddings: Any, documents: Optional[Sequence[str]] = None,
+               metadatas: Optional[Sequence[Dict]] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, ids: Optional[Sequence[str]] = None, include: Sequence[str] = ("documents", "metadatas"),
+            limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        """{"ids": [...], plus "documents"/"metadatas"/"embeddings" as included}."""
+
+    @abstractmethod
+    def query(self, query_embeddings: Any, n_results: int = 10) -> Dict[str, Any]:
+        """{"ids"/"documents"/"metadatas"/"distances": one list per query, nearest first}."""
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": VECTOR_STORE, "name": self.name, "chunks": self.count()}
+
+class ChromaStore(VectorStore):
+    """A Chroma collection behind the VectorStore interface."""
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None) -> None:
+        self.collection.upsert(ids=list(ids), embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids) -> None:
+        self.collection.delete(ids=list(ids))
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=0) -> Dict[str, Any]:
+        return self.collection.get(ids=ids, include=list(include), limit=limit, offset=offset)
+
+    def query(self, query_embeddings, n_results: int = 10) -> Dict[str, Any]:
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+class _Handles:
+    """
+    Process-wide registry of Chroma clients and vector stores.
+    Handles are created once and shared across requests/threads; invalidate()
+    drops cached stores after a reindex swaps data underneath them.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients: Dict[str, Any] = {}
+        self._collections: Dict[Tuple[str, str], Any] = {}
+
+    def client(self, path: str):
+        with self._lock:
+            client = self._clients.get(path)
+            if client is None:
+                os.makedirs(path, exist_ok=True)
+                client = chromadb.PersistentClient(path=path)
+                self._clients[path] = client
+            return client
+
+    def collection(self, name: str, path: str):
+        key = (path, name)
+        coll = self._collections.get(key)  # lock-free fast path for the hot query route
+        if coll is not None:
+            return coll
+        with self._lock:
+            coll = self._collections.get(key)
+            if coll is None:
+                if VECTOR_STORE == "native":
+                    from .native_store import NativeStore  # builds on VectorStore above
+                    coll = NativeStore(name, os.path.join(path, "native", name))
+                else:
+                    # No embedding function: embeddings are always passed in, and any persisted
+                    # one (e.g. "openai" on indexes built by older versions) is left as it is
+                    coll = ChromaStore(self.client(path).get_or_create_collection(
+                        name=name, embedding_function=None
+                    ))
+                self._collections[key] = coll
+            return coll
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._collections.clear()
+            else:
+                for key in [k for k in self._collections if k[1] == name]:
+                    del self._collections[key]
+
+_handles = _Handles()
+
+def get_client(path: Optional[str] = None):
+    return _handles.client(path or PERSIST_DIR)
+
+def get_collection(name: Optional[str] = None) -> VectorStore:
+    """Shared, warm store handle (created on first use); default: the active index build's."""
+    return _handles.collection(name or active_build().collection, PERSIST_DIR)
+
+def invalidate_handles(name: Optional[str] = None) -> None:
+    """Forget cached collection handles (all, or one by name); the next get_collection() reopens."""
+    _handles.invalidate(name)
+
+def warmup() -> None:
+    """Open the client, collection and embedding cache up front (e.g. at API startup)."""
+    get_collection()
+    get_embedding_cache()
+
+def add_chunks(
+    chunks: List[Dict],
+    collection,
+    on_batch: Optional[Callable[[BatchStats], None]] = None,
+) -> None:
+    """
+    Embed chunks in token/item-bounded batches (several requests in flight) and
+    write each batch with its precomputed embeddings as soon as it completes.
+    Upsert so re-indexing a changed file replaces its chunks instead of failing on existing ids.
+    """
     if not chunks:
         return
-    ids = [c["id"] for c in chunks]
     docs = [c["text"] for c in chunks]
-    metas = [c["meta"] for c in chunks]
-    # Let Chroma handle embeddings via the collection's embedding_function
-    collection.add(ids=ids, documents=docs, metadatas=metas)
+    for idxs, vectors, stats in iter_embedded_batches(docs):
+        with span("upsert"):
+            collection.upsert(
+                ids=[chunks[i]["id"] for i in idxs],
+                documents=[docs[i] for i in idxs],
+                metadatas=[chunks[i]["meta"] for i in idxs],
+                embeddings=vectors,
+            )
+        report_batch(stats, on_batch)
 
-def query_collection(collection, question: str, n_results: int) -> Tuple[List[str], List[Dict]]:
-    res = collection.query(query_texts=[question], n_results=n_results)
+def delete_chunks(ids: List[str], collection) -> None:
+    if not ids:
+        return
+    collection.delete(ids=list(ids))
+
+def copy_collection(src, dst, batch_size: int = 1000, on_batch: Optional[Callable[[int], None]] = None) -> int:
+    """Copy every row of src into dst with its stored embedding (no API calls). Returns rows copied."""
+    offset = 0
+    while True:
+        res = src.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        ids = res.get("ids") or []
+        if not ids:
+            return offset
+        dst.upsert(ids=ids, documents=res["documents"], metadatas=res["metadatas"], embeddings=res["embeddings"])
+        offset += len(ids)
+        if on_batch:
+            on_batch(offset)
+
+def drop_collection(name: str) -> None:
+    """Delete a collection (if present) and forget its cached handle."""
+    invalidate_handles(name)
+    if VECTOR_STORE == "native":
+        shutil.rmtree(os.path.join(NATIVE_DIR, name), ignore_errors=True)
+        return
+    try:
+        get_client().delete_collection(name)
+    except Exception as e:  # Chroma raises different types for a missing collection across versions
+        if "does not exist" not in str(e).lower() and "not found" not in str(e).lower():
+            raise
+
+def list_collection_names() -> List[str]:
+    if VECTOR_STORE == "native":
+        return sorted(os.listdir(NATIVE_DIR)) if os.path.isdir(NATIVE_DIR) else []
+    return [getattr(c, "name", c) for c in get_client().list_collections()]
+
+def get_all_chunks(collection, batch_size: int = 1000) -> List[Dict]:
+    """Read back every stored chunk as {"id", "text", "meta"} (no embeddings)."""
+    out: List[Dict] = []
+    offset = 0
+    while True:
+        res = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        ids = res.get("ids") or []
+        if not ids:
+            break
+        for i, d, m in zip(ids, res.get("documents") or [], res.get("metadatas") or []):
+            out.append({"id": i, "text": d, "meta": m})
+        offset += len(ids)
+    return out
+
+def query_collection(
+    collection, question: str, n_results: int, query_embedding: Optional[List[float]] = None
+) -> Tuple[List[str], List[Dict]]:
+    # Embed through the cache rather than the collection's embedding function
+    if query_embedding is None:
+        query_embedding = embed_query(question)
+    with span("vector_query"):
+        res = collection.query(query_embeddings=[query_embedding], n_results=n_results)
     docs = res.get("documents", [[]])[0]
     metas = res.get("metadatas", [[]])[0]
     return docs, metas
+
+def query_collection_many(
+    collection, query_embeddings: List[List[float]], n_results: int, batch_size: int = 256
+) -> List[Tuple[List[str], List[Dict]]]:
+    """(docs, metas) per query embedding, from one multi-query collection.query per batch_size queries."""
+    out: List[Tuple[List[str], List[Dict]]] = []
+    for i in range(0, len(query_embeddings), batch_size):
+        with span("vector_query_many"):
+            res = collection.query(query_embeddings=query_embeddings[i:i + batch_size], n_results=n_results)
+        out.extend(zip(res.get("documents") or [], res.get("metadatas") or []))
+    return out